@@ -1,18 +1,57 @@
+import asyncio
+import contextlib
+import json
+import time
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, AsyncIterator, Tuple
 from pydantic import BaseModel
 from app.core.llm import LLMProvider, LLMSettings
-from app.core.logger import logger
+from app.core.logger import Payload, logger, sample_body
 from app.core.callbacks import UsageTrackingHandler
+from app.core.metrics import COALESCED, track_request
+from app.core.coalesce import COALESCE_ENABLED, coalesce_key, single_flight
+from app.core.deadlines import AgentTimeout, resolve_timeout
+from app.core.fallback import run_with_fallback, stream_with_fallback
+from app.core.executor import cpu_executor
+from app.core.usage import usage_ledger
+from app.core.rate_limit import estimate_tokens, provider_scheduler
+from app.core.cache import (
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_MAX_TEMPERATURE,
+    make_cache_key,
+    response_cache,
+)
 from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.prompts import PromptTemplate
+
+# Key under which `prepare` stores the built prompt in the prepared inputs
+PREPARED_PROMPT = "_prompt"
 
 class AgentMetadata(BaseModel):
     name: str
     description: str
     category: str
     inputs_schema: Dict[str, Any]
+    # Documentation page under agents/ this agent implements (e.g. "2.md")
+    doc: Optional[str] = None
 
 class BaseAgent(ABC):
+    # Registry id (e.g. "ledger-agent"), used for cache keys and telemetry
+    agent_id: str = ""
+    # Static instructions (role, rules, output format), sent as the system message ahead
+    # of the user's input. Keeping them byte-identical across requests lets providers
+    # reuse the cached prefix (OpenAI prompt caching, Gemini implicit caching).
+    system_prompt: Optional[str] = None
+    # Template for the per-request human message, compiled once when the agent class is defined
+    prompt: Optional[PromptTemplate] = None
+    # Where `preprocess`, `build_prompt` and `postprocess` run: "inline", "thread" or
+    # "process" (GIL-bound work such as pandas); None uses AGENT_CPU_EXECUTOR
+    cpu_stage_executor: Optional[str] = None
+    # Default deadline in seconds for a run of this agent; None defers to the model's
+    # deadline or AGENT_TIMEOUT (see app.core.deadlines)
+    timeout: Optional[float] = None
+
     @property
     @abstractmethod
     def metadata(self) -> AgentMetadata:
@@ -25,42 +64,454 @@ class BaseAgent(ABC):
         """
         pass
 
+    async def stream_run(self, inputs: Dict[str, Any], llm_settings: LLMSettings, callbacks: Optional[List[BaseCallbackHandler]] = None) -> AsyncIterator[str]:
+        """
+        Streaming counterpart of `run`: yields output text chunks as the model produces them.
+        The default streams the model's answer to `build_prompt`; agents that decorate the
+        answer (e.g. LedgerAgent) override this.
+        """
+        formatted_prompt = self.prompt_for(inputs)
+        if formatted_prompt is None:
+            # Agent has no single prompt; fall back to the blocking path
+            yield await self.run(inputs, llm_settings, callbacks=callbacks)
+            return
+
+        llm = self.get_llm(llm_settings, callbacks=callbacks)
+        async for chunk in llm.astream(self.to_messages(self.system_prompt, formatted_prompt)):
+            if chunk.content:
+                yield chunk.content
+
+    def build_prompt(self, inputs: Dict[str, Any]) -> Optional[str]:
+        """
+        Return the formatted human message for `inputs` (the dynamic part of the prompt;
+        `system_prompt` is the static part). Agents that return None are never cached.
+        """
+        return None
+
+    @staticmethod
+    def to_messages(system_prompt: Optional[str], prompt: str) -> List[BaseMessage]:
+        """
+        Chat messages in a stable order: the static system prefix first, then the user payload.
+        """
+        if not system_prompt:
+            return [HumanMessage(content=prompt)]
+        return [SystemMessage(content=system_prompt), HumanMessage(content=prompt)]
+
+    def messages_for(self, inputs: Dict[str, Any]) -> List[BaseMessage]:
+        """
+        The messages for a single-call run on `inputs`.
+        """
+        return self.to_messages(self.system_prompt, self.prompt_for(inputs))
+
+    def estimate_tokens(self, prompt: Optional[str]) -> int:
+        """
+        Token estimate for budgeting a call with `prompt`, system prefix included.
+        """
+        if prompt is None:
+            return estimate_tokens(None)
+        return estimate_tokens((self.system_prompt or "") + prompt)
+
+    def preprocess(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        CPU-heavy preparation (parsing, reconciling, splitting) done before the prompt is
+        built, on the agent's executor. Returns the inputs `build_prompt`, `run` and
+        `stream_run` receive, so they can reuse its results instead of recomputing them.
+        """
+        return inputs
+
+    def postprocess(self, inputs: Dict[str, Any], output: str) -> str:
+        """
+        CPU-heavy finishing of a run's output, on the agent's executor. Streamed output is
+        sent as it is produced and does not pass through this stage.
+        """
+        return output
+
+    def uncached_suffix(self, inputs: Dict[str, Any]) -> str:
+        """
+        Trailing part of the output that is derived from `inputs` but not from the prompt
+        (e.g. data echoed back verbatim). The response cache key only covers the prompt,
+        so this part is left out of the cached entry and appended again on a hit.
+        The output of `run`/`stream_run` must end with it.
+        """
+        return ""
+
+    def session_artifacts(self, inputs: Dict[str, Any], output: str) -> Tuple[Dict[str, str], str]:
+        """
+        Split a first session turn into (artifacts, answer). Artifacts are the material a
+        follow-up may need but should not re-send every turn (app.core.sessions stores the
+        large ones once and refers to them by name); the answer is kept in the history.
+        By default every input is an artifact and the whole output is the answer.
+        """
+        artifacts = {
+            name: value if isinstance(value, str) else json.dumps(value, default=str)
+            for name, value in inputs.items()
+            if not name.startswith("_") and value is not None
+        }
+        return artifacts, output
+
+    def _prepare(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        prepared = dict(self.preprocess(inputs))
+        prepared[PREPARED_PROMPT] = self.build_prompt(prepared)
+        return prepared
+
+    async def prepare(self, inputs: Dict[str, Any]) -> Tuple[Dict[str, Any], Optional[str]]:
+        """
+        `preprocess` then `build_prompt`, in one hop to the agent's executor.
+        Returns (prepared inputs, prompt); the prompt is also kept in the prepared
+        inputs for `prompt_for`.
+        """
+        prepared = await cpu_executor.run(self.cpu_stage_executor, self._prepare, inputs, agent=self.agent_id, stage="prepare")
+        return prepared, prepared[PREPARED_PROMPT]
+
+    def prompt_for(self, inputs: Dict[str, Any]) -> Optional[str]:
+        """
+        The prompt `prepare` built for these inputs, or a freshly built one.
+        `run`/`stream_run` use this so large prompts are not formatted again on the event loop.
+        """
+        if PREPARED_PROMPT in inputs:
+            return inputs[PREPARED_PROMPT]
+        return self.build_prompt(inputs)
+
+    def schedules_calls(self, inputs: Dict[str, Any]) -> bool:
+        """
+        True when `run`/`stream_run` route their own LLM calls through the provider
+        scheduler for these inputs (e.g. several calls per run), so the wrappers
+        must not hold a provider slot around them.
+        """
+        return False
+
     def get_llm(self, settings: LLMSettings, callbacks: Optional[List[BaseCallbackHandler]] = None):
         return LLMProvider.get_llm(settings, callbacks=callbacks)
 
-    async def execute(self, inputs: Dict[str, Any], llm_settings: LLMSettings) -> Dict[str, Any]:
+    def cache_key(self, prompt: Optional[str], llm_settings: LLMSettings) -> Optional[str]:
+        """
+        Response cache key for a deterministic run, or None if the run must not be cached.
+        """
+        if not RESPONSE_CACHE_ENABLED or llm_settings.temperature > RESPONSE_CACHE_MAX_TEMPERATURE:
+            return None
+        if prompt is None:
+            return None
+        if self.system_prompt:
+            prompt = f"{self.system_prompt}\x1e{prompt}"
+        name = self.agent_id or self.metadata.name
+        if type(self).uncached_suffix is not BaseAgent.uncached_suffix:
+            # Entries hold the output without the suffix; a separate key space keeps whole
+            # outputs cached before the agent had a suffix from being extended twice
+            name = f"{name}/without-suffix"
+        return make_cache_key(
+            name,
+            prompt,
+            llm_settings.provider,
+            llm_settings.model_name,
+            llm_settings.temperature,
+        )
+
+    def deadline(self, llm_settings: LLMSettings, requested: Optional[float] = None) -> float:
         """
-        Wrapper around run to handle common logic like logging, error handling, and usage tracking.
+        Seconds a run with `llm_settings` may take; `requested` is the caller's override.
+        """
+        return resolve_timeout(self.agent_id, self.timeout, llm_settings.model_name, requested)
+
+    @staticmethod
+    def _usage_stats(usage_handler: UsageTrackingHandler) -> Dict[str, Any]:
+        stats = {
+            "total_tokens": usage_handler.total_tokens,
+            "prompt_tokens": usage_handler.prompt_tokens,
+            "completion_tokens": usage_handler.completion_tokens,
+            "cached_tokens": usage_handler.cached_tokens,
+            "successful_requests": usage_handler.successful_requests
+        }
+        if usage_handler.estimated:
+            stats["estimated"] = True
+        return stats
+
+    async def execute(
+        self,
+        inputs: Dict[str, Any],
+        llm_settings: LLMSettings,
+        bypass_cache: bool = False,
+        refresh_cache: bool = False,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """
+        Wrapper around run to handle common logic like logging, error handling, usage tracking, caching and metrics.
+
+        `bypass_cache` skips the response cache entirely; `refresh_cache` ignores a
+        cached entry but stores the fresh result. Identical concurrent calls share
+        one execution; the extra callers get `"cache": "coalesced"`. Raises
+        AgentTimeout when the run outlives its deadline (`timeout` overrides it);
+        cancelling the call cancels the LLM request underneath.
         """
-        logger.info(f"Starting agent execution: {self.metadata.name}")
-        logger.debug(f"Inputs: {inputs}")
-        logger.debug(f"LLM Settings: {llm_settings.dict(exclude={'api_key'})}")
+        started = time.perf_counter()
+        deadline = self.deadline(llm_settings, timeout)
+        with track_request(self.agent_id, llm_settings.provider, llm_settings.model_name, "run") as tracked:
+            try:
+                result = await asyncio.wait_for(self._execute_once(inputs, llm_settings, bypass_cache, refresh_cache), deadline)
+            except asyncio.TimeoutError:
+                logger.warning(f"Agent execution timed out after {deadline:g}s", extra={"agent_id": self.agent_id})
+                raise AgentTimeout(self.agent_id, deadline) from None
+            tracked["cache"] = result["cache"]
+        served = result["served_by"]
+        usage_ledger.record(
+            self.agent_id, served["provider"], served["model"], result["usage"],
+            "run", result["cache"], (time.perf_counter() - started) * 1000,
+        )
+        return result
 
-        # Initialize Usage Tracking
-        usage_handler = UsageTrackingHandler()
+    async def _execute_once(
+        self,
+        inputs: Dict[str, Any],
+        llm_settings: LLMSettings,
+        bypass_cache: bool,
+        refresh_cache: bool,
+    ) -> Dict[str, Any]:
+        if not COALESCE_ENABLED:
+            return await self._execute(inputs, llm_settings, bypass_cache, refresh_cache)
+        key = coalesce_key(
+            self.agent_id or self.metadata.name, inputs, llm_settings,
+            bypass_cache=bypass_cache, refresh_cache=refresh_cache,
+        )
+        # A caller that times out or disconnects only leaves the shared call; it is
+        # cancelled once every caller has left
+        result, shared = await single_flight.do(
+            key, lambda: self._execute(inputs, llm_settings, bypass_cache, refresh_cache),
+        )
+        # Every caller gets its own dicts; endpoints add fields to them
+        result = dict(result, usage=dict(result["usage"]))
+        if shared:
+            result["cache"] = "coalesced"
+            COALESCED.inc(self.agent_id)
+        return result
+
+    @staticmethod
+    def _served_by(settings: LLMSettings) -> Dict[str, str]:
+        return {"provider": settings.provider, "model": settings.model_name}
+
+    async def _attempt(
+        self,
+        inputs: Dict[str, Any],
+        prompt: Optional[str],
+        settings: LLMSettings,
+    ) -> Tuple[str, float, UsageTrackingHandler]:
+        """
+        One run on one model. Returns (output, seconds queued, usage handler).
+        """
+        usage_handler = UsageTrackingHandler(settings.provider, settings.model_name)
         callbacks = [usage_handler]
+        if self.schedules_calls(inputs):
+            return await self.run(inputs, settings, callbacks=callbacks), 0.0, usage_handler
+        # Provider budget, fair queueing and 429/5xx retries
+        output, queue_wait = await provider_scheduler.run(
+            settings.provider,
+            settings.model_name,
+            lambda: self.run(inputs, settings, callbacks=callbacks),
+            estimated_tokens=self.estimate_tokens(prompt),
+            actual_tokens=lambda: usage_handler.total_tokens,
+        )
+        return output, queue_wait, usage_handler
+
+    async def _stream_attempt(
+        self,
+        inputs: Dict[str, Any],
+        prompt: Optional[str],
+        settings: LLMSettings,
+        usage_handler: UsageTrackingHandler,
+        state: Dict[str, float],
+    ) -> AsyncIterator[str]:
+        """
+        One streamed run on one model; the seconds spent queueing are stored in `state["waited"]`.
+        """
+        # Streams hold one budgeted slot and are not retried once tokens have been sent
+        if self.schedules_calls(inputs):
+            slot_context = contextlib.nullcontext({"waited": 0.0, "actual_tokens": None})
+        else:
+            slot_context = provider_scheduler.slot(settings.provider, settings.model_name, self.estimate_tokens(prompt))
+        async with slot_context as slot:
+            state["waited"] = slot["waited"]
+            async for text in self.stream_run(inputs, settings, callbacks=[usage_handler]):
+                yield text
+            slot["actual_tokens"] = usage_handler.total_tokens
+
+    async def _execute(
+        self,
+        inputs: Dict[str, Any],
+        llm_settings: LLMSettings,
+        bypass_cache: bool,
+        refresh_cache: bool,
+    ) -> Dict[str, Any]:
+        logger.info(f"Starting agent execution: {self.metadata.name}", extra={"agent_id": self.agent_id})
+        # Bodies are logged for a sample of requests only, truncated and formatted off the event loop
+        log_body = sample_body()
+        if log_body:
+            logger.debug("Inputs: %s", Payload(inputs), extra={"agent_id": self.agent_id})
+            logger.debug("LLM Settings: %s", llm_settings.model_dump(exclude={"api_key"}), extra={"agent_id": self.agent_id})
+
+        inputs, prompt = await self.prepare(inputs)
+        cache_key = None if bypass_cache else self.cache_key(prompt, llm_settings)
+        if cache_key and not refresh_cache:
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                logger.info("Agent execution served from response cache")
+                return {
+                    "output": cached["output"] + self.uncached_suffix(inputs),
+                    # The memory tier hands out the stored dict itself; callers must not mutate it
+                    "usage": dict(cached["usage"]),
+                    "status": "success",
+                    "cache": "hit",
+                    "served_by": self._served_by(llm_settings),
+                    "attempts": 0,
+                }
 
         try:
-            output = await self.run(inputs, llm_settings, callbacks=callbacks)
+            # Falls back to (or hedges with) the next model in the chain when this one fails or stalls
+            (output, queue_wait, usage_handler), served, attempts = await run_with_fallback(
+                llm_settings, lambda settings: self._attempt(inputs, prompt, settings),
+            )
+            if type(self).postprocess is not BaseAgent.postprocess:
+                output = await cpu_executor.run(
+                    self.cpu_stage_executor, self.postprocess, inputs, output, agent=self.agent_id, stage="postprocess",
+                )
             
             logger.info("Agent execution completed successfully")
-            logger.debug(f"Output: {output}")
+            if log_body:
+                logger.debug("Output: %s", Payload(output), extra={"agent_id": self.agent_id})
             
             # Collect Usage Stats
-            usage_stats = {
-                "total_tokens": usage_handler.total_tokens,
-                "prompt_tokens": usage_handler.prompt_tokens,
-                "completion_tokens": usage_handler.completion_tokens,
-                "successful_requests": usage_handler.successful_requests
-            }
+            usage_stats = self._usage_stats(usage_handler)
+            usage_stats["queue_wait_ms"] = round(queue_wait * 1000, 2)
             logger.info(f"Usage Stats: {usage_stats}")
 
+            # The cache key names the requested model, so fallback answers are not stored under it
+            if cache_key and served is llm_settings:
+                await self._cache_output(cache_key, inputs, output, usage_stats)
+
             return {
                 "output": output,
                 "usage": usage_stats,
-                "status": "success"
+                "status": "success",
+                "cache": "miss" if cache_key else "bypass",
+                "served_by": self._served_by(served),
+                "attempts": attempts,
             }
 
         except Exception as e:
             logger.error(f"Agent execution failed: {str(e)}", exc_info=True)
             raise e
+
+    async def _cache_output(self, cache_key: str, inputs: Dict[str, Any], output: str, usage_stats: Dict[str, Any]) -> None:
+        suffix = self.uncached_suffix(inputs)
+        if not output.endswith(suffix):
+            logger.warning("Output does not end with the agent's uncached suffix; not caching it", extra={"agent_id": self.agent_id})
+            return
+        await response_cache.set(cache_key, {"output": output[:len(output) - len(suffix)], "usage": dict(usage_stats)})
+
+    async def stream(
+        self,
+        inputs: Dict[str, Any],
+        llm_settings: LLMSettings,
+        bypass_cache: bool = False,
+        refresh_cache: bool = False,
+        timeout: Optional[float] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming wrapper around stream_run. Yields `{"type": "token", "content": ...}`
+        events followed by one final `{"type": "done", "usage": ..., ...}` event.
+        The whole stream shares one deadline, as in `execute`; closing the stream
+        early cancels the LLM request.
+        """
+        started = time.perf_counter()
+        deadline = self.deadline(llm_settings, timeout)
+        loop = asyncio.get_running_loop()
+        expires = loop.time() + deadline
+        with track_request(self.agent_id, llm_settings.provider, llm_settings.model_name, "stream") as tracked:
+            events = self._stream(inputs, llm_settings, bypass_cache, refresh_cache)
+            try:
+                while True:
+                    try:
+                        event = await asyncio.wait_for(events.__anext__(), max(0.0, expires - loop.time()))
+                    except StopAsyncIteration:
+                        break
+                    except asyncio.TimeoutError:
+                        logger.warning(f"Streaming agent execution timed out after {deadline:g}s", extra={"agent_id": self.agent_id})
+                        raise AgentTimeout(self.agent_id, deadline) from None
+                    if event["type"] == "done":
+                        tracked["cache"] = event["cache"]
+                        usage_ledger.record(
+                            self.agent_id, event["served_by"]["provider"], event["served_by"]["model"], event["usage"],
+                            "stream", event["cache"], (time.perf_counter() - started) * 1000,
+                        )
+                    yield event
+            finally:
+                # Runs the stream's cleanup (provider slot release) now rather than at garbage collection
+                await events.aclose()
+
+    async def _stream(
+        self,
+        inputs: Dict[str, Any],
+        llm_settings: LLMSettings,
+        bypass_cache: bool,
+        refresh_cache: bool,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        logger.info(f"Starting streaming agent execution: {self.metadata.name}", extra={"agent_id": self.agent_id})
+        log_body = sample_body()
+        if log_body:
+            logger.debug("Inputs: %s", Payload(inputs), extra={"agent_id": self.agent_id})
+            logger.debug("LLM Settings: %s", llm_settings.model_dump(exclude={"api_key"}), extra={"agent_id": self.agent_id})
+
+        inputs, prompt = await self.prepare(inputs)
+        cache_key = None if bypass_cache else self.cache_key(prompt, llm_settings)
+        if cache_key and not refresh_cache:
+            cached = await response_cache.get(cache_key)
+            if cached is not None:
+                logger.info("Streaming agent execution served from response cache")
+                yield {"type": "token", "content": cached["output"] + self.uncached_suffix(inputs)}
+                yield {
+                    "type": "done",
+                    # Copied as in _execute: the memory tier hands out the stored dict itself
+                    "usage": dict(cached["usage"]),
+                    "status": "success",
+                    "cache": "hit",
+                    "served_by": self._served_by(llm_settings),
+                    "attempts": 0,
+                }
+                return
+
+        handlers: Dict[str, UsageTrackingHandler] = {}
+        waits: Dict[str, Dict[str, float]] = {}
+        parts: List[str] = []
+
+        def open_stream(settings: LLMSettings) -> AsyncIterator[str]:
+            handlers[settings.model_name] = UsageTrackingHandler(settings.provider, settings.model_name)
+            waits[settings.model_name] = {"waited": 0.0}
+            return self._stream_attempt(inputs, prompt, settings, handlers[settings.model_name], waits[settings.model_name])
+
+        try:
+            # Models race for the first chunk; the stream that produces it is used to the end
+            stream, served, attempts = await stream_with_fallback(llm_settings, open_stream)
+            async for text in stream:
+                parts.append(text)
+                yield {"type": "token", "content": text}
+        except Exception as e:
+            logger.error(f"Streaming agent execution failed: {str(e)}", exc_info=True)
+            raise e
+
+        output = "".join(parts)
+        logger.info("Streaming agent execution completed successfully")
+        if log_body:
+            logger.debug("Output: %s", Payload(output), extra={"agent_id": self.agent_id})
+
+        usage_stats = self._usage_stats(handlers[served.model_name])
+        usage_stats["queue_wait_ms"] = round(waits[served.model_name]["waited"] * 1000, 2)
+        logger.info(f"Usage Stats: {usage_stats}")
+
+        if cache_key and served is llm_settings:
+            await self._cache_output(cache_key, inputs, output, usage_stats)
+
+        yield {
+            "type": "done",
+            "usage": usage_stats,
+            "status": "success",
+            "cache": "miss" if cache_key else "bypass",
+            "served_by": self._served_by(served),
+            "attempts": attempts,
+        }
@@ -3,51 +3,9 @@ from langchain_core.prompts import PromptTemplate
 from app.core.llm import LLMSettings
 from app.agents.base import BaseAgent, AgentMetadata
 
-class BusinessStrategyAdvisor(BaseAgent):
-    @property
-    def metadata(self) -> AgentMetadata:
-        return AgentMetadata(
-            name="Business Strategy Advisor",
-            description="Analyzes business context to provide strategic priorities, SWOT analysis, and OKRs.",
-            category="Business",
-            inputs_schema={
-                "type": "object",
-                "properties": {
-                    "goals": {
-                        "type": "string",
-                        "description": "Company goals (e.g., 'Expand into EMEA')"
-                    },
-                    "threats": {
-                        "type": "string",
-                        "description": "External risks or threats"
-                    },
-                    "market_trends": {
-                        "type": "string",
-                        "description": "Relevant market trends"
-                    }
-                },
-                "required": ["goals", "threats", "market_trends"]
-            }
-        )
-
-    async def run(self, inputs: Dict[str, Any], llm_settings: LLMSettings, callbacks: list = None) -> str:
-        goals = inputs.get("goals", "")
-        threats = inputs.get("threats", "")
-        market_trends = inputs.get("market_trends", "")
-        
-        template = """
-You are a Business Strategy Advisor AI.
-
-Based on the following input:
-
-**🎯 Company Goals:**
-{goals}
-
-**⚠️ External Threats:**
-{threats}
-
-**📈 Market Trends:**
-{market_trends}
+SYSTEM_PROMPT = """
+You are a Business Strategy Advisor AI. The user describes their company's goals,
+external threats and market trends.
 
 Provide a strategic plan in the following Markdown format:
 
@@ -63,10 +21,60 @@ Provide a strategic plan in the following Markdown format:
 ## 🎯 Proposed OKRs
 *Draft 3 key Objectives with 2-3 Key Results each.*
 """
-        prompt = PromptTemplate.from_template(template)
-        formatted_prompt = prompt.format(goals=goals, threats=threats, market_trends=market_trends)
+
+TEMPLATE = """
+**🎯 Company Goals:**
+{goals}
+
+**⚠️ External Threats:**
+{threats}
+
+**📈 Market Trends:**
+{market_trends}
+"""
+
+class BusinessStrategyAdvisor(BaseAgent):
+    agent_id = "business-strategy-advisor"
+    system_prompt = SYSTEM_PROMPT
+    prompt = PromptTemplate.from_template(TEMPLATE)
+
+    metadata = AgentMetadata(
+        name="Business Strategy Advisor",
+        description="Analyzes business context to provide strategic priorities, SWOT analysis, and OKRs.",
+        category="Business",
+        doc="97.md",
+        inputs_schema={
+            "type": "object",
+            "properties": {
+                "goals": {
+                    "type": "string",
+                    "maxLength": 5000,
+                    "description": "Company goals (e.g., 'Expand into EMEA')"
+                },
+                "threats": {
+                    "type": "string",
+                    "maxLength": 5000,
+                    "description": "External risks or threats"
+                },
+                "market_trends": {
+                    "type": "string",
+                    "maxLength": 5000,
+                    "description": "Relevant market trends"
+                }
+            },
+            "required": ["goals", "threats", "market_trends"]
+        }
+    )
+
+    def build_prompt(self, inputs: Dict[str, Any]) -> str:
+        goals = inputs.get("goals", "")
+        threats = inputs.get("threats", "")
+        market_trends = inputs.get("market_trends", "")
         
+        return self.prompt.format(goals=goals, threats=threats, market_trends=market_trends)
+
+    async def run(self, inputs: Dict[str, Any], llm_settings: LLMSettings, callbacks: list = None) -> str:
         llm = self.get_llm(llm_settings, callbacks=callbacks)
-        response = await llm.ainvoke(formatted_prompt)
+        response = await llm.ainvoke(self.messages_for(inputs))
         
         return response.content
@@ -0,0 +1,147 @@
+import asyncio
+from abc import abstractmethod
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage
+from langchain_core.prompts import PromptTemplate
+
+from app.agents.base import BaseAgent
+from app.core.chunking import CHUNK_MAX_CONCURRENCY, CHUNK_MAX_TOKENS, Chunk
+from app.core.llm import LLMSettings
+from app.core.logger import logger
+from app.core.rate_limit import estimate_tokens, provider_scheduler
+
+# Key under which `preprocess` stores the chunk plan in the prepared inputs
+PLANNED_CHUNKS = "_chunks"
+
+def _estimate_messages(messages: List[BaseMessage]) -> int:
+    return estimate_tokens("".join(message.content for message in messages))
+
+class ChunkedAgent(BaseAgent):
+    """
+    Agent that reviews one large text input with map-reduce.
+
+    Inputs that fit `chunk_tokens` use the single `prompt` as before. Larger inputs are
+    split by `split()`; each chunk is analyzed with `map_prompt` in parallel (bounded by
+    `chunk_concurrency` and the provider scheduler), then `reduce_prompt` merges the
+    per-chunk findings into the agent's usual output format. Wall-clock time then
+    follows the largest chunk plus the reduce step. Each step has its own static
+    system message, so all map calls of a request share one cacheable prefix.
+    """
+
+    # Name of the input field that may be split
+    chunk_input: str = ""
+    map_system_prompt: Optional[str] = None
+    map_prompt: Optional[PromptTemplate] = None
+    reduce_system_prompt: Optional[str] = None
+    reduce_prompt: Optional[PromptTemplate] = None
+    chunk_tokens: int = CHUNK_MAX_TOKENS
+    chunk_concurrency: int = CHUNK_MAX_CONCURRENCY
+
+    # The hooks below are abstract so an agent missing one fails when the registry loads
+    # it, not halfway through a map-reduce after the map calls have been paid for
+
+    @abstractmethod
+    def split(self, text: str) -> List[Chunk]:
+        """
+        Split the `chunk_input` text into chunks of at most `chunk_tokens`.
+        """
+
+    @abstractmethod
+    def map_variables(self, inputs: Dict[str, Any], chunk: Chunk, index: int, total: int) -> Dict[str, Any]:
+        """
+        Variables for `map_prompt` for one chunk.
+        """
+
+    @abstractmethod
+    def reduce_variables(self, inputs: Dict[str, Any], findings: str, total: int) -> Dict[str, Any]:
+        """
+        Variables for `reduce_prompt`, given the concatenated per-chunk findings.
+        """
+
+    def preprocess(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        # Split once, on the executor; plan_chunks then reuses the result
+        return {**inputs, PLANNED_CHUNKS: self.plan_chunks(inputs)}
+
+    def plan_chunks(self, inputs: Dict[str, Any]) -> Optional[List[Chunk]]:
+        """
+        The chunks for `inputs`, or None when the input fits in a single prompt.
+        """
+        if PLANNED_CHUNKS in inputs:
+            return inputs[PLANNED_CHUNKS]
+        text = inputs.get(self.chunk_input) or ""
+        if estimate_tokens(text) <= self.chunk_tokens:
+            return None
+        chunks = self.split(text)
+        return chunks if len(chunks) > 1 else None
+
+    def schedules_calls(self, inputs: Dict[str, Any]) -> bool:
+        return self.plan_chunks(inputs) is not None
+
+    async def _scheduled(self, llm_settings: LLMSettings, messages: List[BaseMessage], call: Callable[[], Awaitable[Any]]) -> Any:
+        result, _ = await provider_scheduler.run(
+            llm_settings.provider, llm_settings.model_name, call, estimated_tokens=_estimate_messages(messages)
+        )
+        return result
+
+    async def map_chunks(self, inputs: Dict[str, Any], chunks: List[Chunk], llm, llm_settings: LLMSettings) -> List[str]:
+        """
+        Analyze every chunk in parallel. Returns one findings text per chunk, in order;
+        the first failure cancels the remaining calls.
+        """
+        semaphore = asyncio.Semaphore(max(1, self.chunk_concurrency))
+
+        async def analyze(index: int, chunk: Chunk) -> str:
+            messages = self.to_messages(
+                self.map_system_prompt, self.map_prompt.format(**self.map_variables(inputs, chunk, index, len(chunks))),
+            )
+            async with semaphore:
+                response = await self._scheduled(llm_settings, messages, lambda: llm.ainvoke(messages))
+            return response.content
+
+        tasks = [asyncio.create_task(analyze(i, chunk)) for i, chunk in enumerate(chunks)]
+        try:
+            return await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def _map_then_reduce_messages(self, inputs: Dict[str, Any], chunks: List[Chunk], llm, llm_settings: LLMSettings) -> List[BaseMessage]:
+        logger.info(f"{self.agent_id}: input split into {len(chunks)} chunks")
+        findings = await self.map_chunks(inputs, chunks, llm, llm_settings)
+        merged = "\n\n".join(
+            f"### Part {i + 1} of {len(chunks)} ({label})\n\n{text.strip()}"
+            for i, ((label, _), text) in enumerate(zip(chunks, findings))
+        )
+        return self.to_messages(
+            self.reduce_system_prompt, self.reduce_prompt.format(**self.reduce_variables(inputs, merged, len(chunks))),
+        )
+
+    async def run(self, inputs: Dict[str, Any], llm_settings: LLMSettings, callbacks: Optional[List[BaseCallbackHandler]] = None) -> str:
+        llm = self.get_llm(llm_settings, callbacks=callbacks)
+        chunks = self.plan_chunks(inputs)
+        if chunks is None:
+            response = await llm.ainvoke(self.messages_for(inputs))
+            return response.content
+
+        reduce_messages = await self._map_then_reduce_messages(inputs, chunks, llm, llm_settings)
+        response = await self._scheduled(llm_settings, reduce_messages, lambda: llm.ainvoke(reduce_messages))
+        return response.content
+
+    async def stream_run(self, inputs: Dict[str, Any], llm_settings: LLMSettings, callbacks: Optional[List[BaseCallbackHandler]] = None) -> AsyncIterator[str]:
+        chunks = self.plan_chunks(inputs)
+        if chunks is None:
+            async for text in super().stream_run(inputs, llm_settings, callbacks=callbacks):
+                yield text
+            return
+
+        # The map step is not streamed; the merged answer is
+        llm = self.get_llm(llm_settings, callbacks=callbacks)
+        reduce_messages = await self._map_then_reduce_messages(inputs, chunks, llm, llm_settings)
+        async with provider_scheduler.slot(llm_settings.provider, llm_settings.model_name, _estimate_messages(reduce_messages)):
+            async for chunk in llm.astream(reduce_messages):
+                if chunk.content:
+                    yield chunk.content
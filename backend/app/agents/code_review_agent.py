@@ -1,49 +1,14 @@
-from typing import Dict, Any
+import os
+from typing import Dict, Any, List
 from langchain_core.prompts import PromptTemplate
-from app.core.llm import LLMSettings
-from app.agents.base import BaseAgent, AgentMetadata
-
-class CodeReviewAgent(BaseAgent):
-    @property
-    def metadata(self) -> AgentMetadata:
-        return AgentMetadata(
-            name="AI Code Review Agent",
-            description="Reviews code snippets for bugs, security risks, code smells, and best practices.",
-            category="Development",
-            inputs_schema={
-                "type": "object",
-                "properties": {
-                    "code_snippet": {
-                        "type": "string",
-                        "description": "The code snippet to review"
-                    },
-                    "language": {
-                        "type": "string",
-                        "description": "Programming language (optional, auto-detect if empty)"
-                    }
-                },
-                "required": ["code_snippet"]
-            }
-        )
-
-    async def run(self, inputs: Dict[str, Any], llm_settings: LLMSettings, callbacks: list = None) -> str:
-        code = inputs.get("code_snippet", "")
-        language = inputs.get("language", "any language")
-        
-        template = """
-You are a senior software engineer performing a code review.
-
-Please analyze the following {language} code:
-
-```
-{code}
-```
+from app.core.chunking import Chunk, split_code
+from app.agents.base import AgentMetadata
+from app.agents.chunked import ChunkedAgent
 
-Tasks:
-1. Identify any syntax errors or logical bugs.
-2. Suggest security improvements (if applicable).
-3. Recommend best practices, performance optimizations, or code style fixes.
+# Files larger than this are rejected up front rather than reviewed in dozens of chunks
+CODE_REVIEW_MAX_CHARS = int(os.getenv("CODE_REVIEW_MAX_CHARS", "500000"))
 
+OUTPUT_FORMAT = """
 Provide output in the following Markdown format:
 
 ## 🐞 Issues
@@ -58,10 +23,116 @@ Provide output in the following Markdown format:
 ## 📝 Overall Assessment
 *A brief summary of the code quality.*
 """
-        prompt = PromptTemplate.from_template(template)
-        formatted_prompt = prompt.format(code=code, language=language)
-        
-        llm = self.get_llm(llm_settings, callbacks=callbacks)
-        response = await llm.ainvoke(formatted_prompt)
-        
-        return response.content
+
+# Everything but the code and its language is fixed, so it all goes in the system message
+SYSTEM_PROMPT = """
+You are a senior software engineer performing a code review of the code the user sends.
+
+Tasks:
+1. Identify any syntax errors or logical bugs.
+2. Suggest security improvements (if applicable).
+3. Recommend best practices, performance optimizations, or code style fixes.
+""" + OUTPUT_FORMAT
+
+TEMPLATE = """
+Please analyze the following {language} code:
+
+```
+{code}
+```
+"""
+
+# Large files: each part is reviewed on its own, then the findings are merged
+MAP_SYSTEM_PROMPT = """
+You are a senior software engineer reviewing one part of a larger file; the user tells you
+which part it is. Other parts are reviewed separately, so do not report names that may be
+defined elsewhere.
+
+List concrete findings for this part only, citing line numbers where possible, under these headings
+(write "None" under a heading with nothing to report):
+
+## 🐞 Issues
+## 🔒 Security
+## 💡 Suggestions
+## 📝 Notes
+*One or two sentences on the quality of this part.*
+"""
+
+MAP_TEMPLATE = """
+Part {part} of {total} ({label}) of a larger {language} file:
+
+```
+{code}
+```
+"""
+
+REDUCE_SYSTEM_PROMPT = """
+You are a senior software engineer performing a code review. A large file was reviewed in
+parts; the user gives you the findings for each part.
+
+Merge them into a single review of the whole file: remove duplicates, keep line references,
+and order issues by severity.
+""" + OUTPUT_FORMAT
+
+REDUCE_TEMPLATE = """
+The {language} file was reviewed in {total} parts.
+
+{findings}
+"""
+
+class CodeReviewAgent(ChunkedAgent):
+    agent_id = "code-review-agent"
+    system_prompt = SYSTEM_PROMPT
+    prompt = PromptTemplate.from_template(TEMPLATE)
+    map_system_prompt = MAP_SYSTEM_PROMPT
+    map_prompt = PromptTemplate.from_template(MAP_TEMPLATE)
+    reduce_system_prompt = REDUCE_SYSTEM_PROMPT
+    reduce_prompt = PromptTemplate.from_template(REDUCE_TEMPLATE)
+    chunk_input = "code_snippet"
+
+    metadata = AgentMetadata(
+        name="AI Code Review Agent",
+        description="Reviews code snippets for bugs, security risks, code smells, and best practices.",
+        category="Development",
+        doc="57.md",
+        inputs_schema={
+            "type": "object",
+            "properties": {
+                "code_snippet": {
+                    "type": "string",
+                    "minLength": 1,
+                    "maxLength": CODE_REVIEW_MAX_CHARS,
+                    "description": "The code snippet to review"
+                },
+                "language": {
+                    "type": "string",
+                    "maxLength": 50,
+                    "description": "Programming language (optional, auto-detect if empty)"
+                }
+            },
+            "required": ["code_snippet"]
+        }
+    )
+
+    def build_prompt(self, inputs: Dict[str, Any]) -> str:
+        code = inputs.get("code_snippet", "")
+        language = inputs.get("language", "any language")
+
+        return self.prompt.format(code=code, language=language)
+
+    def split(self, text: str) -> List[Chunk]:
+        # Split on function/class boundaries
+        return split_code(text, self.chunk_tokens)
+
+    def map_variables(self, inputs: Dict[str, Any], chunk: Chunk, index: int, total: int) -> Dict[str, Any]:
+        label, code = chunk
+        return {
+            "part": index + 1,
+            "total": total,
+            "label": label,
+            "language": inputs.get("language", "any language"),
+            "code": code,
+        }
+
+    def reduce_variables(self, inputs: Dict[str, Any], findings: str, total: int) -> Dict[str, Any]:
+        return {"language": inputs.get("language", "any language"), "total": total, "findings": findings}
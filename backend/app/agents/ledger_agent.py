@@ -1,38 +1,69 @@
-import pandas as pd
-from typing import Dict, Any
+import os
+from typing import Dict, Any, AsyncIterator, Tuple
 from langchain_core.prompts import PromptTemplate
 from app.core.llm import LLMSettings
 from app.agents.base import BaseAgent, AgentMetadata
 
+# Ledgers up to this many rows are also echoed back verbatim in the output
+LEDGER_FULL_TABLE_MAX_ROWS = int(os.getenv("LEDGER_FULL_TABLE_MAX_ROWS", "200"))
+# Reconciliation is pandas work that holds the GIL, so by default it runs in worker processes
+LEDGER_CPU_EXECUTOR = os.getenv("LEDGER_CPU_EXECUTOR", "process")
+# Larger ledgers go through the file upload endpoint, which reconciles in bounded memory
+LEDGER_MAX_ROWS = int(os.getenv("LEDGER_MAX_ROWS", "10000"))
+
+SYSTEM_PROMPT = """
+You are a financial ledger analyst AI. A deterministic reconciliation engine has already
+processed the full ledger. The user gives you its totals, per-account and per-day balances,
+and the rows it flagged (duplicates, statistical outliers, invalid entries).
+
+Tasks:
+1. Identify if the debits equal credits.
+2. Highlight any imbalances or potential errors.
+3. Provide a one-paragraph explanation of the ledger status.
+
+Base every figure on the reconciliation; do not recompute totals.
+"""
+
+TEMPLATE = """
+{reconciliation}
+"""
+
 class LedgerAgent(BaseAgent):
-    @property
-    def metadata(self) -> AgentMetadata:
-        return AgentMetadata(
-            name="Ledger Analysis Agent",
-            description="Analyzes and reconciles ledger entries to detect imbalances and anomalies.",
-            category="Finance",
-            inputs_schema={
-                "type": "object",
-                "properties": {
-                    "ledger_data": {
-                        "type": "array",
-                        "description": "List of transactions (optional, defaults to mock data)",
-                        "items": {
-                            "type": "object",
-                            "properties": {
-                                "Date": {"type": "string"},
-                                "Description": {"type": "string"},
-                                "Account": {"type": "string"},
-                                "Debit": {"type": "number"},
-                                "Credit": {"type": "number"}
-                            }
+    agent_id = "ledger-agent"
+    system_prompt = SYSTEM_PROMPT
+    prompt = PromptTemplate.from_template(TEMPLATE)
+    cpu_stage_executor = LEDGER_CPU_EXECUTOR
+
+    metadata = AgentMetadata(
+        name="Ledger Analysis Agent",
+        description="Analyzes and reconciles ledger entries to detect imbalances and anomalies.",
+        category="Finance",
+        doc="2.md",
+        inputs_schema={
+            "type": "object",
+            "properties": {
+                "ledger_data": {
+                    "type": "array",
+                    "description": "List of transactions (optional, defaults to mock data)",
+                    "maxItems": LEDGER_MAX_ROWS,
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "Date": {"type": "string", "maxLength": 40},
+                            "Description": {"type": "string", "maxLength": 500},
+                            "Account": {"type": "string", "maxLength": 200},
+                            "Debit": {"type": "number"},
+                            "Credit": {"type": "number"}
                         }
                     }
                 }
             }
-        )
+        }
+    )
 
     def get_mock_ledger(self):
+        import pandas as pd
+
         data = {
             "Date": ["2025-07-01", "2025-07-01", "2025-07-02", "2025-07-02", "2025-07-03"],
             "Description": ["Customer Payment", "Revenue Recorded", "Office Supplies", "Cash Paid", "Consulting Income"],
@@ -42,29 +73,87 @@ class LedgerAgent(BaseAgent):
         }
         return pd.DataFrame(data)
 
-    async def run(self, inputs: Dict[str, Any], llm_settings: LLMSettings, callbacks: list = None) -> str:
+    def load_ledger(self, inputs: Dict[str, Any]):
+        # pandas is imported on first use to keep agent discovery cheap
+        import pandas as pd
+
         # Load data
         if inputs.get("ledger_data"):
-            df = pd.DataFrame(inputs["ledger_data"])
-        else:
-            df = self.get_mock_ledger()
-            
-        ledger_table = df.to_string(index=False)
-        
-        template = """
-You are a financial ledger analyst AI. Analyze the following transactions:
+            return pd.DataFrame(inputs["ledger_data"])
+        return self.get_mock_ledger()
 
-{ledger_table}
+    def analyze(self, inputs: Dict[str, Any]) -> Tuple[str, str]:
+        """
+        Reconcile the ledger locally. Returns (summary for the prompt, ledger section for the output).
+        """
+        from app.agents.ledger_reconciliation import format_report, reconcile
+
+        if "_reconciliation_summary" in inputs:
+            return inputs["_reconciliation_summary"], inputs["_ledger_section"]
+        if inputs.get("reconciliation_report"):
+            # Precomputed by the file upload endpoint, which never holds the whole ledger
+            summary = format_report(inputs["reconciliation_report"])
+            return summary, f"### Reconciliation Summary\n\n{summary}"
+
+        df = self.load_ledger(inputs)
+        summary = format_report(reconcile(df))
+        ledger_section = f"### Reconciliation Summary\n\n{summary}"
+        if len(df) <= LEDGER_FULL_TABLE_MAX_ROWS:
+            ledger_section += f"\n\n### Analyzed Ledger Data\n\n```\n{df.to_string(index=False)}\n```"
+        return summary, ledger_section
+
+    def preprocess(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        # Reconcile once; build_prompt, run and stream_run reuse the result. The raw rows
+        # are dropped so they are not copied back from a worker process.
+        summary, ledger_section = self.analyze(inputs)
+        prepared = {key: value for key, value in inputs.items() if key != "ledger_data"}
+        prepared["_reconciliation_summary"] = summary
+        prepared["_ledger_section"] = ledger_section
+        return prepared
+
+    def uncached_suffix(self, inputs: Dict[str, Any]) -> str:
+        # The prompt only carries the reconciliation summary, so two ledgers with the same
+        # aggregates share a cache entry; their verbatim tables must not
+        return self.analyze(inputs)[1]
+
+    def format_prompt(self, summary: str) -> str:
+        return self.prompt.format(reconciliation=summary)
+
+    def build_prompt(self, inputs: Dict[str, Any]) -> str:
+        return self.format_prompt(self.analyze(inputs)[0])
+
+    async def run(self, inputs: Dict[str, Any], llm_settings: LLMSettings, callbacks: list = None) -> str:
+        _, ledger_section = self.analyze(inputs)
 
-Tasks:
-1. Identify if the debits equal credits.
-2. Highlight any imbalances or potential errors.
-3. Provide a one-paragraph explanation of the ledger status.
-"""
-        prompt = PromptTemplate.from_template(template)
-        formatted_prompt = prompt.format(ledger_table=ledger_table)
-        
         llm = self.get_llm(llm_settings, callbacks=callbacks)
-        response = await llm.ainvoke(formatted_prompt)
+        response = await llm.ainvoke(self.messages_for(inputs))
         
-        return f"### Ledger Data Analysis\n\n{response.content}\n\n### Analyzed Ledger Data\n\n```\n{ledger_table}\n```"
+        return f"### Ledger Data Analysis\n\n{response.content}\n\n{ledger_section}"
+
+    async def stream_run(self, inputs: Dict[str, Any], llm_settings: LLMSettings, callbacks: list = None) -> AsyncIterator[str]:
+        _, ledger_section = self.analyze(inputs)
+
+        llm = self.get_llm(llm_settings, callbacks=callbacks)
+        # The header goes out with the model's first chunk: stream_with_fallback races
+        # attempts to their first chunk, so a constant first chunk would defeat failover,
+        # hedging and the time-to-first-token samples
+        header = "### Ledger Data Analysis\n\n"
+        async for chunk in llm.astream(self.messages_for(inputs)):
+            if chunk.content:
+                yield header + chunk.content
+                header = ""
+        yield header + "\n\n"
+
+        # Emit the ledger section in slices so it doesn't arrive as one huge frame
+        for start in range(0, len(ledger_section), 4096):
+            yield ledger_section[start:start + 4096]
+
+    def session_artifacts(self, inputs: Dict[str, Any], output: str) -> Tuple[Dict[str, str], str]:
+        # The reconciliation summary and ledger table can be far larger than the analysis;
+        # follow-ups get them as the "ledger" artifact instead of in every turn's history
+        artifacts, answer = super().session_artifacts(inputs, output)
+        analysis, separator, ledger_section = output.partition("\n\n### Reconciliation Summary")
+        if separator:
+            artifacts["ledger"] = separator.lstrip() + ledger_section
+            answer = analysis
+        return artifacts, answer
@@ -0,0 +1,476 @@
+"""
+Deterministic, vectorized ledger reconciliation used by LedgerAgent.
+
+The LLM only sees the compact report produced here (totals, imbalances and a
+bounded set of flagged rows), so prompt size stays flat as ledgers grow.
+"""
+import os
+import shutil
+import tempfile
+import warnings
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    from pandas.tseries.api import guess_datetime_format
+except ImportError:  # pandas < 2.2
+    from pandas._libs.tslibs.parsing import guess_datetime_format
+
+LEDGER_COLUMNS = ["Date", "Description", "Account", "Debit", "Credit"]
+# Amounts closer than this are treated as equal (half a cent)
+BALANCE_TOLERANCE = 0.005
+# Modified z-score threshold for outliers (Iglewicz & Hoaglin)
+OUTLIER_Z_THRESHOLD = 3.5
+LEDGER_MAX_FLAGGED_ROWS = int(os.getenv("LEDGER_MAX_FLAGGED_ROWS", "50"))
+LEDGER_MAX_SUMMARY_ROWS = int(os.getenv("LEDGER_MAX_SUMMARY_ROWS", "20"))
+# Rows per chunk when reconciling uploaded files
+LEDGER_CHUNK_ROWS = int(os.getenv("LEDGER_CHUNK_ROWS", "100000"))
+# Uniform sample of amounts used to estimate outlier bounds for files
+LEDGER_OUTLIER_SAMPLE = int(os.getenv("LEDGER_OUTLIER_SAMPLE", "200000"))
+# Row hashes of uploaded files are spilled to this many bucket files on disk, so duplicate
+# detection holds about rows / buckets hashes in memory at a time
+LEDGER_HASH_BUCKETS = 256
+# Most distinct duplicated rows kept for flagging individual rows; beyond it the duplicate
+# count stays exact but some duplicates are not flagged ("duplicates_truncated")
+LEDGER_MAX_DUPLICATE_KEYS = int(os.getenv("LEDGER_MAX_DUPLICATE_KEYS", "1000000"))
+# Parse each date on its own when no single format fits the sample
+MIXED_DATE_FORMAT = "mixed"
+
+def infer_date_format(dates: pd.Series, sample: int = 100) -> Optional[str]:
+    """
+    One strftime format for a column of date strings, guessed from its first non-empty
+    values and checked against them; MIXED_DATE_FORMAT when they disagree, None when
+    the column is not strings (e.g. already datetimes from Parquet).
+
+    Both the month-first and the day-first reading of the first value are tried, and the
+    first that parses the whole sample wins, so 13/01/2024 in a day-first ledger is not
+    forced through a month-first guess. A sample that fits both (every day <= 12) keeps
+    pandas' month-first default; pass an explicit format to normalize_ledger for those.
+    """
+    if not (pd.api.types.is_object_dtype(dates) or pd.api.types.is_string_dtype(dates)):
+        return None
+    values = dates.dropna().astype(str)
+    values = values[values.str.strip() != ""].head(sample)
+    if values.empty:
+        return None
+    for date_format in _guess_date_formats(values.iloc[0]):
+        if not pd.to_datetime(values, format=date_format, errors="coerce").isna().any():
+            return date_format
+    return MIXED_DATE_FORMAT
+
+def _guess_date_formats(value: str) -> List[str]:
+    """
+    Distinct formats guessed for `value` reading it month-first, then day-first.
+    """
+    formats = []
+    for dayfirst in (False, True):
+        with warnings.catch_warnings():
+            # Warns when the guess contradicts `dayfirst`; both readings are checked anyway
+            warnings.simplefilter("ignore", UserWarning)
+            date_format = guess_datetime_format(value, dayfirst=dayfirst)
+        if date_format is not None and date_format not in formats:
+            formats.append(date_format)
+    return formats
+
+def normalize_ledger(df: pd.DataFrame, date_format: Optional[str] = None) -> pd.DataFrame:
+    """
+    Ensure the standard columns exist with compact dtypes: numeric amounts
+    (missing -> 0), parsed dates and categorical account/description labels.
+    `date_format` defaults to one inferred from `df`; chunked readers infer it once
+    and pass it, so a date string parses the same way in every chunk.
+    """
+    df = df.copy()
+    for column in LEDGER_COLUMNS:
+        if column not in df.columns:
+            df[column] = 0.0 if column in ("Debit", "Credit") else ""
+    for column in ("Debit", "Credit"):
+        df[column] = pd.to_numeric(df[column], errors="coerce").fillna(0.0).astype("float64")
+    if date_format is None:
+        date_format = infer_date_format(df["Date"])
+    df["Date"] = pd.to_datetime(df["Date"], format=date_format, errors="coerce")
+    df["Account"] = df["Account"].fillna("").astype(str).astype("category")
+    df["Description"] = df["Description"].fillna("").astype(str).astype("category")
+    return df
+
+def _balances(df: pd.DataFrame, key: str) -> pd.DataFrame:
+    grouped = df.groupby(key, observed=True, dropna=False).agg(
+        debit=("Debit", "sum"),
+        credit=("Credit", "sum"),
+        entries=("Debit", "size"),
+    )
+    grouped["net"] = grouped["debit"] - grouped["credit"]
+    return grouped
+
+def outlier_bounds(values: np.ndarray) -> Optional[Tuple[float, float]]:
+    """
+    Robust (low, high) bounds for non-zero amounts using the modified z-score
+    (median / MAD), falling back to the IQR rule when MAD is zero. Amounts
+    strictly outside the bounds are outliers. Returns None for tiny samples.
+    """
+    values = values[values > 0]
+    if len(values) < 5:
+        return None
+
+    median = float(np.median(values))
+    mad = float(np.median(np.abs(values - median)))
+    if mad > 0:
+        spread = OUTLIER_Z_THRESHOLD * mad / 0.6745
+        return median - spread, median + spread
+    q1, q3 = np.percentile(values, [25, 75])
+    iqr = float(q3 - q1)
+    if iqr == 0:
+        return median, median
+    return float(q1) - 3 * iqr, float(q3) + 3 * iqr
+
+def _outlier_mask(amounts: np.ndarray, bounds: Optional[Tuple[float, float]]) -> np.ndarray:
+    if bounds is None:
+        return np.zeros(len(amounts), dtype=bool)
+    low, high = bounds
+    return (amounts > 0) & ((amounts < low) | (amounts > high))
+
+def _invalid_mask(df: pd.DataFrame) -> np.ndarray:
+    debit = df["Debit"].to_numpy()
+    credit = df["Credit"].to_numpy()
+    return df["Date"].isna().to_numpy() | ((debit > 0) & (credit > 0)) | (debit < 0) | (credit < 0)
+
+def _flagged_rows(df: pd.DataFrame, masks: Dict[str, np.ndarray], limit: int) -> pd.DataFrame:
+    flag_mask = np.logical_or.reduce(list(masks.values()))
+    # Only the rows we will actually show get a human-readable reason
+    shown = np.flatnonzero(flag_mask)[:limit]
+    flagged = df.iloc[shown][LEDGER_COLUMNS].copy()
+    flagged["Flags"] = [", ".join(label for label, mask in masks.items() if mask[i]) for i in shown]
+    return flagged
+
+def _records(df: pd.DataFrame) -> List[Dict[str, Any]]:
+    out = df.copy()
+    if "Date" in out.columns:
+        out["Date"] = out["Date"].dt.strftime("%Y-%m-%d").fillna("")
+    for column in out.columns:
+        if isinstance(out[column].dtype, pd.CategoricalDtype):
+            out[column] = out[column].astype(str)
+    return out.to_dict(orient="records")
+
+def reconcile(df: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Reconcile a ledger DataFrame. Returns a JSON-serializable report.
+    """
+    df = normalize_ledger(df)
+    total_debit = float(df["Debit"].sum())
+    total_credit = float(df["Credit"].sum())
+    by_account = _balances(df, "Account")
+    by_date = _balances(df, "Date")
+
+    duplicate_mask = df.duplicated(subset=LEDGER_COLUMNS, keep=False).to_numpy()
+    amounts = np.maximum(df["Debit"].to_numpy(), df["Credit"].to_numpy())
+    outlier_mask = _outlier_mask(amounts, outlier_bounds(amounts))
+    invalid_mask = _invalid_mask(df)
+    flag_mask = duplicate_mask | outlier_mask | invalid_mask
+    flagged = _flagged_rows(
+        df,
+        {"duplicate": duplicate_mask, "outlier": outlier_mask, "invalid": invalid_mask},
+        LEDGER_MAX_FLAGGED_ROWS,
+    )
+
+    return _report(
+        rows=len(df),
+        total_debit=total_debit,
+        total_credit=total_credit,
+        by_account=by_account,
+        by_date=by_date,
+        duplicate_rows=int(duplicate_mask.sum()),
+        outlier_rows=int(outlier_mask.sum()),
+        invalid_rows=int(invalid_mask.sum()),
+        flagged_row_count=int(flag_mask.sum()),
+        flagged=flagged,
+    )
+
+def _report(
+    rows: int,
+    total_debit: float,
+    total_credit: float,
+    by_account: pd.DataFrame,
+    by_date: pd.DataFrame,
+    duplicate_rows: int,
+    outlier_rows: int,
+    invalid_rows: int,
+    flagged_row_count: int,
+    flagged: pd.DataFrame,
+    duplicates_truncated: bool = False,
+) -> Dict[str, Any]:
+    difference = total_debit - total_credit
+    unbalanced_days = by_date[by_date["net"].abs() > BALANCE_TOLERANCE]
+    top_accounts = by_account.reindex(by_account["net"].abs().sort_values(ascending=False).index)
+    top_days = unbalanced_days.reindex(unbalanced_days["net"].abs().sort_values(ascending=False).index)
+
+    return {
+        "rows": int(rows),
+        "total_debit": round(total_debit, 2),
+        "total_credit": round(total_credit, 2),
+        "difference": round(difference, 2),
+        "balanced": abs(difference) <= BALANCE_TOLERANCE,
+        "accounts": int(len(by_account)),
+        "account_balances": _records(top_accounts.head(LEDGER_MAX_SUMMARY_ROWS).reset_index()),
+        "days": int(len(by_date)),
+        "unbalanced_day_count": int(len(unbalanced_days)),
+        "unbalanced_days": _records(top_days.head(LEDGER_MAX_SUMMARY_ROWS).reset_index()),
+        "duplicate_rows": duplicate_rows,
+        # Some duplicate rows were counted but not flagged (see LEDGER_MAX_DUPLICATE_KEYS)
+        "duplicates_truncated": duplicates_truncated,
+        "outlier_rows": outlier_rows,
+        "invalid_rows": invalid_rows,
+        "flagged_row_count": flagged_row_count,
+        "flagged_rows": _records(flagged),
+    }
+
+def iter_ledger_chunks(path: str, file_format: str, chunk_rows: int = LEDGER_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """
+    Read a CSV or Parquet ledger file as normalized DataFrames of at most `chunk_rows` rows.
+    Only the ledger columns are read.
+    """
+    if file_format == "parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ValueError("Parquet uploads require the 'pyarrow' package")
+        parquet = pq.ParquetFile(path)
+        columns = [column for column in LEDGER_COLUMNS if column in parquet.schema_arrow.names]
+        date_format = None
+        for batch in parquet.iter_batches(batch_size=chunk_rows, columns=columns):
+            chunk = batch.to_pandas()
+            if date_format is None and "Date" in chunk.columns:
+                date_format = infer_date_format(chunk["Date"])
+            yield normalize_ledger(chunk, date_format)
+    elif file_format == "csv":
+        reader = pd.read_csv(
+            path,
+            chunksize=chunk_rows,
+            usecols=lambda column: column in LEDGER_COLUMNS,
+            dtype={"Date": str, "Description": str, "Account": str},
+        )
+        date_format = None
+        with reader:
+            for chunk in reader:
+                if date_format is None and "Date" in chunk.columns:
+                    date_format = infer_date_format(chunk["Date"])
+                yield normalize_ledger(chunk, date_format)
+    else:
+        raise ValueError(f"Unsupported ledger format: {file_format}")
+
+def _row_hashes(df: pd.DataFrame) -> np.ndarray:
+    return pd.util.hash_pandas_object(df[LEDGER_COLUMNS], index=False).to_numpy()
+
+class _HashSpill:
+    """
+    Row hashes partitioned by their top bits into bucket files, so duplicates can be
+    found one bucket at a time instead of holding a hash per row in memory.
+    """
+
+    def __init__(self, buckets: int = LEDGER_HASH_BUCKETS):
+        self.buckets = buckets
+        self.shift = np.uint64(64 - int(np.log2(buckets)))
+        self.directory: Optional[str] = None
+
+    def _path(self, bucket: int) -> str:
+        return os.path.join(self.directory, f"{bucket}.bin")
+
+    def add(self, hashes: np.ndarray) -> None:
+        if self.directory is None:
+            self.directory = tempfile.mkdtemp(prefix="ledger-hashes-")
+        bucket_ids = hashes >> self.shift
+        order = np.argsort(bucket_ids, kind="stable")
+        hashes, bucket_ids = hashes[order], bucket_ids[order]
+        bounds = np.searchsorted(bucket_ids, np.arange(self.buckets + 1, dtype=np.uint64))
+        for bucket in np.flatnonzero(np.diff(bounds)):
+            with open(self._path(bucket), "ab") as f:
+                hashes[bounds[bucket]:bounds[bucket + 1]].tofile(f)
+
+    def duplicates(self, max_keys: int) -> Tuple[np.ndarray, int, bool]:
+        """
+        (sorted hashes seen more than once, capped at `max_keys`; total rows whose
+        hash repeats, exact; whether the hashes were capped).
+        """
+        found: List[np.ndarray] = []
+        kept = duplicate_rows = 0
+        truncated = False
+        for bucket in range(self.buckets if self.directory else 0):
+            if not os.path.exists(self._path(bucket)):
+                continue
+            unique, counts = np.unique(np.fromfile(self._path(bucket), dtype=np.uint64), return_counts=True)
+            repeated = counts > 1
+            duplicate_rows += int(counts[repeated].sum())
+            keys = unique[repeated]
+            if kept + len(keys) > max_keys:
+                keys, truncated = keys[:max_keys - kept], True
+            kept += len(keys)
+            found.append(keys)
+        # Buckets are ordered by the top bits, so the concatenation stays sorted
+        hashes = np.concatenate(found) if found else np.empty(0, dtype=np.uint64)
+        return hashes, duplicate_rows, truncated
+
+    def close(self) -> None:
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+class LedgerAccumulator:
+    """
+    Running aggregates for a ledger read in chunks (first pass of `reconcile_file`).
+
+    Memory is bounded by the number of distinct accounts and days, the fixed-size
+    amount sample and LEDGER_MAX_DUPLICATE_KEYS; row hashes for duplicate detection
+    are spilled to disk. Call `close` to remove the spill files.
+    """
+
+    def __init__(self, sample_size: int = LEDGER_OUTLIER_SAMPLE):
+        self.rows = 0
+        self.total_debit = 0.0
+        self.total_credit = 0.0
+        self.invalid_rows = 0
+        self.by_account: Optional[pd.DataFrame] = None
+        self.by_date: Optional[pd.DataFrame] = None
+        self.sample_size = sample_size
+        self._sample = np.empty(0)
+        self._sample_keys = np.empty(0)
+        self._hashes = _HashSpill()
+        self._rng = np.random.default_rng()
+
+    @staticmethod
+    def _merge(total: Optional[pd.DataFrame], chunk: pd.DataFrame) -> pd.DataFrame:
+        chunk = chunk.drop(columns="net")
+        return chunk if total is None else total.add(chunk, fill_value=0)
+
+    def add(self, df: pd.DataFrame) -> None:
+        self.rows += len(df)
+        self.total_debit += float(df["Debit"].sum())
+        self.total_credit += float(df["Credit"].sum())
+        self.invalid_rows += int(_invalid_mask(df).sum())
+        self.by_account = self._merge(self.by_account, _balances(df, "Account"))
+        self.by_date = self._merge(self.by_date, _balances(df, "Date"))
+        self._hashes.add(_row_hashes(df))
+
+        # Bottom-k sampling: keep the amounts with the smallest random keys,
+        # which is a uniform sample without replacement over all rows seen
+        amounts = np.maximum(df["Debit"].to_numpy(), df["Credit"].to_numpy())
+        values = np.concatenate([self._sample, amounts])
+        keys = np.concatenate([self._sample_keys, self._rng.random(len(amounts))])
+        if len(values) > self.sample_size:
+            keep = np.argpartition(keys, self.sample_size)[:self.sample_size]
+            values, keys = values[keep], keys[keep]
+        self._sample, self._sample_keys = values, keys
+
+    def outlier_bounds(self) -> Optional[Tuple[float, float]]:
+        return outlier_bounds(self._sample)
+
+    def duplicate_hashes(self, max_keys: int = LEDGER_MAX_DUPLICATE_KEYS) -> Tuple[np.ndarray, int, bool]:
+        """
+        (sorted hashes that occur more than once, the number of duplicate rows, whether
+        the hashes were capped at `max_keys`). Removes the spilled hashes.
+        """
+        try:
+            return self._hashes.duplicates(max_keys)
+        finally:
+            self._hashes.close()
+
+    def close(self) -> None:
+        self._hashes.close()
+
+    @staticmethod
+    def balances(table: pd.DataFrame) -> pd.DataFrame:
+        table = table.copy()
+        table["entries"] = table["entries"].astype("int64")
+        table["net"] = table["debit"] - table["credit"]
+        return table
+
+def reconcile_file(path: str, file_format: str, chunk_rows: int = LEDGER_CHUNK_ROWS) -> Dict[str, Any]:
+    """
+    Reconcile a CSV/Parquet ledger without loading it whole. Returns the same report as `reconcile`.
+
+    The first pass builds running totals, balances, row hashes and an amount sample;
+    the second pass flags duplicates and outliers against them. Outlier bounds are
+    exact when the ledger fits in the sample, otherwise estimated from it.
+    """
+    accumulator = LedgerAccumulator()
+    try:
+        for chunk in iter_ledger_chunks(path, file_format, chunk_rows):
+            accumulator.add(chunk)
+        if accumulator.rows == 0:
+            raise ValueError("Ledger file contains no rows")
+        duplicates, duplicate_rows, duplicates_truncated = accumulator.duplicate_hashes()
+    finally:
+        accumulator.close()
+
+    bounds = accumulator.outlier_bounds()
+    outlier_rows = flagged_row_count = 0
+    flagged: List[pd.DataFrame] = []
+    shown = 0
+    if len(duplicates) or bounds is not None or accumulator.invalid_rows:
+        for chunk in iter_ledger_chunks(path, file_format, chunk_rows):
+            duplicate_mask = np.isin(_row_hashes(chunk), duplicates)
+            amounts = np.maximum(chunk["Debit"].to_numpy(), chunk["Credit"].to_numpy())
+            outlier_mask = _outlier_mask(amounts, bounds)
+            invalid_mask = _invalid_mask(chunk)
+            flag_mask = duplicate_mask | outlier_mask | invalid_mask
+            outlier_rows += int(outlier_mask.sum())
+            flagged_row_count += int(flag_mask.sum())
+            if shown < LEDGER_MAX_FLAGGED_ROWS:
+                rows = _flagged_rows(
+                    chunk,
+                    {"duplicate": duplicate_mask, "outlier": outlier_mask, "invalid": invalid_mask},
+                    LEDGER_MAX_FLAGGED_ROWS - shown,
+                )
+                shown += len(rows)
+                flagged.append(rows)
+
+    return _report(
+        rows=accumulator.rows,
+        total_debit=accumulator.total_debit,
+        total_credit=accumulator.total_credit,
+        by_account=accumulator.balances(accumulator.by_account),
+        by_date=accumulator.balances(accumulator.by_date),
+        duplicate_rows=duplicate_rows,
+        outlier_rows=outlier_rows,
+        invalid_rows=accumulator.invalid_rows,
+        flagged_row_count=flagged_row_count,
+        flagged=pd.concat(flagged) if flagged else pd.DataFrame(columns=LEDGER_COLUMNS + ["Flags"]),
+        duplicates_truncated=duplicates_truncated,
+    )
+
+def _markdown_table(rows: List[Dict[str, Any]], columns: List[str]) -> str:
+    if not rows:
+        return "_None_"
+    lines = ["| " + " | ".join(columns) + " |", "|" + "---|" * len(columns)]
+    for row in rows:
+        cells = []
+        for column in columns:
+            value = row.get(column, "")
+            cells.append(f"{value:,.2f}" if isinstance(value, float) else str(value))
+        lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines)
+
+def format_report(report: Dict[str, Any]) -> str:
+    """
+    Render the reconciliation report as compact Markdown (used both in the prompt and the output).
+    """
+    status = "✅ Balanced" if report["balanced"] else "⚠️ Not balanced"
+    sections = [
+        f"**Status:** {status}",
+        f"- Rows: {report['rows']:,} across {report['accounts']:,} accounts and {report['days']:,} days",
+        f"- Total debits: {report['total_debit']:,.2f}",
+        f"- Total credits: {report['total_credit']:,.2f}",
+        f"- Difference (debits - credits): {report['difference']:,.2f}",
+        f"- Unbalanced days: {report['unbalanced_day_count']:,}",
+        f"- Duplicate rows: {report['duplicate_rows']:,} | Outliers: {report['outlier_rows']:,} | Invalid rows: {report['invalid_rows']:,}",
+        "",
+        f"**Account balances** (top {len(report['account_balances'])} by absolute net):",
+        _markdown_table(report["account_balances"], ["Account", "debit", "credit", "net", "entries"]),
+        "",
+        f"**Unbalanced days** (top {len(report['unbalanced_days'])} by absolute net):",
+        _markdown_table(report["unbalanced_days"], ["Date", "debit", "credit", "net", "entries"]),
+        "",
+        *(["_Too many distinct duplicated rows: not every duplicate is flagged below._", ""] if report.get("duplicates_truncated") else []),
+        f"**Flagged rows** (showing {len(report['flagged_rows'])} of {report['flagged_row_count']:,}):",
+        _markdown_table(report["flagged_rows"], LEDGER_COLUMNS + ["Flags"]),
+    ]
+    return "\n".join(sections)
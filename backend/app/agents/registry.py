@@ -0,0 +1,87 @@
+import importlib
+import inspect
+import threading
+from typing import Dict, Iterator, Mapping
+
+from app.agents.base import AgentMetadata, BaseAgent
+from app.core.validation import InputValidator
+
+# agent id -> "module:ClassName". Add new agents here as they are migrated.
+AGENT_SPECS = {
+    "financial-advisor": "app.agents.financial_advisor:FinancialAdvisorAgent",
+    "ledger-agent": "app.agents.ledger_agent:LedgerAgent",
+    "code-review-agent": "app.agents.code_review_agent:CodeReviewAgent",
+    "seo-agent": "app.agents.seo_optimization_agent:SeoOptimizationAgent",
+    "business-strategy-advisor": "app.agents.business_strategy_advisor:BusinessStrategyAdvisor",
+}
+
+class AgentRegistry(Mapping):
+    """
+    Read-only mapping of agent id -> agent instance that builds agents on first use.
+
+    Ids are known up front; an agent's class is imported only when its metadata
+    or instance is first requested, and the instance is created once. Agent
+    modules keep heavy dependencies (pandas, provider SDKs) out of module scope,
+    so reading metadata stays cheap. The agent's inputs_schema is compiled into
+    an InputValidator when its class is loaded.
+    """
+
+    def __init__(self, specs: Dict[str, str]):
+        self._specs = dict(specs)
+        self._classes: Dict[str, type] = {}
+        self._validators: Dict[str, InputValidator] = {}
+        self._instances: Dict[str, BaseAgent] = {}
+        self._lock = threading.Lock()
+
+    def _load_class(self, agent_id: str) -> type:
+        cls = self._classes.get(agent_id)
+        if cls is None:
+            module_name, class_name = self._specs[agent_id].split(":")
+            cls = getattr(importlib.import_module(module_name), class_name)
+            if cls.agent_id != agent_id:
+                raise ValueError(f"Agent class {class_name} declares id '{cls.agent_id}', registered as '{agent_id}'")
+            if inspect.isabstract(cls):
+                missing = ", ".join(sorted(cls.__abstractmethods__))
+                raise TypeError(f"Agent class {class_name} does not implement: {missing}")
+            self._validators[agent_id] = InputValidator(agent_id, cls.metadata.inputs_schema)
+            self._classes[agent_id] = cls
+        return cls
+
+    def metadata(self, agent_id: str) -> AgentMetadata:
+        return self._load_class(agent_id).metadata
+
+    def validator(self, agent_id: str) -> InputValidator:
+        self._load_class(agent_id)
+        return self._validators[agent_id]
+
+    def __getitem__(self, agent_id: str) -> BaseAgent:
+        instance = self._instances.get(agent_id)
+        if instance is not None:
+            return instance
+        if agent_id not in self._specs:
+            raise KeyError(agent_id)
+        with self._lock:
+            instance = self._instances.get(agent_id)
+            if instance is None:
+                instance = self._load_class(agent_id)()
+                self._instances[agent_id] = instance
+        return instance
+
+    def __contains__(self, agent_id: object) -> bool:
+        return agent_id in self._specs
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._specs)
+
+    def __len__(self) -> int:
+        return len(self._specs)
+
+    def load_all(self) -> None:
+        """
+        Eagerly instantiate every agent (used to compare against lazy startup).
+        """
+        for agent_id in self._specs:
+            self[agent_id]
+
+    def loaded(self) -> Dict[str, bool]:
+        return {agent_id: agent_id in self._instances for agent_id in self._specs}
@@ -1,43 +1,14 @@
-from typing import Dict, Any
+import os
+from typing import Dict, Any, List
 from langchain_core.prompts import PromptTemplate
-from app.core.llm import LLMSettings
-from app.agents.base import BaseAgent, AgentMetadata
-
-class SeoOptimizationAgent(BaseAgent):
-    @property
-    def metadata(self) -> AgentMetadata:
-        return AgentMetadata(
-            name="AI-powered SEO Optimization Agent",
-            description="Analyzes content and provides SEO improvements like keywords, meta descriptions, and title tags.",
-            category="Marketing",
-            inputs_schema={
-                "type": "object",
-                "properties": {
-                    "content": {
-                        "type": "string",
-                        "description": "The web content or article to analyze"
-                    },
-                    "target_keyword": {
-                        "type": "string",
-                        "description": "The primary keyword to target"
-                    }
-                },
-                "required": ["content", "target_keyword"]
-            }
-        )
-
-    async def run(self, inputs: Dict[str, Any], llm_settings: LLMSettings, callbacks: list = None) -> str:
-        content = inputs.get("content", "")
-        keyword = inputs.get("target_keyword", "")
-        
-        template = """
-You are an SEO optimization expert.
-
-Given the following content:
-{content}
+from app.core.chunking import Chunk, split_markdown
+from app.agents.base import AgentMetadata
+from app.agents.chunked import ChunkedAgent
 
-And the target keyword: "{keyword}"
+# Longer articles are rejected before any LLM call (they are chunked up to this size)
+SEO_MAX_CONTENT_CHARS = int(os.getenv("SEO_MAX_CONTENT_CHARS", "200000"))
 
+OUTPUT_FORMAT = """
 Provide your analysis in the following Markdown format:
 
 ## 🏷️ Optimized Metadata
@@ -53,10 +24,115 @@ Provide your analysis in the following Markdown format:
 ## 🚀 Semantic Keywords
 *List related keywords to include.*
 """
-        prompt = PromptTemplate.from_template(template)
-        formatted_prompt = prompt.format(content=content, keyword=keyword)
-        
-        llm = self.get_llm(llm_settings, callbacks=callbacks)
-        response = await llm.ainvoke(formatted_prompt)
-        
-        return response.content
+
+# The instructions and output format are the static system prefix; the article and
+# keyword follow in the human message
+SYSTEM_PROMPT = """
+You are an SEO optimization expert. The user gives you a piece of content and the
+keyword it should rank for.
+""" + OUTPUT_FORMAT
+
+TEMPLATE = """
+Target keyword: "{keyword}"
+
+Content:
+{content}
+"""
+
+# Long articles: each section is analyzed on its own, then the notes are merged
+MAP_SYSTEM_PROMPT = """
+You are an SEO optimization expert analyzing one part of a longer article. The user gives
+you the part, where it sits in the article and the target keyword.
+
+Report on this part only, under these headings:
+
+## 📝 Summary
+*Two or three sentences on what this part covers.*
+
+## 🔑 Keyword Analysis
+*Occurrences of the keyword, where they appear (headings, opening, body) and how natural they read.*
+
+## 📄 Content Suggestions
+*Concrete improvements for headings, semantic richness and readability in this part.*
+
+## 🚀 Semantic Keywords
+*Related keywords that fit this part.*
+"""
+
+MAP_TEMPLATE = """
+Part {part} of {total} ({label}). Target keyword: "{keyword}"
+
+Content:
+{content}
+"""
+
+REDUCE_SYSTEM_PROMPT = """
+You are an SEO optimization expert. A long article was analyzed in parts for a target
+keyword; the user gives you the notes for each part.
+
+Combine them into one analysis of the whole article: base the metadata on the overall
+summary, aggregate keyword usage across parts, and remove duplicate suggestions.
+""" + OUTPUT_FORMAT
+
+REDUCE_TEMPLATE = """
+The article was analyzed in {total} parts for the target keyword "{keyword}".
+
+{findings}
+"""
+
+class SeoOptimizationAgent(ChunkedAgent):
+    agent_id = "seo-agent"
+    system_prompt = SYSTEM_PROMPT
+    prompt = PromptTemplate.from_template(TEMPLATE)
+    map_system_prompt = MAP_SYSTEM_PROMPT
+    map_prompt = PromptTemplate.from_template(MAP_TEMPLATE)
+    reduce_system_prompt = REDUCE_SYSTEM_PROMPT
+    reduce_prompt = PromptTemplate.from_template(REDUCE_TEMPLATE)
+    chunk_input = "content"
+
+    metadata = AgentMetadata(
+        name="AI-powered SEO Optimization Agent",
+        description="Analyzes content and provides SEO improvements like keywords, meta descriptions, and title tags.",
+        category="Marketing",
+        doc="47.md",
+        inputs_schema={
+            "type": "object",
+            "properties": {
+                "content": {
+                    "type": "string",
+                    "minLength": 1,
+                    "maxLength": SEO_MAX_CONTENT_CHARS,
+                    "description": "The web content or article to analyze"
+                },
+                "target_keyword": {
+                    "type": "string",
+                    "maxLength": 200,
+                    "description": "The primary keyword to target"
+                }
+            },
+            "required": ["content", "target_keyword"]
+        }
+    )
+
+    def build_prompt(self, inputs: Dict[str, Any]) -> str:
+        content = inputs.get("content", "")
+        keyword = inputs.get("target_keyword", "")
+
+        return self.prompt.format(content=content, keyword=keyword)
+
+    def split(self, text: str) -> List[Chunk]:
+        # Split on headings, then paragraphs
+        return split_markdown(text, self.chunk_tokens)
+
+    def map_variables(self, inputs: Dict[str, Any], chunk: Chunk, index: int, total: int) -> Dict[str, Any]:
+        label, content = chunk
+        return {
+            "part": index + 1,
+            "total": total,
+            "label": label,
+            "keyword": inputs.get("target_keyword", ""),
+            "content": content,
+        }
+
+    def reduce_variables(self, inputs: Dict[str, Any], findings: str, total: int) -> Dict[str, Any]:
+        return {"keyword": inputs.get("target_keyword", ""), "total": total, "findings": findings}
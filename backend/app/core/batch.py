@@ -0,0 +1,113 @@
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterator, Dict, List
+
+from app.core.llm import LLMSettings
+from app.core.logger import logger
+
+BATCH_DEFAULT_CONCURRENCY = int(os.getenv("BATCH_DEFAULT_CONCURRENCY", "4"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "16"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))
+
+USAGE_FIELDS = ("total_tokens", "prompt_tokens", "completion_tokens", "cached_tokens", "successful_requests")
+
+def clamp_concurrency(concurrency: int = None) -> int:
+    if not concurrency:
+        return BATCH_DEFAULT_CONCURRENCY
+    return max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+
+# Results served without calling the model; the usage ledger records them at zero cost
+REUSED_CACHE_STATES = ("hit", "coalesced")
+
+def aggregate_usage(results: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Tokens actually spent by `results`. Cache hits, coalesced runs and reused pipeline
+    steps repeat the usage of the run that served them, so they are only counted in
+    "reused_runs".
+    """
+    totals = {field: 0 for field in USAGE_FIELDS}
+    totals["reused_runs"] = 0
+    for result in results:
+        if result.get("cache") in REUSED_CACHE_STATES or "reused_from" in result:
+            totals["reused_runs"] += 1
+            continue
+        usage = result.get("usage") or {}
+        for field in USAGE_FIELDS:
+            totals[field] += usage.get(field, 0) or 0
+    return totals
+
+async def _run_item(agent, index: int, inputs: Dict[str, Any], llm_settings: LLMSettings, semaphore: asyncio.Semaphore, **execute_kwargs) -> Dict[str, Any]:
+    """
+    Runs one batch item. Failures are captured in the item result instead of propagating.
+    """
+    async with semaphore:
+        started = time.perf_counter()
+        try:
+            result = await agent.execute(inputs, llm_settings, **execute_kwargs)
+            return {
+                "index": index,
+                "status": "success",
+                "output": result["output"],
+                "usage": result["usage"],
+                "cache": result.get("cache"),
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+            }
+        except Exception as e:
+            logger.warning(f"Batch item {index} failed: {e}")
+            return {
+                "index": index,
+                "status": "timeout" if isinstance(e, asyncio.TimeoutError) else "error",
+                "error": str(e),
+                "error_type": type(e).__name__,
+                "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+            }
+
+def _summary(results: List[Dict[str, Any]], started: float) -> Dict[str, Any]:
+    succeeded = sum(1 for r in results if r["status"] == "success")
+    return {
+        "total": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "timed_out": sum(1 for r in results if r["status"] == "timeout"),
+        "usage": aggregate_usage(results),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+async def run_batch(agent, items: List[Dict[str, Any]], llm_settings: LLMSettings, concurrency: int = None, **execute_kwargs) -> Dict[str, Any]:
+    """
+    Fans `items` out over `agent.execute` with at most `concurrency` runs in flight.
+    Results are returned in input order.
+    """
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(clamp_concurrency(concurrency))
+    results = await asyncio.gather(*(
+        _run_item(agent, index, inputs, llm_settings, semaphore, **execute_kwargs)
+        for index, inputs in enumerate(items)
+    ))
+    return {"results": list(results), **_summary(results, started)}
+
+async def stream_batch(agent, items: List[Dict[str, Any]], llm_settings: LLMSettings, concurrency: int = None, **execute_kwargs) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Same as run_batch but yields each item result as soon as it completes,
+    followed by a final summary event.
+    """
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(clamp_concurrency(concurrency))
+    tasks = [
+        asyncio.create_task(_run_item(agent, index, inputs, llm_settings, semaphore, **execute_kwargs))
+        for index, inputs in enumerate(items)
+    ]
+    results = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            result = await next_done
+            results.append(result)
+            yield {"type": "item", **result}
+    finally:
+        # Client went away mid-stream: don't leave orphaned LLM calls running
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+    yield {"type": "summary", **_summary(results, started)}
@@ -0,0 +1,193 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.logger import logger
+from app.core.storage import connect_sqlite, data_path
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1").lower() in ("1", "true", "yes")
+# Only runs at or below this temperature are considered deterministic enough to cache
+RESPONSE_CACHE_MAX_TEMPERATURE = float(os.getenv("RESPONSE_CACHE_MAX_TEMPERATURE", "0"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(24 * 3600)))
+RESPONSE_CACHE_MEMORY_ENTRIES = int(os.getenv("RESPONSE_CACHE_MEMORY_ENTRIES", "512"))
+RESPONSE_CACHE_DISK_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_DISK_MAX_BYTES", str(256 * 1024 * 1024)))
+RESPONSE_CACHE_DB = os.getenv("RESPONSE_CACHE_DB") or data_path("response_cache.db")
+
+def make_cache_key(agent_id: str, prompt: str, provider: str, model_name: str, temperature: float) -> str:
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    raw = f"{agent_id}\x1f{prompt_hash}\x1f{provider}\x1f{model_name}\x1f{temperature!r}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    Two-tier cache for agent results: a bounded in-process LRU in front of a
+    persistent SQLite (WAL) store. Entries expire after `ttl` seconds; the disk
+    tier is trimmed oldest-first once it grows past `disk_max_bytes`.
+    """
+
+    def __init__(
+        self,
+        db_path: str = RESPONSE_CACHE_DB,
+        ttl: float = RESPONSE_CACHE_TTL,
+        memory_entries: int = RESPONSE_CACHE_MEMORY_ENTRIES,
+        disk_max_bytes: int = RESPONSE_CACHE_DISK_MAX_BYTES,
+    ):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.memory_entries = memory_entries
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._memory_lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._conn = None
+        # SQLite connections must not cross fork; pre-forked workers open their own
+        os.register_at_fork(after_in_child=self._after_fork)
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def _after_fork(self) -> None:
+        self._conn = None
+        self._db_lock = threading.Lock()
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = connect_sqlite(self.db_path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " created_at REAL NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " value TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_created_at ON responses(created_at)")
+        return self._conn
+
+    # -- memory tier -------------------------------------------------------
+
+    def _memory_get(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+        with self._memory_lock:
+            item = self._memory.get(key)
+            if item is None:
+                return None
+            created_at, value = item
+            if now - created_at > self.ttl:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return value
+
+    def _memory_put(self, key: str, value: Dict[str, Any], created_at: float) -> None:
+        with self._memory_lock:
+            self._memory[key] = (created_at, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    # -- disk tier (blocking, run via asyncio.to_thread) -------------------
+
+    def _disk_get(self, key: str, now: float) -> Optional[Tuple[float, Dict[str, Any]]]:
+        with self._db_lock:
+            row = self._db().execute("SELECT created_at, value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            created_at, value = row
+            if now - created_at > self.ttl:
+                self._db().execute("DELETE FROM responses WHERE key = ?", (key,))
+                return None
+            return created_at, json.loads(value)
+
+    def _disk_put(self, key: str, value: Dict[str, Any], created_at: float) -> None:
+        payload = json.dumps(value, ensure_ascii=False)
+        with self._db_lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO responses (key, created_at, size, value) VALUES (?, ?, ?, ?)",
+                (key, created_at, len(payload), payload),
+            )
+            self._trim_locked(db, created_at)
+
+    def _trim_locked(self, db, now: float) -> None:
+        cursor = db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        self.evictions += max(cursor.rowcount, 0)
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.disk_max_bytes:
+            return
+        # Drop the oldest rows until we are back under ~90% of the budget
+        excess = total - int(self.disk_max_bytes * 0.9)
+        freed = 0
+        stale = []
+        for key, size in db.execute("SELECT key, size FROM responses ORDER BY created_at"):
+            stale.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        db.executemany("DELETE FROM responses WHERE key = ?", stale)
+        self.evictions += len(stale)
+
+    def _disk_clear(self) -> None:
+        with self._db_lock:
+            self._db().execute("DELETE FROM responses")
+
+    # -- public API --------------------------------------------------------
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        value = self._memory_get(key, now)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+
+        try:
+            item = await asyncio.to_thread(self._disk_get, key, now)
+        except Exception as e:
+            logger.warning(f"Response cache read failed: {e}")
+            item = None
+        if item is None:
+            self.misses += 1
+            return None
+
+        created_at, value = item
+        self._memory_put(key, value, created_at)
+        self.disk_hits += 1
+        return value
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        now = time.time()
+        self._memory_put(key, value, now)
+        self.writes += 1
+        try:
+            await asyncio.to_thread(self._disk_put, key, value, now)
+        except Exception as e:
+            logger.warning(f"Response cache write failed: {e}")
+
+    async def clear(self) -> None:
+        with self._memory_lock:
+            self._memory.clear()
+        await asyncio.to_thread(self._disk_clear)
+
+    def stats(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        with self._memory_lock:
+            memory_size = len(self._memory)
+        return {
+            "enabled": RESPONSE_CACHE_ENABLED,
+            "memory_entries": memory_size,
+            "memory_max_entries": self.memory_entries,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "hit_ratio": round(hits / lookups, 4) if lookups else 0.0,
+        }
+
+response_cache = ResponseCache()
@@ -1,26 +1,95 @@
+import time
 from typing import Any, Dict, List, Optional
 from uuid import UUID
 
 from langchain_core.callbacks import BaseCallbackHandler
 from langchain_core.outputs import LLMResult
 
+from app.core.metrics import LLM_LATENCY, LLM_TOKENS, TIME_TO_FIRST_TOKEN, TOKENS_PER_SECOND
+from app.core.usage import extract_token_usage
+
+def _chars(content: Any) -> int:
+    if isinstance(content, str):
+        return len(content)
+    if isinstance(content, list):
+        # Multimodal content parts
+        return sum(len(part.get("text", "")) if isinstance(part, dict) else len(str(part)) for part in content)
+    return 0
+
 class UsageTrackingHandler(BaseCallbackHandler):
-    def __init__(self):
+    # Handle events on the event loop; the default runs every event (including
+    # each streamed token) through the thread pool
+    run_inline = True
+
+    def __init__(self, provider: str = "unknown", model_name: str = "unknown"):
         self.total_tokens = 0
         self.prompt_tokens = 0
         self.completion_tokens = 0
+        # Prompt tokens the provider read from its prompt (prefix) cache
+        self.cached_tokens = 0
         self.successful_requests = 0
+        # True once any call's counts had to be estimated (no usage reported, e.g. streams)
+        self.estimated = False
+        self.labels = (provider, model_name)
+        # run_id -> [started, first token time or None, streamed chunks, prompt chars, streamed chars]
+        self._calls: Dict[UUID, List[Any]] = {}
+
+    def _start(self, run_id: UUID, prompt_chars: int) -> None:
+        self._calls[run_id] = [time.perf_counter(), None, 0, prompt_chars, 0]
 
     def on_llm_start(
-        self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any
+        self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any
     ) -> None:
-        pass
+        self._start(run_id, sum(len(prompt) for prompt in prompts))
 
-    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+    def on_chat_model_start(
+        self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any
+    ) -> None:
+        # Implemented so langchain does not render the messages to a string for on_llm_start
+        self._start(run_id, sum(_chars(message.content) for batch in messages for message in batch))
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        call = self._calls.get(run_id)
+        if call is None:
+            return
+        if call[1] is None:
+            call[1] = time.perf_counter()
+            TIME_TO_FIRST_TOKEN.observe(call[1] - call[0], *self.labels)
+        call[2] += 1
+        call[4] += len(token)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: Optional[UUID] = None, **kwargs: Any) -> None:
         self.successful_requests += 1
-        if response.llm_output:
-            token_usage = response.llm_output.get("token_usage")
-            if token_usage:
-                self.total_tokens += token_usage.get("total_tokens", 0)
-                self.prompt_tokens += token_usage.get("prompt_tokens", 0)
-                self.completion_tokens += token_usage.get("completion_tokens", 0)
+        call = self._calls.pop(run_id, None)
+        counts = extract_token_usage(response)
+        if counts is None and call is not None:
+            # No usage from the provider: estimate at ~4 characters per token
+            generated_chars = call[4] or sum(
+                _chars(getattr(generation, "text", "")) for generations in response.generations for generation in generations
+            )
+            prompt_tokens, completion_tokens = call[3] // 4, generated_chars // 4
+            counts = (prompt_tokens, completion_tokens, prompt_tokens + completion_tokens, 0)
+            self.estimated = True
+        prompt_tokens, completion_tokens, total_tokens, cached_tokens = counts or (0, 0, 0, 0)
+        self.total_tokens += total_tokens
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.cached_tokens += cached_tokens
+        LLM_TOKENS.inc(*self.labels, "prompt", amount=prompt_tokens)
+        LLM_TOKENS.inc(*self.labels, "completion", amount=completion_tokens)
+        if cached_tokens:
+            LLM_TOKENS.inc(*self.labels, "cached", amount=cached_tokens)
+
+        if call is None:
+            return
+        started, first_token, streamed = call[:3]
+        now = time.perf_counter()
+        LLM_LATENCY.observe(now - started, *self.labels)
+        # One streamed chunk is roughly one token
+        generated = streamed or completion_tokens
+        generation_time = now - (first_token or started)
+        if generated and generation_time > 0:
+            TOKENS_PER_SECOND.observe(generated / generation_time, *self.labels)
+
+    def on_llm_error(self, error: BaseException, *, run_id: Optional[UUID] = None, **kwargs: Any) -> None:
+        self._calls.pop(run_id, None)
@@ -0,0 +1,374 @@
+import bisect
+import hashlib
+import json
+import math
+import os
+import re
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.logger import logger
+from app.core.storage import data_path
+
+# Agent documentation (agents/<n>.md at the repository root)
+AGENT_DOCS_DIR = os.getenv("AGENT_DOCS_DIR", os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))), "agents",
+))
+CATALOG_INDEX = os.getenv("CATALOG_INDEX") or data_path("agent_catalog.json")
+# Seconds between checks of the docs directory for changed files
+CATALOG_REFRESH_INTERVAL = float(os.getenv("CATALOG_REFRESH_INTERVAL", "30"))
+CATALOG_MAX_PAGE = 100
+
+INDEX_VERSION = 1
+
+# Per-field weight of a matching term
+FIELD_WEIGHTS = {"title": 4.0, "capabilities": 1.5, "description": 1.0, "tech_stack": 1.0}
+# Categories are indexed when the search snapshot is built, since a registered agent's
+# category overrides the doc's
+CATEGORY_WEIGHT = 3.0
+# A query term that only matches as a prefix ("fin" -> "financial") scores this fraction
+PREFIX_WEIGHT = 0.5
+
+# The docs are numbered in blocks of ten per business domain; used when a doc does not
+# declare a "Category:" line and is not implemented by a registered agent
+CATEGORY_BLOCKS = [
+    (10, "Finance"),
+    (20, "HR"),
+    (30, "Procurement"),
+    (40, "Sales"),
+    (50, "Marketing"),
+    (60, "IT"),
+    (70, "Customer Service"),
+    (80, "Operations"),
+    (90, "Legal & Compliance"),
+    (100, "Business"),
+]
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from how in into is of on or the this to using via with will you your".split()
+)
+
+TITLE_RE = re.compile(r"^##\s+(?:.*?)?\*\*Agent #(\d+):\s+(.*?)\*\*", re.MULTILINE)
+CATEGORY_RE = re.compile(r"^\**Category\**\s*:\s*\**\s*(.+?)\s*$", re.MULTILINE | re.IGNORECASE)
+BULLET_RE = re.compile(r"^\s*[*-]\s+(.+)$")
+
+def _stem(token: str) -> str:
+    # Plural folding only ("agents" -> "agent"); applied to documents and queries alike
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(token) for token in re.findall(r"[a-z0-9]+", text.lower()) if token not in STOPWORDS]
+
+def _plain(text: str) -> str:
+    return re.sub(r"[*_`]", "", text).strip()
+
+def _sections(content: str) -> Dict[str, List[str]]:
+    """
+    Lines under each "### Heading", keyed by the heading without emoji or markup.
+    """
+    sections: Dict[str, List[str]] = {}
+    current: Optional[List[str]] = None
+    for line in content.splitlines():
+        if line.startswith("### "):
+            name = re.sub(r"[^a-z0-9 &/-]", "", line[4:].lower()).strip()
+            current = sections.setdefault(name, [])
+        elif line.startswith("## ") or line.strip() == "---":
+            current = None
+        elif current is not None:
+            current.append(line)
+    return sections
+
+def _bullets(lines: List[str]) -> List[str]:
+    return [_plain(match.group(1)) for match in map(BULLET_RE.match, lines) if match]
+
+def _category(number: Optional[int]) -> str:
+    if number is not None:
+        for last, name in CATEGORY_BLOCKS:
+            if number <= last:
+                return name
+    return "General"
+
+def parse_agent_doc(filename: str, content: str) -> Dict[str, Any]:
+    """
+    Title, number, category, description (the overview), capabilities (the lab
+    objectives) and tech stack of one agents/*.md page.
+    """
+    stem = os.path.splitext(filename)[0]
+    match = TITLE_RE.search(content)
+    if match:
+        number, name = int(match.group(1)), match.group(2).strip()
+    else:
+        number = int(stem) if stem.isdigit() else None
+        heading = next((line for line in content.splitlines() if line.strip().startswith("##")), None)
+        name = _plain(heading.replace("#", "")) if heading else stem
+    title = f"Agent #{number}: {name}" if match else name
+
+    sections = _sections(content)
+    overview = [line.strip() for line in sections.get("overview", []) if line.strip()]
+    declared = CATEGORY_RE.search(content)
+    return {
+        "doc": filename,
+        "number": number,
+        "name": name,
+        "title": title,
+        "category": _plain(declared.group(1)) if declared else _category(number),
+        "description": _plain(" ".join(overview)),
+        "capabilities": _bullets(sections.get("lab objectives", [])),
+        "tech_stack": _bullets(sections.get("tech stack", [])),
+        # An explicit "Category:" line wins over a registered agent's category
+        "_category_declared": declared is not None,
+    }
+
+def _doc_terms(doc: Dict[str, Any]) -> Dict[str, float]:
+    terms: Dict[str, float] = {}
+    for field, weight in FIELD_WEIGHTS.items():
+        value = doc.get(field) or ""
+        counts: Dict[str, int] = {}
+        for token in tokenize(" ".join(value) if isinstance(value, list) else value):
+            counts[token] = counts.get(token, 0) + 1
+        # Sublinear term frequency, so long overviews don't drown out titles
+        for token, count in counts.items():
+            terms[token] = terms.get(token, 0.0) + weight * (1 + math.log(count))
+    return terms
+
+def _fingerprint(path: str) -> Tuple[int, int]:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+class _Snapshot:
+    """
+    Immutable search structures derived from the persisted index; replaced wholesale on
+    refresh, so searches never see a half-updated index.
+    """
+
+    def __init__(self, docs: Dict[str, Dict[str, Any]], postings: Dict[str, Dict[str, float]], agents: Dict[str, Dict[str, str]]):
+        order = sorted(docs, key=lambda name: (docs[name]["number"] is None, docs[name]["number"] or 0, name))
+        self.docs = []
+        for name in order:
+            doc = dict(docs[name])
+            registered = agents.get(name)
+            doc["agent_id"] = registered["agent_id"] if registered else None
+            if registered and not doc["_category_declared"]:
+                doc["category"] = registered["category"]
+            self.docs.append(doc)
+        position = {name: i for i, name in enumerate(order)}
+        merged = {term: dict(entries) for term, entries in postings.items()}
+        for doc in self.docs:
+            for term in set(tokenize(doc["category"])):
+                entries = merged.setdefault(term, {})
+                entries[doc["doc"]] = entries.get(doc["doc"], 0.0) + CATEGORY_WEIGHT
+        total = len(order)
+        # term -> [(doc position, weight * idf)]
+        self.postings = {
+            term: [(position[name], weight * math.log(1 + total / len(entries))) for name, weight in entries.items()]
+            for term, entries in merged.items()
+        }
+        self.vocabulary = sorted(self.postings)
+
+    def _matches(self, token: str) -> Dict[int, float]:
+        scores: Dict[int, float] = {}
+        for i in range(bisect.bisect_left(self.vocabulary, token), len(self.vocabulary)):
+            term = self.vocabulary[i]
+            if not term.startswith(token):
+                break
+            factor = 1.0 if term == token else PREFIX_WEIGHT
+            for position, weight in self.postings[term]:
+                # A document matching several expansions counts its best one
+                scores[position] = max(scores.get(position, 0.0), weight * factor)
+        return scores
+
+    def search(self, query: str, category: Optional[str], runnable: bool, offset: int, limit: int) -> Dict[str, Any]:
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if tokens:
+            # Every query term must match (as a word or a word prefix)
+            scores: Optional[Dict[int, float]] = None
+            for token in tokens:
+                matches = self._matches(token)
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {position: score + matches[position] for position, score in scores.items() if position in matches}
+                if not scores:
+                    break
+            ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        else:
+            ranked = [(position, 0.0) for position in range(len(self.docs))]
+        if runnable:
+            ranked = [item for item in ranked if self.docs[item[0]]["agent_id"]]
+
+        # Facet counts before the category filter, for the sidebar's category chips
+        facets: Dict[str, int] = {}
+        for position, _ in ranked:
+            name = self.docs[position]["category"]
+            facets[name] = facets.get(name, 0) + 1
+        if category:
+            wanted = category.lower()
+            ranked = [item for item in ranked if self.docs[item[0]]["category"].lower() == wanted]
+
+        results = []
+        for position, score in ranked[offset:offset + limit]:
+            doc = {key: value for key, value in self.docs[position].items() if not key.startswith("_")}
+            doc["score"] = round(score, 4)
+            results.append(doc)
+        return {"total": len(ranked), "offset": offset, "limit": limit, "results": results, "categories": facets}
+
+class AgentCatalog:
+    """
+    Incremental index of the agents/*.md documentation. A refresh re-reads only files
+    whose mtime or size changed and re-parses only those whose content hash changed;
+    the inverted index (term -> doc -> weight) is persisted with the file fingerprints,
+    so a restart with unchanged docs parses nothing.
+    """
+
+    def __init__(self, docs_dir: str = AGENT_DOCS_DIR, index_path: str = CATALOG_INDEX):
+        self.docs_dir = docs_dir
+        self.index_path = index_path
+        # doc file -> {"agent_id", "category"} for docs implemented by registered agents
+        self.agents: Dict[str, Dict[str, str]] = {}
+        self.agents_linked = False
+        self._lock = threading.Lock()
+        self._index: Optional[Dict[str, Any]] = None
+        self._snapshot: Optional[_Snapshot] = None
+        self._checked = 0.0
+        self.parsed_files = 0
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self) -> None:
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Any]:
+        try:
+            with open(self.index_path, encoding="utf-8") as f:
+                index = json.load(f)
+            if index.get("version") == INDEX_VERSION:
+                return index
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable catalog index {self.index_path}: {e}")
+        return {"version": INDEX_VERSION, "files": {}, "docs": {}, "postings": {}}
+
+    def _save(self, index: Dict[str, Any]) -> None:
+        # Write-then-rename: other workers read either the old or the new index
+        directory = os.path.dirname(self.index_path) or "."
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".catalog-", suffix=".json")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.index_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def refresh(self) -> int:
+        """
+        Bring the index up to date with the docs directory. Returns the number of
+        documents added, changed or removed.
+        """
+        with self._lock:
+            index = self._index or self._load()
+            files, docs, postings = index["files"], index["docs"], index["postings"]
+            try:
+                names = sorted(name for name in os.listdir(self.docs_dir) if name.endswith(".md"))
+            except FileNotFoundError:
+                logger.warning(f"Agent docs directory not found: {self.docs_dir}")
+                names = []
+
+            updated: Dict[str, Optional[Dict[str, Any]]] = {}
+            for name in names:
+                path = os.path.join(self.docs_dir, name)
+                mtime_ns, size = _fingerprint(path)
+                known = files.get(name)
+                if known and known["mtime_ns"] == mtime_ns and known["size"] == size:
+                    continue
+                with open(path, "rb") as f:
+                    content = f.read()
+                digest = hashlib.sha256(content).hexdigest()
+                files[name] = {"mtime_ns": mtime_ns, "size": size, "sha256": digest}
+                if known and known["sha256"] == digest:
+                    # Touched but unchanged
+                    continue
+                updated[name] = parse_agent_doc(name, content.decode("utf-8", errors="replace"))
+                self.parsed_files += 1
+            for name in set(files) - set(names):
+                del files[name]
+                updated[name] = None
+
+            if updated:
+                # Drop the old postings of changed and removed docs, then add the new ones
+                for term in list(postings):
+                    entries = postings[term]
+                    for name in updated:
+                        entries.pop(name, None)
+                    if not entries:
+                        del postings[term]
+                for name, doc in updated.items():
+                    if doc is None:
+                        docs.pop(name, None)
+                        continue
+                    docs[name] = doc
+                    for term, weight in _doc_terms(doc).items():
+                        postings.setdefault(term, {})[name] = round(weight, 3)
+            if updated or self._index is None:
+                # Fingerprint-only changes are saved too, so they are not re-hashed next time
+                self._save(index)
+            if updated or self._snapshot is None:
+                self._snapshot = _Snapshot(docs, postings, self.agents)
+            self._index = index
+            self._checked = time.monotonic()
+            if updated:
+                logger.info(f"Agent catalog: reindexed {len(updated)} of {len(names)} docs")
+            return len(updated)
+
+    def due(self) -> bool:
+        return time.monotonic() - self._checked >= CATALOG_REFRESH_INTERVAL
+
+    def link_agents(self, agents: Dict[str, Dict[str, str]]) -> None:
+        """
+        Mark docs implemented by registered agents (doc file -> agent_id and category).
+        """
+        self.agents = dict(agents)
+        self.agents_linked = True
+        with self._lock:
+            if self._index is not None:
+                self._snapshot = _Snapshot(self._index["docs"], self._index["postings"], self.agents)
+
+    def search(
+        self,
+        query: str = "",
+        category: Optional[str] = None,
+        runnable: bool = False,
+        offset: int = 0,
+        limit: int = 20,
+    ) -> Dict[str, Any]:
+        """
+        Ranked, paginated catalog search. Query words match whole words or word prefixes
+        in the title, category, description, capabilities and tech stack; all of them
+        must match. An empty query lists the catalog in agent-number order.
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            self.refresh()
+            snapshot = self._snapshot
+        return snapshot.search(query, category, runnable, offset, min(limit, CATALOG_MAX_PAGE))
+
+    def documents(self) -> List[Dict[str, Any]]:
+        """
+        Every indexed doc, in agent-number order.
+        """
+        if self._snapshot is None:
+            self.refresh()
+        return [{key: value for key, value in doc.items() if not key.startswith("_")} for doc in self._snapshot.docs]
+
+    def stats(self) -> Dict[str, Any]:
+        snapshot = self._snapshot
+        return {
+            "docs": len(snapshot.docs) if snapshot else 0,
+            "terms": len(snapshot.vocabulary) if snapshot else 0,
+            "parsed_files": self.parsed_files,
+            "index_path": self.index_path,
+        }
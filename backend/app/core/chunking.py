@@ -0,0 +1,116 @@
+import os
+import re
+from typing import Callable, List, Tuple
+
+from app.core.rate_limit import estimate_tokens
+
+# Inputs larger than this (estimated tokens) are split into parts reviewed in parallel
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "6000"))
+# Parallel LLM calls per chunked request (the provider scheduler still applies)
+CHUNK_MAX_CONCURRENCY = int(os.getenv("CHUNK_MAX_CONCURRENCY", "4"))
+
+# (label, text); the label names the 1-based line range, e.g. "lines 1-120"
+Chunk = Tuple[str, str]
+# (lines, start, end) -> cut points strictly inside (start, end), coarsest level only
+Boundaries = Callable[[List[str], int, int], List[int]]
+
+_DEFINITION = re.compile(
+    r"(?:async\s+def|def|class|(?:export\s+)?(?:default\s+)?(?:async\s+)?function\*?|"
+    r"(?:export\s+)?(?:abstract\s+)?(?:interface|class|enum|struct|trait|impl|type)|"
+    r"(?:pub(?:\([^)]*\))?\s+)?(?:async\s+)?fn|func|"
+    r"(?:public|private|protected|internal|static|override|virtual)(?:\s+\w+)*\s+\w+\s*\()\b"
+)
+_PREAMBLE = re.compile(r"(?:@|#\[|//|/\*|\*|#(?!!))")
+_HEADING = re.compile(r"(#{1,6})\s|<h([1-6])\b", re.IGNORECASE)
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip(" \t"))
+
+def _text_tokens(lines: List[str], start: int, end: int) -> int:
+    return estimate_tokens("".join(lines[start:end]))
+
+def code_boundaries(lines: List[str], start: int, end: int) -> List[int]:
+    """
+    Cut points before the outermost function/class definitions in lines[start:end].
+    Decorators and comments directly above a definition stay with it.
+    """
+    candidates = [
+        i for i in range(start + 1, end)
+        if lines[i].strip() and _DEFINITION.match(lines[i].lstrip())
+    ]
+    if not candidates:
+        return []
+    level = min(_indent(lines[i]) for i in candidates)
+    cuts = []
+    for i in candidates:
+        if _indent(lines[i]) != level:
+            continue
+        while i - 1 > start and _indent(lines[i - 1]) == level and _PREAMBLE.match(lines[i - 1].lstrip()):
+            i -= 1
+        if not cuts or i > cuts[-1]:
+            cuts.append(i)
+    return cuts
+
+def markdown_boundaries(lines: List[str], start: int, end: int) -> List[int]:
+    """
+    Cut points before the highest-level headings in lines[start:end]
+    (Markdown or HTML); paragraph breaks when there are no headings.
+    """
+    levels = {}
+    for i in range(start + 1, end):
+        match = _HEADING.match(lines[i].lstrip())
+        if match:
+            levels[i] = len(match.group(1)) if match.group(1) else int(match.group(2))
+    if levels:
+        top = min(levels.values())
+        return [i for i, level in levels.items() if level == top]
+    return [i for i in range(start + 1, end) if lines[i].strip() and not lines[i - 1].strip()]
+
+def _segments(lines: List[str], start: int, end: int, max_tokens: int, boundaries: Boundaries) -> List[Tuple[int, int]]:
+    if _text_tokens(lines, start, end) <= max_tokens:
+        return [(start, end)]
+    cuts = boundaries(lines, start, end)
+    if not cuts:
+        # No structure left: fall back to one segment per line, packed later
+        return [(i, i + 1) for i in range(start, end)]
+    edges = [start] + cuts + [end]
+    segments = []
+    for left, right in zip(edges, edges[1:]):
+        segments.extend(_segments(lines, left, right, max_tokens, boundaries))
+    return segments
+
+def split_text(text: str, max_tokens: int, boundaries: Boundaries) -> List[Chunk]:
+    """
+    Split `text` into consecutive chunks of at most ~max_tokens, cutting at the
+    coarsest structural boundaries that fit. Adjacent small pieces are packed
+    together; a single line longer than the budget is split by characters.
+    """
+    lines = text.splitlines(keepends=True)
+    chunks: List[Chunk] = []
+    current_start = current_end = current_tokens = 0
+
+    def flush() -> None:
+        if current_end > current_start:
+            chunks.append((f"lines {current_start + 1}-{current_end}", "".join(lines[current_start:current_end])))
+
+    for start, end in _segments(lines, 0, len(lines), max_tokens, boundaries):
+        tokens = _text_tokens(lines, start, end)
+        if current_end > current_start and current_tokens + tokens > max_tokens:
+            flush()
+            current_start, current_tokens = start, 0
+        current_end = end
+        current_tokens += tokens
+        if tokens > max_tokens:
+            # One very long line (minified code, a wall of text)
+            step = max_tokens * 4
+            for offset in range(0, len(lines[start]), step):
+                chunks.append((f"line {start + 1}", lines[start][offset:offset + step]))
+            current_start, current_tokens = end, 0
+    flush()
+    return chunks
+
+def split_code(code: str, max_tokens: int = CHUNK_MAX_TOKENS) -> List[Chunk]:
+    return split_text(code, max_tokens, code_boundaries)
+
+def split_markdown(content: str, max_tokens: int = CHUNK_MAX_TOKENS) -> List[Chunk]:
+    return split_text(content, max_tokens, markdown_boundaries)
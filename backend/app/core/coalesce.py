@@ -0,0 +1,93 @@
+import asyncio
+import hashlib
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+from app.core.llm import LLMSettings
+
+COALESCE_ENABLED = os.getenv("COALESCE_ENABLED", "1").lower() in ("1", "true", "yes")
+
+def coalesce_key(agent_id: str, inputs: Dict[str, Any], llm_settings: LLMSettings, **options: Any) -> str:
+    """
+    Identity of an agent run: agent, inputs (key order ignored), settings without
+    the API key, and any execution options that change the result.
+    """
+    raw = json.dumps(
+        {
+            "agent": agent_id,
+            "inputs": inputs,
+            "settings": llm_settings.model_dump(exclude={"api_key"}),
+            "options": options,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        default=str,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Task[Any]"):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one shared task.
+
+    The first caller starts the task; callers arriving while it runs wait on the
+    same task and receive its result or exception. Each caller awaits it through
+    `asyncio.shield`, so one caller being cancelled (e.g. a closed browser tab)
+    leaves the call running for the others. The task itself is cancelled only
+    when every caller has gone. Finished calls are forgotten immediately; this is
+    not a cache.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.abandoned = 0
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Run `func()` or join the identical call already in flight.
+        Returns (result, shared) where `shared` is True for joined calls.
+        """
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(func()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _task: self._forget(key, flight))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), shared
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Last interested caller left; nobody will read the result
+                self._forget(key, flight)
+                flight.task.cancel()
+                self.abandoned += 1
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "abandoned": self.abandoned,
+        }
+
+single_flight = SingleFlight()
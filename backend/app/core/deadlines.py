@@ -0,0 +1,95 @@
+import asyncio
+import os
+from typing import Awaitable, Optional, Tuple, TypeVar
+
+from starlette.requests import Request
+
+T = TypeVar("T")
+
+# Seconds an agent run may take end to end, provider queueing and fallbacks included.
+# Overridden per agent with AGENT_TIMEOUT_<AGENT_ID> (e.g. AGENT_TIMEOUT_LEDGER_AGENT=600)
+# and per model with MODEL_TIMEOUT_<MODEL> (e.g. MODEL_TIMEOUT_GPT_4O=120); a request's
+# own `timeout` wins over both, up to AGENT_MAX_TIMEOUT.
+AGENT_TIMEOUT = float(os.getenv("AGENT_TIMEOUT", "300"))
+AGENT_MAX_TIMEOUT = float(os.getenv("AGENT_MAX_TIMEOUT", "1800"))
+
+# Research models routinely take minutes to answer
+DEFAULT_MODEL_TIMEOUTS = {
+    "sonar-deep-research": 900.0,
+    "sonar-reasoning-pro": 600.0,
+}
+
+# Status reported (and used as the HTTP status) when the client went away mid-run
+CLIENT_CLOSED_REQUEST = 499
+
+class AgentTimeout(asyncio.TimeoutError):
+    """
+    An agent run exceeded its deadline. Subclasses TimeoutError so metrics and callers
+    that only know about timeouts still classify it as one.
+    """
+
+    def __init__(self, agent_id: str, timeout: float):
+        super().__init__(f"Agent {agent_id} did not finish within {timeout:g}s")
+        self.agent_id = agent_id
+        self.timeout = timeout
+
+class ClientDisconnected(Exception):
+    pass
+
+def _env_seconds(*parts: str) -> Optional[float]:
+    value = os.getenv("_".join(part.upper().replace("-", "_").replace(".", "_") for part in parts))
+    return float(value) if value else None
+
+def resolve_timeout(agent_id: str, agent_timeout: Optional[float], model_name: str, requested: Optional[float] = None) -> float:
+    """
+    Deadline in seconds for one run: the request's own, else the agent's (environment,
+    then class default), else the model's, else AGENT_TIMEOUT.
+    """
+    if requested is not None:
+        return min(requested, AGENT_MAX_TIMEOUT)
+    for timeout in (
+        _env_seconds("AGENT_TIMEOUT", agent_id),
+        agent_timeout,
+        _env_seconds("MODEL_TIMEOUT", model_name),
+        DEFAULT_MODEL_TIMEOUTS.get(model_name),
+    ):
+        if timeout is not None:
+            return timeout
+    return AGENT_TIMEOUT
+
+async def _wait_for_disconnect(request: Request) -> None:
+    # The body has already been read, so the next message is the disconnect
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T]) -> T:
+    """
+    Await `awaitable`, cancelling it if the HTTP client disconnects first. Plain
+    (non-streaming) endpoints are otherwise not told the client has gone and would
+    keep generating, and paying for, an answer nobody reads.
+    """
+    task = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    try:
+        await asyncio.wait((task, watcher), return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+        watcher.cancel()
+        await asyncio.gather(watcher, return_exceptions=True)
+    if task.cancelled():
+        raise ClientDisconnected("Client disconnected before the run finished")
+    return task.result()
+
+def error_status(error: BaseException) -> Tuple[int, str]:
+    """
+    (HTTP status, status label) for an exception from an agent run.
+    """
+    if isinstance(error, ClientDisconnected):
+        return CLIENT_CLOSED_REQUEST, "cancelled"
+    if isinstance(error, asyncio.TimeoutError):
+        return 504, "timeout"
+    return 500, "error"
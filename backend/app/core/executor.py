@@ -0,0 +1,144 @@
+import asyncio
+import concurrent.futures
+import functools
+import multiprocessing
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from app.core.logger import logger
+from app.core.metrics import CPU_STAGE_DURATION, EVENT_LOOP_LAG
+
+INLINE = "inline"
+THREAD = "thread"
+PROCESS = "process"
+EXECUTOR_KINDS = (INLINE, THREAD, PROCESS)
+
+# Where agents' CPU-bound stages run unless the agent asks for something else
+AGENT_CPU_EXECUTOR = os.getenv("AGENT_CPU_EXECUTOR", THREAD).lower()
+AGENT_THREAD_WORKERS = int(os.getenv("AGENT_THREAD_WORKERS", str(min(8, (os.cpu_count() or 1) + 2))))
+AGENT_PROCESS_WORKERS = int(os.getenv("AGENT_PROCESS_WORKERS", str(max(1, min(4, (os.cpu_count() or 1) - 1)))))
+# The lag monitor schedules a timer this often and records how late it fires
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.25"))
+LOOP_LAG_WARN = float(os.getenv("LOOP_LAG_WARN", "0.2"))
+
+class CpuExecutor:
+    """
+    Runs CPU-bound work away from the event loop, on a thread pool or, for work that
+    holds the GIL (pandas, large string building), on a process pool. Pools are
+    created on first use. Process workers are spawned rather than forked, because
+    the server process already runs background threads; functions and arguments
+    sent to them must be picklable.
+    """
+
+    def __init__(self, thread_workers: int = AGENT_THREAD_WORKERS, process_workers: int = AGENT_PROCESS_WORKERS):
+        self.thread_workers = thread_workers
+        self.process_workers = process_workers
+        self._threads: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._processes: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self.completed = {THREAD: 0, PROCESS: 0}
+
+    def _pool(self, kind: str) -> concurrent.futures.Executor:
+        with self._lock:
+            if kind == PROCESS:
+                if self._processes is None:
+                    self._processes = concurrent.futures.ProcessPoolExecutor(
+                        max_workers=self.process_workers, mp_context=multiprocessing.get_context("spawn"),
+                    )
+                return self._processes
+            if self._threads is None:
+                self._threads = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.thread_workers, thread_name_prefix="agent-cpu",
+                )
+            return self._threads
+
+    async def run(self, kind: str, func: Callable[..., Any], *args: Any, agent: str = "", stage: str = "") -> Any:
+        """
+        Run `func(*args)` on the `kind` executor ("inline" calls it directly).
+        """
+        kind = kind if kind in EXECUTOR_KINDS else AGENT_CPU_EXECUTOR
+        started = time.perf_counter()
+        try:
+            if kind == INLINE:
+                return func(*args)
+            pool = self._pool(kind)
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(pool, functools.partial(func, *args))
+            except concurrent.futures.process.BrokenProcessPool:
+                # A worker died (e.g. OOM); start a fresh pool for later calls
+                with self._lock:
+                    if self._processes is pool:
+                        self._processes = None
+                raise
+            self.completed[kind] += 1
+            return result
+        finally:
+            CPU_STAGE_DURATION.observe(time.perf_counter() - started, agent, stage, kind)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pools, self._threads, self._processes = (self._threads, self._processes), None, None
+        for pool in pools:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "default": AGENT_CPU_EXECUTOR,
+            "thread_workers": self.thread_workers,
+            "process_workers": self.process_workers,
+            "thread_pool_started": self._threads is not None,
+            "process_pool_started": self._processes is not None,
+            "completed": dict(self.completed),
+        }
+
+cpu_executor = CpuExecutor()
+
+class LoopLagMonitor:
+    """
+    Measures event loop responsiveness: a timer is scheduled every `interval`
+    seconds and the delay past its due time is recorded. Anything that blocks the
+    loop (inline CPU work, synchronous I/O) shows up as lag.
+    """
+
+    def __init__(self, interval: float = LOOP_LAG_INTERVAL):
+        self.interval = interval
+        self.last = 0.0
+        self.max = 0.0
+        self.samples = 0
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            due = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - due)
+            self.last = lag
+            self.max = max(self.max, lag)
+            self.samples += 1
+            EVENT_LOOP_LAG.observe(lag)
+            if lag > LOOP_LAG_WARN:
+                logger.warning(f"Event loop blocked for {lag * 1000:.0f} ms")
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "interval_s": self.interval,
+            "last_lag_ms": round(self.last * 1000, 2),
+            "max_lag_ms": round(self.max * 1000, 2),
+            "samples": self.samples,
+        }
+
+loop_lag_monitor = LoopLagMonitor()
@@ -0,0 +1,218 @@
+import asyncio
+import collections
+import os
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+
+from app.core.llm import LLMSettings, provider_for_model
+from app.core.logger import logger
+from app.core.metrics import FALLBACKS
+
+T = TypeVar("T")
+
+# Chains separated by ";", models by ">", e.g. "gemini-2.5-flash>gpt-4o>sonar;gpt-4o>sonar-pro".
+# The first model of a chain names it; the rest are its fallbacks, in order.
+LLM_FALLBACK_CHAINS = os.getenv("LLM_FALLBACK_CHAINS", "")
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "1").lower() in ("1", "true", "yes")
+# A backup request is started once the running attempt passes this quantile of its model's
+# recent latency (time to result for runs, time to first chunk for streams)
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+# At most this many attempts run at once (the primary plus hedges)
+LLM_HEDGE_MAX_PARALLEL = int(os.getenv("LLM_HEDGE_MAX_PARALLEL", "2"))
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+
+def _parse_chains(spec: str) -> Dict[str, List[str]]:
+    chains = {}
+    for chain in spec.split(";"):
+        models = [model.strip() for model in chain.split(">") if model.strip()]
+        if len(models) > 1:
+            chains[models[0]] = models[1:]
+    return chains
+
+FALLBACK_CHAINS = _parse_chains(LLM_FALLBACK_CHAINS)
+
+class LatencyTracker:
+    """
+    Sliding window of recent successful latencies per (provider, model, mode).
+    """
+
+    def __init__(self, window: int = LLM_LATENCY_WINDOW):
+        self.window = window
+        self._samples: Dict[Tuple[str, str, str], Deque[float]] = {}
+
+    def observe(self, settings: LLMSettings, mode: str, seconds: float) -> None:
+        key = (settings.provider, settings.model_name, mode)
+        samples = self._samples.get(key)
+        if samples is None:
+            samples = self._samples[key] = collections.deque(maxlen=self.window)
+        samples.append(seconds)
+
+    def quantile(self, settings: LLMSettings, mode: str, q: float) -> Optional[float]:
+        samples = self._samples.get((settings.provider, settings.model_name, mode))
+        if not samples or len(samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def hedge_delay(self, settings: LLMSettings, mode: str) -> Optional[float]:
+        """
+        Seconds to wait for `settings` before starting a backup, or None to never hedge it.
+        """
+        if not LLM_HEDGE_ENABLED:
+            return None
+        deadline = self.quantile(settings, mode, LLM_HEDGE_QUANTILE)
+        return None if deadline is None else max(LLM_HEDGE_MIN_DELAY, deadline)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            f"{provider}/{model}/{mode}": {
+                "samples": len(samples),
+                "p50_s": round(sorted(samples)[len(samples) // 2], 3),
+                "hedge_after_s": self.hedge_delay(LLMSettings(provider=provider, model_name=model), mode),
+            }
+            for (provider, model, mode), samples in list(self._samples.items())
+        }
+
+latency_tracker = LatencyTracker()
+
+def fallback_chain(settings: LLMSettings) -> List[LLMSettings]:
+    """
+    `settings` followed by the settings of each fallback model. A per-request API key
+    is only reused for fallbacks on the same provider; others use the server's key.
+    """
+    models = settings.fallback_models if settings.fallback_models is not None else FALLBACK_CHAINS.get(settings.model_name, [])
+    chain = [settings]
+    for model_name in models:
+        provider = provider_for_model(model_name)
+        if provider is None:
+            logger.warning(f"Ignoring unknown fallback model: {model_name}")
+            continue
+        if any(entry.model_name == model_name for entry in chain):
+            continue
+        chain.append(LLMSettings(
+            provider=provider,
+            model_name=model_name,
+            temperature=settings.temperature,
+            api_key=settings.api_key if provider == settings.provider else None,
+            fallback_models=[],
+        ))
+    return chain
+
+async def _cancel_all(tasks) -> None:
+    for task in tasks:
+        task.cancel()
+    if tasks:
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+async def _race(
+    chain: List[LLMSettings],
+    mode: str,
+    start: Callable[[LLMSettings], "asyncio.Task[Any]"],
+) -> Tuple[Any, LLMSettings, int]:
+    """
+    Runs attempts down `chain` until one succeeds. The next model is started when an
+    attempt fails, or when the newest attempt passes its hedge deadline while fewer than
+    LLM_HEDGE_MAX_PARALLEL are running. The first success wins and the rest are cancelled.
+    Returns (result, winning settings, attempts started).
+    """
+    pending: Dict["asyncio.Task[Any]", Tuple[LLMSettings, float]] = {}
+    next_index = 0
+    last_error: Optional[BaseException] = None
+
+    def launch(reason: Optional[str]) -> None:
+        nonlocal next_index
+        settings = chain[next_index]
+        next_index += 1
+        if reason:
+            FALLBACKS.inc(settings.provider, settings.model_name, reason)
+            logger.warning(f"Starting {reason} attempt on {settings.provider}/{settings.model_name}")
+        pending[start(settings)] = (settings, time.perf_counter())
+
+    launch(None)
+    try:
+        while pending:
+            timeout = None
+            if next_index < len(chain) and len(pending) < LLM_HEDGE_MAX_PARALLEL:
+                newest, started = max(pending.values(), key=lambda item: item[1])
+                delay = latency_tracker.hedge_delay(newest, mode)
+                if delay is not None:
+                    timeout = max(0.0, started + delay - time.perf_counter())
+
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                launch("hedge")
+                continue
+
+            for task in done:
+                settings, started = pending.pop(task)
+                error = task.exception()
+                if error is None:
+                    latency_tracker.observe(settings, mode, time.perf_counter() - started)
+                    return task.result(), settings, next_index
+                last_error = error
+                logger.warning(f"{settings.provider}/{settings.model_name} failed: {error}")
+
+            if not pending and next_index < len(chain):
+                launch("fallback")
+        raise last_error
+    finally:
+        await _cancel_all(list(pending))
+
+async def run_with_fallback(
+    settings: LLMSettings,
+    attempt: Callable[[LLMSettings], Awaitable[T]],
+) -> Tuple[T, LLMSettings, int]:
+    """
+    Run `attempt(settings)` with fallback and hedging over `fallback_chain(settings)`.
+    Returns (result, settings that produced it, attempts started).
+    """
+    chain = fallback_chain(settings)
+    if len(chain) == 1:
+        return await attempt(settings), settings, 1
+    return await _race(chain, "run", lambda entry: asyncio.ensure_future(attempt(entry)))
+
+async def stream_with_fallback(
+    settings: LLMSettings,
+    open_stream: Callable[[LLMSettings], AsyncIterator[T]],
+) -> Tuple[AsyncIterator[T], LLMSettings, int]:
+    """
+    Streaming counterpart of `run_with_fallback`: the attempts race for their first
+    chunk; once a stream has produced one it is committed to, and later errors are not
+    retried on another model. Returns (stream, settings serving it, attempts started);
+    the returned stream still yields its first chunk.
+    """
+    chain = fallback_chain(settings)
+    if len(chain) == 1:
+        return open_stream(settings), settings, 1
+
+    streams: Dict[str, AsyncIterator[T]] = {}
+    empty = object()
+
+    async def first_chunk(entry: LLMSettings):
+        stream = streams[entry.model_name] = open_stream(entry)
+        try:
+            return await stream.__anext__()
+        except StopAsyncIteration:
+            return empty
+
+    try:
+        first, winner, attempts = await _race(chain, "stream", lambda entry: asyncio.ensure_future(first_chunk(entry)))
+    except BaseException:
+        for stream in streams.values():
+            await stream.aclose()
+        raise
+    # Losing attempts were cancelled mid-chunk; closing releases their provider slots
+    for model_name, stream in streams.items():
+        if model_name != winner.model_name:
+            await stream.aclose()
+
+    async def resumed() -> AsyncIterator[T]:
+        if first is empty:
+            return
+        yield first
+        async for chunk in streams[winner.model_name]:
+            yield chunk
+
+    return resumed(), winner, attempts
@@ -0,0 +1,88 @@
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from google.api_core.exceptions import InvalidArgument
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_google_genai import ChatGoogleGenerativeAI
+from langchain_google_genai.chat_models import ChatGoogleGenerativeAIError, _response_to_result
+
+# Keyword arguments that shape the request rather than being passed to the client call
+REQUEST_OPTIONS = ("tools", "functions", "safety_settings", "tool_config", "generation_config")
+
+def _split_options(kwargs: Dict[str, Any]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    options = {name: kwargs.pop(name) for name in REQUEST_OPTIONS if name in kwargs}
+    return options, kwargs
+
+class SchedulerRetriedGemini(ChatGoogleGenerativeAI):
+    """
+    ChatGoogleGenerativeAI without its built-in retries. langchain-google-genai 1.0.4
+    wraps every call in a tenacity decorator with 10 attempts and up to 60s backoff on
+    429/503, ignoring `max_retries`; that would hide rate limiting from the provider
+    scheduler (app.core.rate_limit), which owns retries and AIMD backoff. These methods
+    are the library's own, calling the Gemini client directly.
+    """
+
+    def _call(self, method, request, **kwargs: Any) -> Any:
+        try:
+            return method(request=request, metadata=self.default_metadata, **kwargs)
+        except InvalidArgument as e:
+            raise ChatGoogleGenerativeAIError(f"Invalid argument provided to Gemini: {e}") from e
+
+    async def _acall(self, method, request, **kwargs: Any) -> Any:
+        try:
+            return await method(request=request, metadata=self.default_metadata, **kwargs)
+        except InvalidArgument as e:
+            raise ChatGoogleGenerativeAIError(f"Invalid argument provided to Gemini: {e}") from e
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        options, kwargs = _split_options(kwargs)
+        request = self._prepare_request(messages, stop=stop, **options)
+        return _response_to_result(self._call(self.client.generate_content, request, **kwargs))
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        options, kwargs = _split_options(kwargs)
+        request = self._prepare_request(messages, stop=stop, **options)
+        return _response_to_result(await self._acall(self.async_client.generate_content, request, **kwargs))
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        options, kwargs = _split_options(kwargs)
+        request = self._prepare_request(messages, stop=stop, **options)
+        for chunk in self._call(self.client.stream_generate_content, request, **kwargs):
+            generation = _response_to_result(chunk, stream=True).generations[0]
+            if run_manager:
+                run_manager.on_llm_new_token(generation.text)
+            yield generation
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        options, kwargs = _split_options(kwargs)
+        request = self._prepare_request(messages, stop=stop, **options)
+        async for chunk in await self._acall(self.async_client.stream_generate_content, request, **kwargs):
+            generation = _response_to_result(chunk, stream=True).generations[0]
+            if run_manager:
+                await run_manager.on_llm_new_token(generation.text)
+            yield generation
@@ -0,0 +1,33 @@
+import hashlib
+import json
+from typing import Any
+
+from fastapi import Request, Response
+
+class PrecomputedJSON:
+    """
+    A JSON payload serialized once, with a strong ETag. `response()` answers
+    conditional requests (If-None-Match) with an empty 304.
+    """
+
+    def __init__(self, payload: Any, max_age: int = 60):
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:32] + '"'
+        self.headers = {
+            "ETag": self.etag,
+            "Cache-Control": f"public, max-age={max_age}, must-revalidate",
+        }
+
+    def matches(self, if_none_match: str) -> bool:
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        # Weak comparison, as RFC 9110 requires for If-None-Match
+        return any(tag.removeprefix("W/") == self.etag for tag in candidates)
+
+    def response(self, request: Request) -> Response:
+        if self.matches(request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=self.headers)
+        return Response(content=self.body, media_type="application/json", headers=self.headers)
@@ -0,0 +1,394 @@
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from app.core.llm import LLMSettings
+from app.core.logger import logger
+from app.core.storage import connect_sqlite, data_path
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(7 * 24 * 3600)))
+JOB_DB = os.getenv("JOB_DB") or data_path("jobs.db")
+# How often a worker process checks for cancellations requested through another process
+JOB_CANCEL_POLL_INTERVAL = float(os.getenv("JOB_CANCEL_POLL_INTERVAL", "1.0"))
+# How often idle workers look in the job table for work queued by other (or dead) processes
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+# Queued jobs a claim looks at when skipping jobs whose API key is held by another process
+JOB_CLAIM_SCAN = int(os.getenv("JOB_CLAIM_SCAN", "50"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMED_OUT = "timed_out"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED, TIMED_OUT)
+
+def _process_alive(pid: Optional[int]) -> bool:
+    if not pid or pid == os.getpid():
+        # This process has only just started, so nothing here is running yet
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+class JobStore:
+    """
+    SQLite-backed job table, shared by all server processes. API keys are never
+    written to disk; they are held in memory only, so a job submitted with its own
+    key cannot resume after a restart.
+    """
+
+    def __init__(self, db_path: str = JOB_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._db()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self) -> None:
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _db(self):
+        if self._conn is not None:
+            return self._conn
+        self._conn = connect_sqlite(self.db_path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " agent_id TEXT NOT NULL,"
+            " inputs TEXT NOT NULL,"
+            " llm_settings TEXT NOT NULL,"
+            " options TEXT NOT NULL,"
+            " has_api_key INTEGER NOT NULL DEFAULT 0,"
+            " status TEXT NOT NULL,"
+            " result TEXT,"
+            " error TEXT,"
+            " created_at REAL NOT NULL,"
+            " started_at REAL,"
+            " finished_at REAL)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        # Added for multi-process servers: which process runs a job, and cross-process cancellation
+        if "worker_pid" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN worker_pid INTEGER")
+        if "cancel_requested" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN cancel_requested INTEGER NOT NULL DEFAULT 0")
+        # Which process accepted the job; only it holds a per-request API key
+        if "submitter_pid" not in columns:
+            self._conn.execute("ALTER TABLE jobs ADD COLUMN submitter_pid INTEGER")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status, created_at)")
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self._lock:
+            return self._db().execute(sql, params).fetchall()
+
+    def insert(self, job_id: str, agent_id: str, inputs: Dict[str, Any], llm_settings: LLMSettings, options: Dict[str, Any]) -> None:
+        self._execute(
+            "INSERT INTO jobs (id, agent_id, inputs, llm_settings, options, has_api_key, status, created_at, submitter_pid)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                job_id,
+                agent_id,
+                json.dumps(inputs),
+                json.dumps(llm_settings.model_dump(exclude={"api_key"})),
+                json.dumps(options),
+                1 if llm_settings.api_key else 0,
+                QUEUED,
+                time.time(),
+                os.getpid(),
+            ),
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._execute(
+            "SELECT id, agent_id, inputs, llm_settings, options, has_api_key, status, result, error,"
+            " created_at, started_at, finished_at FROM jobs WHERE id = ?",
+            (job_id,),
+        )
+        if not rows:
+            return None
+        (job_id, agent_id, inputs, llm_settings, options, has_api_key, status, result, error,
+         created_at, started_at, finished_at) = rows[0]
+        return {
+            "id": job_id,
+            "agent_id": agent_id,
+            "inputs": json.loads(inputs),
+            "llm_settings": json.loads(llm_settings),
+            "options": json.loads(options),
+            "has_api_key": bool(has_api_key),
+            "status": status,
+            "result": json.loads(result) if result else None,
+            "error": error,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+        }
+
+    def claim(self, local_keys: Set[str]) -> Optional[str]:
+        """
+        Atomically move the oldest runnable queued job to "running" under this
+        process and return its id, or None when there is nothing to do. Any server
+        process may claim any job, except one submitted with its own API key while
+        the submitting process (the only holder of the key) is still alive.
+        """
+        pid = os.getpid()
+        while True:
+            rows = self._execute(
+                "SELECT id, has_api_key, submitter_pid FROM jobs WHERE status = ? ORDER BY created_at LIMIT ?",
+                (QUEUED, JOB_CLAIM_SCAN),
+            )
+            job_id = next(
+                (
+                    job_id for job_id, has_api_key, submitter_pid in rows
+                    if not has_api_key or job_id in local_keys
+                    or (submitter_pid != pid and not _process_alive(submitter_pid))
+                ),
+                None,
+            )
+            if job_id is None:
+                return None
+            with self._lock:
+                cursor = self._db().execute(
+                    "UPDATE jobs SET status = ?, started_at = ?, worker_pid = ? WHERE id = ? AND status = ?",
+                    (RUNNING, time.time(), pid, job_id, QUEUED),
+                )
+            if cursor.rowcount == 1:
+                return job_id
+            # Another worker claimed or cancelled it first
+
+    def finish(self, job_id: str, status: str, result: Dict[str, Any] = None, error: str = None) -> None:
+        self._execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+            (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+        )
+
+    def cancel_if_queued(self, job_id: str) -> bool:
+        with self._lock:
+            cursor = self._db().execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (CANCELLED, time.time(), job_id, QUEUED),
+            )
+            return cursor.rowcount == 1
+
+    def request_cancel(self, job_id: str) -> bool:
+        """
+        Flag a running job for cancellation by whichever process runs it.
+        """
+        with self._lock:
+            cursor = self._db().execute(
+                "UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?", (job_id, RUNNING),
+            )
+            return cursor.rowcount == 1
+
+    def cancel_requests(self, worker_pid: int) -> List[str]:
+        rows = self._execute(
+            "SELECT id FROM jobs WHERE status = ? AND cancel_requested = 1 AND worker_pid = ?", (RUNNING, worker_pid),
+        )
+        return [row[0] for row in rows]
+
+    def recover(self) -> int:
+        """
+        Called at startup: jobs interrupted mid-run go back to the queue, stale
+        finished jobs are pruned, and the number of queued jobs is returned.
+        Jobs still running in another live server process are left alone.
+        """
+        rows = self._execute("SELECT id, worker_pid FROM jobs WHERE status = ?", (RUNNING,))
+        orphaned = [(QUEUED, job_id, RUNNING) for job_id, worker_pid in rows if not _process_alive(worker_pid)]
+        with self._lock:
+            self._db().executemany(
+                "UPDATE jobs SET status = ?, started_at = NULL, worker_pid = NULL WHERE id = ? AND status = ?", orphaned,
+            )
+        self._execute(
+            "DELETE FROM jobs WHERE status IN (?, ?, ?, ?) AND finished_at < ?",
+            (*FINISHED_STATES, time.time() - JOB_RETENTION),
+        )
+        return self._execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,))[0][0]
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+        return {status: count for status, count in rows}
+
+class JobQueue:
+    """
+    Runs agent executions in the background on a pool of asyncio workers. The job
+    table is the queue: workers in every server process claim from it, so a job
+    accepted by a process that has since died is still picked up.
+
+    `resolve_agent` maps an agent id to an agent instance (or None).
+    """
+
+    def __init__(self, resolve_agent: Callable[[str], Any], store: JobStore = None, workers: int = JOB_WORKERS):
+        self.resolve_agent = resolve_agent
+        self.store = store or JobStore()
+        self.workers = workers
+        self._wakeup: asyncio.Event = None
+        self._worker_tasks: List[asyncio.Task] = []
+        self._running: Dict[str, asyncio.Task] = {}
+        self._cancel_requested = set()
+        # Per-request API keys live only in memory
+        self._api_keys: Dict[str, str] = {}
+
+    async def start(self) -> None:
+        self._wakeup = asyncio.Event()
+        recovered = await asyncio.to_thread(self.store.recover)
+        self._worker_tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        self._worker_tasks.append(asyncio.create_task(self._watch_cancellations()))
+        logger.info(f"Job queue started with {self.workers} workers ({recovered} recovered jobs)")
+
+    async def stop(self) -> None:
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    async def submit(self, agent_id: str, inputs: Dict[str, Any], llm_settings: LLMSettings, options: Dict[str, Any] = None) -> str:
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(self.store.insert, job_id, agent_id, inputs, llm_settings, options or {})
+        if llm_settings.api_key:
+            self._api_keys[job_id] = llm_settings.api_key
+        self._wakeup.set()
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None:
+            return None
+        return self._public_view(job)
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Cancels a queued or running job. Returns the updated job, or None if unknown.
+        A job running in another process is flagged and reported with `cancel_requested`.
+        """
+        if await asyncio.to_thread(self.store.cancel_if_queued, job_id):
+            self._api_keys.pop(job_id, None)
+        task = self._running.get(job_id)
+        if task is not None:
+            await self._cancel_running(job_id, task)
+        elif await asyncio.to_thread(self.store.request_cancel, job_id):
+            # Running in another server process, which stops it within JOB_CANCEL_POLL_INTERVAL
+            job = await self.get(job_id)
+            if job is not None and job["status"] == RUNNING:
+                job["cancel_requested"] = True
+            return job
+        return await self.get(job_id)
+
+    async def _cancel_running(self, job_id: str, task: asyncio.Task) -> None:
+        self._cancel_requested.add(job_id)
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+
+    async def _watch_cancellations(self) -> None:
+        while True:
+            await asyncio.sleep(JOB_CANCEL_POLL_INTERVAL)
+            if not self._running:
+                continue
+            try:
+                job_ids = await asyncio.to_thread(self.store.cancel_requests, os.getpid())
+            except Exception as e:
+                logger.warning(f"Could not check for job cancellations: {e}")
+                continue
+            for job_id in job_ids:
+                task = self._running.get(job_id)
+                if task is not None:
+                    await self._cancel_running(job_id, task)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "running": len(self._running),
+            "by_status": self.store.counts(),
+        }
+
+    @staticmethod
+    def _public_view(job: Dict[str, Any]) -> Dict[str, Any]:
+        view = {
+            "job_id": job["id"],
+            "agent_id": job["agent_id"],
+            "status": job["status"],
+            "created_at": job["created_at"],
+            "started_at": job["started_at"],
+            "finished_at": job["finished_at"],
+            "queue_wait_ms": None,
+            "execution_ms": None,
+        }
+        if job["started_at"]:
+            view["queue_wait_ms"] = round((job["started_at"] - job["created_at"]) * 1000, 2)
+            if job["finished_at"]:
+                view["execution_ms"] = round((job["finished_at"] - job["started_at"]) * 1000, 2)
+        if job["result"] is not None:
+            view["result"] = job["result"]
+        if job["error"]:
+            view["error"] = job["error"]
+        return view
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            # Cleared before claiming so a submit() during the claim is not missed
+            self._wakeup.clear()
+            try:
+                job_id = await asyncio.to_thread(self.store.claim, set(self._api_keys))
+            except Exception as e:
+                logger.warning(f"Job worker {worker_id} could not claim a job: {e}")
+                job_id = None
+            if job_id is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job worker {worker_id} failed on job {job_id}: {e}", exc_info=True)
+
+    async def _run_job(self, job_id: str) -> None:
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None:
+            return
+
+        api_key = self._api_keys.pop(job_id, None)
+        if job["has_api_key"] and not api_key:
+            await asyncio.to_thread(self.store.finish, job_id, FAILED, None, "API key was not persisted across restart; resubmit the job")
+            return
+
+        agent = self.resolve_agent(job["agent_id"])
+        if agent is None:
+            await asyncio.to_thread(self.store.finish, job_id, FAILED, None, "Agent not found")
+            return
+
+        llm_settings = LLMSettings(**job["llm_settings"], api_key=api_key)
+        task = asyncio.create_task(agent.execute(job["inputs"], llm_settings, **job["options"]))
+        self._running[job_id] = task
+        try:
+            result = await task
+            result["content_type"] = "text/markdown"
+            await asyncio.to_thread(self.store.finish, job_id, SUCCEEDED, result)
+        except asyncio.CancelledError:
+            if job_id not in self._cancel_requested:
+                # Worker shutdown: leave the job "running" so recover() re-queues it on restart
+                raise
+            await asyncio.to_thread(self.store.finish, job_id, CANCELLED)
+        except asyncio.TimeoutError as e:
+            await asyncio.to_thread(self.store.finish, job_id, TIMED_OUT, None, str(e))
+        except Exception as e:
+            await asyncio.to_thread(self.store.finish, job_id, FAILED, None, str(e))
+        finally:
+            self._running.pop(job_id, None)
+            self._cancel_requested.discard(job_id)
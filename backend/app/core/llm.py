@@ -1,44 +1,312 @@
+import hashlib
+import importlib
 import os
-from functools import lru_cache
-from typing import Optional
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
 
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
+# Provider SDKs (openai, httpx, langchain_openai, langchain_google_genai) are imported
+# lazily in LLMProvider._build so they only load for providers that are actually used.
 from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.runnables import Runnable
 from pydantic import BaseModel
 
+from app.core.logger import logger
+
+PERPLEXITY_BASE_URL = "https://api.perplexity.ai"
+# Local OpenAI-compatible stub (benchmarks/stub_llm_server.py), for load tests without tokens
+STUB_BASE_URL = os.getenv("STUB_BASE_URL", "http://127.0.0.1:9100/v1")
+
+# SDK modules each provider's clients need
+PROVIDER_SDK_MODULES = {
+    "openai": ("httpx", "openai", "langchain_openai"),
+    "perplexity": ("httpx", "openai", "langchain_openai"),
+    "stub": ("httpx", "openai", "langchain_openai"),
+    "gemini": ("langchain_google_genai", "app.core.gemini"),
+}
+# Server-side API key of each provider
+PROVIDER_KEY_ENV = {
+    "openai": "OPENAI_API_KEY",
+    "gemini": "GOOGLE_API_KEY",
+    "perplexity": "PERPLEXITY_API_KEY",
+}
+# Providers whose SDKs are imported in a worker thread at startup, so the first request
+# does not import them on the event loop. Defaults to the providers with a server-side
+# key; other SDKs (for requests bringing their own key) stay lazy. Empty preloads nothing.
+_preload = os.getenv("LLM_PRELOAD_SDKS")
+LLM_PRELOAD_SDKS = (
+    [provider for provider, env in PROVIDER_KEY_ENV.items() if os.getenv(env)]
+    if _preload is None
+    else [provider.strip() for provider in _preload.split(",") if provider.strip()]
+)
+
+# Pool tuning (overridable through the environment)
+LLM_POOL_MAX_SIZE = int(os.getenv("LLM_POOL_MAX_SIZE", "32"))
+LLM_POOL_IDLE_TTL = float(os.getenv("LLM_POOL_IDLE_TTL", "900"))
+LLM_HTTP_MAX_CONNECTIONS = int(os.getenv("LLM_HTTP_MAX_CONNECTIONS", "100"))
+LLM_HTTP_MAX_KEEPALIVE = int(os.getenv("LLM_HTTP_MAX_KEEPALIVE", "20"))
+LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("LLM_HTTP_KEEPALIVE_EXPIRY", "60"))
+
+# Supported Models Configuration
+# Updated to use correct model names for Gemini and others
+SUPPORTED_MODELS = {
+    "openai": ["gpt-4o", "gpt-4-turbo", "gpt-3.5-turbo"],
+    "gemini": [ "gemini-2.5-flash", "gemini-2.5-pro", "gemini-flash-latest", "gemini-2.5-flash-lite", "gemma-3-12b"],
+    "perplexity": ["sonar-deep-research", "sonar-reasoning-pro", "sonar-pro", "sonar"],
+}
+
+def provider_for_model(model_name: str) -> Optional[str]:
+    for provider, models in SUPPORTED_MODELS.items():
+        if model_name in models:
+            return provider
+    return None
+
 class LLMSettings(BaseModel):
     model_config = {'protected_namespaces': ()}
     provider: str
     model_name: str
     temperature: float = 0.7
     api_key: Optional[str] = None
+    # Models (from SUPPORTED_MODELS) to try, in order, if this one fails or is slow;
+    # None uses the configured chain for `model_name` (LLM_FALLBACK_CHAINS), [] disables fallback
+    fallback_models: Optional[List[str]] = None
+
+PoolKey = Tuple[str, str, Optional[str], str]
+
+def _key_fingerprint(api_key: Optional[str]) -> str:
+    """
+    Short, non-reversible fingerprint so raw API keys never live in pool keys or logs.
+    """
+    if not api_key:
+        return "none"
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+class _PooledClient:
+    __slots__ = ("llm", "sdk_client", "last_used")
+
+    def __init__(self, llm: BaseChatModel, sdk_client: Any = None):
+        self.llm = llm
+        self.sdk_client = sdk_client
+        self.last_used = time.monotonic()
+
+class LLMClientPool:
+    """
+    LRU pool of chat model clients keyed by (provider, model, base_url, api key fingerprint).
+
+    Clients are built once and reused across requests. OpenAI-compatible clients
+    share one keep-alive HTTP connection pool per host, so connections and TLS
+    sessions survive between calls. Entries idle for longer than `idle_ttl`
+    seconds, or pushed out by `max_size`, are evicted.
+    """
+
+    def __init__(self, max_size: int = LLM_POOL_MAX_SIZE, idle_ttl: float = LLM_POOL_IDLE_TTL):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self._entries: "OrderedDict[PoolKey, _PooledClient]" = OrderedDict()
+        self._http_clients: Dict[str, "httpx.AsyncClient"] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_entry(self, key: PoolKey, factory) -> _PooledClient:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry.last_used > self.idle_ttl:
+                del self._entries[key]
+                self.evictions += 1
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                entry = _PooledClient(*factory())
+                self._entries[key] = entry
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            entry.last_used = now
+
+            self._evict_locked(now)
+        return entry
+
+    def _evict_locked(self, now: float) -> None:
+        for key in list(self._entries.keys()):
+            if now - self._entries[key].last_used > self.idle_ttl:
+                del self._entries[key]
+                self.evictions += 1
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def http_client(self, host: str) -> "httpx.AsyncClient":
+        """
+        Shared keep-alive connection pool for `host`.
+        """
+        import httpx
+
+        client = self._http_clients.get(host)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=LLM_HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+                    keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(600.0, connect=10.0),
+            )
+            self._http_clients[host] = client
+        return client
+
+    async def aclose(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            http_clients = list(self._http_clients.values())
+            self._http_clients.clear()
+        for client in http_clients:
+            await client.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "idle_ttl": self.idle_ttl,
+                "http_pools": len(self._http_clients),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+_client_pool = LLMClientPool()
 
 class LLMProvider:
     @staticmethod
-    def get_llm(settings: LLMSettings, callbacks: list = None) -> BaseChatModel:
+    def _resolve(settings: LLMSettings) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Returns (api_key, base_url) for the requested provider.
+        """
         if settings.provider == "openai":
-            return ChatOpenAI(
-                model=settings.model_name,
-                temperature=settings.temperature,
-                api_key=settings.api_key or os.getenv("OPENAI_API_KEY"),
-                callbacks=callbacks,
-            )
+            return settings.api_key or os.getenv(PROVIDER_KEY_ENV["openai"]), None
         elif settings.provider == "gemini":
-            return ChatGoogleGenerativeAI(
+            return settings.api_key or os.getenv(PROVIDER_KEY_ENV["gemini"]), None
+        elif settings.provider == "perplexity":
+            # Perplexity is compatible with OpenAI API
+            return settings.api_key or os.getenv(PROVIDER_KEY_ENV["perplexity"]), PERPLEXITY_BASE_URL
+        elif settings.provider == "stub":
+            return settings.api_key or "stub", STUB_BASE_URL
+        else:
+            raise ValueError(f"Unsupported provider: {settings.provider}")
+
+    @staticmethod
+    def _build(settings: LLMSettings, api_key: Optional[str], base_url: Optional[str]):
+        """
+        Construct a new client. Returns (llm, sdk_client). Called with the pool lock held.
+        """
+        if settings.provider in ("openai", "perplexity", "stub"):
+            import openai
+            from langchain_openai import ChatOpenAI
+
+            http_client = _client_pool.http_client(base_url or "openai")
+            async_root = openai.AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+            llm = ChatOpenAI(
                 model=settings.model_name,
                 temperature=settings.temperature,
-                google_api_key=settings.api_key or os.getenv("GOOGLE_API_KEY"),
-                callbacks=callbacks,
+                api_key=api_key,
+                base_url=base_url,
+                async_client=async_root.chat.completions,
+                # Retries are owned by the provider scheduler (app.core.rate_limit)
+                max_retries=0,
             )
-        elif settings.provider == "perplexity":
-            # Perplexity is compatible with OpenAI API
-            return ChatOpenAI(
+            return llm, async_root
+        elif settings.provider == "gemini":
+            # The installed langchain-google-genai ignores max_retries; this subclass
+            # bypasses its retry wrapper so the scheduler sees every 429/503
+            from app.core.gemini import SchedulerRetriedGemini
+
+            llm = SchedulerRetriedGemini(
                 model=settings.model_name,
                 temperature=settings.temperature,
-                api_key=settings.api_key or os.getenv("PERPLEXITY_API_KEY"),
-                base_url="https://api.perplexity.ai",
-                callbacks=callbacks,
+                google_api_key=api_key,
             )
-        else:
-            raise ValueError(f"Unsupported provider: {settings.provider}")
+            return llm, None
+        raise ValueError(f"Unsupported provider: {settings.provider}")
+
+    @staticmethod
+    def _pooled(settings: LLMSettings) -> _PooledClient:
+        api_key, base_url = LLMProvider._resolve(settings)
+        key = (settings.provider, settings.model_name, base_url, _key_fingerprint(api_key))
+        return _client_pool.get_entry(key, lambda: LLMProvider._build(settings, api_key, base_url))
+
+    @staticmethod
+    def get_llm(settings: LLMSettings, callbacks: list = None) -> Runnable:
+        """
+        Returns a chat model for `settings`, backed by a pooled client.
+
+        The pooled client is shared, so temperature and callbacks are bound per call
+        instead of being set on the client.
+        """
+        llm = LLMProvider._pooled(settings).llm
+
+        if llm.temperature != settings.temperature:
+            if settings.provider == "gemini":
+                llm = llm.bind(generation_config={"temperature": settings.temperature})
+            else:
+                llm = llm.bind(temperature=settings.temperature)
+        if callbacks:
+            return llm.with_config({"callbacks": callbacks})
+        return llm
+
+    @staticmethod
+    def preload_sdks(providers: List[str]) -> None:
+        """
+        Import the SDK modules for `providers`. Blocking (several hundred ms for the
+        langchain integrations); call it from a worker thread.
+        """
+        for module_name in dict.fromkeys(name for provider in providers for name in PROVIDER_SDK_MODULES.get(provider, ())):
+            try:
+                importlib.import_module(module_name)
+            except ImportError as e:
+                logger.warning(f"Could not preload {module_name}: {e}")
+
+    @staticmethod
+    async def warm_up(supported_models: Dict[str, List[str]]) -> None:
+        """
+        Pre-build pooled clients for every configured model whose provider has a
+        server-side key, and open a keep-alive connection per OpenAI-compatible host.
+        """
+        for provider, models in supported_models.items():
+            if not models:
+                continue
+            try:
+                api_key, _ = LLMProvider._resolve(LLMSettings(provider=provider, model_name=models[0]))
+            except ValueError as e:
+                logger.warning(f"Skipping warm-up: {e}")
+                continue
+            if not api_key:
+                continue
+
+            entries = []
+            for model_name in models:
+                try:
+                    entries.append(LLMProvider._pooled(LLMSettings(provider=provider, model_name=model_name)))
+                except Exception as e:
+                    logger.warning(f"Warm-up failed for {provider}/{model_name}: {e}")
+
+            # A cheap authenticated GET opens the TCP/TLS connection without spending tokens.
+            sdk_client = next((entry.sdk_client for entry in entries if entry.sdk_client is not None), None)
+            if sdk_client is not None:
+                try:
+                    await sdk_client.models.list()
+                except Exception as e:
+                    logger.warning(f"Connection warm-up failed for {provider}: {e}")
+        logger.info(f"LLM client pool warmed up: {_client_pool.stats()}")
+
+    @staticmethod
+    def pool_stats() -> Dict[str, Any]:
+        return _client_pool.stats()
+
+    @staticmethod
+    async def close() -> None:
+        await _client_pool.aclose()
@@ -1,18 +1,111 @@
+import atexit
+import datetime
+import json
 import logging
+import logging.handlers
+import os
+import queue
+import random
+import reprlib
 import sys
+from typing import Any
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" (one object per line) or "text"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Fraction of requests whose inputs/outputs are logged at DEBUG
+LOG_BODY_SAMPLE_RATE = float(os.getenv("LOG_BODY_SAMPLE_RATE", "0.01"))
+# Payloads are rendered with bounded sizes, so logging cost stays flat as they grow
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "2000"))
+
+# Attributes every LogRecord has; anything else came from `extra=`
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_payload_repr = reprlib.Repr()
+_payload_repr.maxstring = LOG_PAYLOAD_MAX_CHARS
+_payload_repr.maxother = LOG_PAYLOAD_MAX_CHARS
+_payload_repr.maxdict = 20
+_payload_repr.maxlist = 20
+_payload_repr.maxlevel = 4
+
+class Payload:
+    """
+    Wraps a request/response body for logging. Nothing is rendered until a handler
+    formats the record, and then only a truncated representation is produced.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value: Any):
+        self.value = value
+
+    def __str__(self) -> str:
+        text = self.value if isinstance(self.value, str) else _payload_repr.repr(self.value)
+        if len(text) > LOG_PAYLOAD_MAX_CHARS:
+            text = f"{text[:LOG_PAYLOAD_MAX_CHARS]}... [{len(text)} chars]"
+        return text
+
+    __repr__ = __str__
+
+def sample_body() -> bool:
+    """
+    Whether this request's bodies should be logged (DEBUG enabled and sampled in).
+    """
+    return logger.isEnabledFor(logging.DEBUG) and random.random() < LOG_BODY_SAMPLE_RATE
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread without formatting them on the caller's
+    thread: only the exception traceback (which cannot wait) is rendered here.
+    Message args, including Payload objects, are formatted by the listener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        record.stack_info = None
+        return record
 
 def setup_logger(name: str = "100AIAgents"):
     logger = logging.getLogger(name)
-    logger.setLevel(logging.DEBUG)
+    logger.setLevel(LOG_LEVEL)
 
     if not logger.handlers:
         handler = logging.StreamHandler(sys.stdout)
-        handler.setLevel(logging.DEBUG)
-        formatter = logging.Formatter(
-            "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-        )
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
+        if LOG_FORMAT == "text":
+            handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+        else:
+            handler.setFormatter(JsonFormatter())
+
+        # Writes happen on a background thread; callers only enqueue
+        log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+
+        def start_listener() -> None:
+            listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+            listener.start()
+            atexit.register(listener.stop)
+
+        start_listener()
+        # Threads do not survive fork: pre-forked server workers need their own listener
+        os.register_at_fork(after_in_child=start_listener)
+        logger.addHandler(_QueueHandler(log_queue))
+        logger.propagate = False
 
     return logger
 
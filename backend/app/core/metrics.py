@@ -0,0 +1,183 @@
+import asyncio
+import bisect
+import contextlib
+import math
+import time
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+# Recording happens on the event loop thread (callbacks run inline), so metrics
+# are plain dict/list updates without locks. Labels are positional tuples in
+# `labelnames` order.
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+FAST_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+VALIDATION_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)
+RATE_BUCKETS = (1, 5, 10, 20, 40, 60, 80, 100, 150, 200, 300, 500, 1000)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, value in list(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) - amount
+
+    def set(self, *labels: str, value: float) -> None:
+        self._values[labels] = value
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels: str) -> None:
+        state = self._values.get(labels)
+        if state is None:
+            # [per-bucket counts (last one is +Inf), sum]
+            state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, (counts, total) in list(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), list(counts)):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}")
+            suffix = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{suffix} {_format_value(total)}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """
+        Prometheus text exposition format (version 0.0.4).
+        """
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+REQUEST_LATENCY = registry.register(Histogram(
+    "agent_request_duration_seconds", "End-to-end agent execution time.", ("agent", "provider", "model", "mode"),
+))
+REQUESTS = registry.register(Counter(
+    "agent_requests_total", "Agent executions by outcome and cache result.", ("agent", "provider", "model", "status", "cache"),
+))
+IN_FLIGHT = registry.register(Gauge(
+    "agent_requests_in_flight", "Agent executions currently running.", ("agent",),
+))
+COALESCED = registry.register(Counter(
+    "agent_requests_coalesced_total", "Agent executions that joined an identical in-flight execution.", ("agent",),
+))
+ERRORS = registry.register(Counter(
+    "agent_errors_total", "Failed agent executions by exception type.", ("agent", "provider", "model", "error_type"),
+))
+FALLBACKS = registry.register(Counter(
+    "llm_fallback_attempts_total", "Backup attempts started on a model, after an error or a hedge deadline.", ("provider", "model", "reason"),
+))
+LLM_LATENCY = registry.register(Histogram(
+    "llm_call_duration_seconds", "Duration of individual LLM calls.", ("provider", "model"),
+))
+TIME_TO_FIRST_TOKEN = registry.register(Histogram(
+    "llm_time_to_first_token_seconds", "Time from call start to the first streamed token.", ("provider", "model"), FAST_BUCKETS,
+))
+TOKENS_PER_SECOND = registry.register(Histogram(
+    "llm_tokens_per_second", "Completion tokens per second of generation.", ("provider", "model"), RATE_BUCKETS,
+))
+LLM_TOKENS = registry.register(Counter(
+    "llm_tokens_total", "Tokens reported by providers; kind=\"cached\" counts prompt tokens read from the provider's prompt cache.", ("provider", "model", "kind"),
+))
+CPU_STAGE_DURATION = registry.register(Histogram(
+    "agent_cpu_stage_duration_seconds", "Time spent in CPU-bound agent stages, including executor hand-off.", ("agent", "stage", "executor"), FAST_BUCKETS,
+))
+EVENT_LOOP_LAG = registry.register(Histogram(
+    "event_loop_lag_seconds", "How late the event loop ran a timer callback; high values mean blocking work on the loop.", (), FAST_BUCKETS,
+))
+VALIDATION_DURATION = registry.register(Histogram(
+    "agent_input_validation_seconds", "Time spent validating agent inputs against the agent's schema.", ("agent",), VALIDATION_BUCKETS,
+))
+VALIDATION_FAILURES = registry.register(Counter(
+    "agent_input_validation_failures_total", "Agent requests rejected by input validation before any LLM call.", ("agent",),
+))
+QUEUE_WAIT = registry.register(Histogram(
+    "provider_queue_wait_seconds", "Time spent waiting for provider rate-limit budget and concurrency.", ("provider", "model"), FAST_BUCKETS,
+))
+
+@contextlib.contextmanager
+def track_request(agent: str, provider: str, model: str, mode: str) -> Iterator[Dict[str, str]]:
+    """
+    Records in-flight, latency, outcome and error metrics around one agent execution.
+    Set "cache" on the yielded dict to label the outcome with the cache result.
+    """
+    state = {"cache": "bypass"}
+    IN_FLIGHT.inc(agent)
+    started = time.perf_counter()
+    try:
+        yield state
+    except (asyncio.CancelledError, GeneratorExit):
+        # Client disconnected or a job was cancelled; not an error of the agent
+        REQUESTS.inc(agent, provider, model, "cancelled", state["cache"])
+        raise
+    except asyncio.TimeoutError:
+        REQUESTS.inc(agent, provider, model, "timeout", state["cache"])
+        raise
+    except Exception as e:
+        ERRORS.inc(agent, provider, model, type(e).__name__)
+        REQUESTS.inc(agent, provider, model, "error", state["cache"])
+        raise
+    else:
+        REQUESTS.inc(agent, provider, model, "success", state["cache"])
+    finally:
+        IN_FLIGHT.dec(agent)
+        REQUEST_LATENCY.observe(time.perf_counter() - started, agent, provider, model, mode)
@@ -0,0 +1,290 @@
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple, Union
+
+from pydantic import BaseModel
+
+from app.core.batch import aggregate_usage
+from app.core.coalesce import coalesce_key
+from app.core.deadlines import error_status
+from app.core.llm import LLMSettings
+from app.core.logger import logger
+
+PIPELINE_MAX_STEPS = int(os.getenv("PIPELINE_MAX_STEPS", "20"))
+
+# Reference roots usable in input_map
+STEPS_REF = "steps"
+INPUTS_REF = "inputs"
+
+class PipelineStep(BaseModel):
+    id: str
+    agent_id: str
+    # Literal inputs for the agent
+    inputs: Dict[str, Any] = {}
+    # Agent input field -> reference, or a list of references to build a list input.
+    # "steps.<id>" is that step's output text; "steps.<id>.<path>" reads another field of
+    # its result (e.g. "steps.ledger.usage.total_tokens"); "inputs.<name>" reads the
+    # pipeline's own inputs. Mapped fields override literal ones.
+    input_map: Dict[str, Union[str, List[str]]] = {}
+    # Defaults to the pipeline's settings
+    llm_settings: Optional[LLMSettings] = None
+
+class PipelineError(ValueError):
+    pass
+
+def _parse_ref(ref: str) -> Tuple[str, List[str]]:
+    """
+    Split a reference into (root, path); step references default to the output.
+    """
+    parts = ref.split(".")
+    if parts[0] == STEPS_REF and len(parts) >= 2 and parts[1]:
+        return STEPS_REF, parts[1:] if len(parts) > 2 else [parts[1], "output"]
+    if parts[0] == INPUTS_REF and len(parts) >= 2 and parts[1]:
+        return INPUTS_REF, parts[1:]
+    raise PipelineError(f"Invalid reference {ref!r}: expected 'steps.<id>[.<field>]' or 'inputs.<name>'")
+
+def _refs(step: PipelineStep) -> List[str]:
+    return [ref for value in step.input_map.values() for ref in ([value] if isinstance(value, str) else value)]
+
+def dependencies(step: PipelineStep) -> Set[str]:
+    deps = set()
+    for ref in _refs(step):
+        root, path = _parse_ref(ref)
+        if root == STEPS_REF:
+            deps.add(path[0])
+    return deps
+
+def plan_pipeline(steps: List[PipelineStep], known_agents: Callable[[str], bool]) -> List[str]:
+    """
+    Check the DAG (unique ids, known agents and references, no cycles) and return the
+    step ids in a topological order. Raises PipelineError.
+    """
+    if not steps:
+        raise PipelineError("Pipeline must contain at least one step")
+    if len(steps) > PIPELINE_MAX_STEPS:
+        raise PipelineError(f"Pipeline exceeds the maximum of {PIPELINE_MAX_STEPS} steps")
+    by_id: Dict[str, PipelineStep] = {}
+    for step in steps:
+        if step.id in by_id:
+            raise PipelineError(f"Duplicate step id {step.id!r}")
+        if not known_agents(step.agent_id):
+            raise PipelineError(f"Step {step.id!r}: unknown agent {step.agent_id!r}")
+        by_id[step.id] = step
+
+    deps = {step.id: dependencies(step) for step in steps}
+    for step_id, upstream in deps.items():
+        missing = sorted(upstream - by_id.keys())
+        if missing:
+            raise PipelineError(f"Step {step_id!r} references unknown step {missing[0]!r}")
+
+    # Kahn's algorithm, keeping declaration order among ready steps
+    remaining = {step_id: set(upstream) for step_id, upstream in deps.items()}
+    order: List[str] = []
+    while remaining:
+        ready = [step.id for step in steps if step.id in remaining and not remaining[step.id]]
+        if not ready:
+            raise PipelineError(f"Pipeline has a cycle through steps: {', '.join(sorted(remaining))}")
+        for step_id in ready:
+            del remaining[step_id]
+            order.append(step_id)
+        for upstream in remaining.values():
+            upstream.difference_update(ready)
+    return order
+
+def _lookup(value: Any, path: List[str], ref: str) -> Any:
+    for key in path:
+        if isinstance(value, dict) and key in value:
+            value = value[key]
+        elif isinstance(value, list) and key.isdigit() and int(key) < len(value):
+            value = value[int(key)]
+        else:
+            raise PipelineError(f"Reference {ref!r} does not resolve")
+    return value
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+class PipelineRun:
+    """
+    One execution of a pipeline. Every step runs as its own task on the event loop and
+    starts as soon as the steps it references have succeeded, so independent branches
+    run concurrently. A step whose upstream failed is skipped; other branches carry on.
+    Steps that resolve to the same agent, inputs and settings run once per pipeline
+    run; later ones reuse the first result (`reused_from`).
+    """
+
+    def __init__(
+        self,
+        steps: List[PipelineStep],
+        resolve_agent: Callable[[str], Any],
+        validator: Callable[[str], Any],
+        inputs: Dict[str, Any],
+        llm_settings: LLMSettings,
+        **execute_kwargs: Any,
+    ):
+        self.steps = {step.id: step for step in steps}
+        self.resolve_agent = resolve_agent
+        self.validator = validator
+        self.inputs = inputs
+        self.llm_settings = llm_settings
+        self.execute_kwargs = execute_kwargs
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.tasks: Dict[str, "asyncio.Task[Dict[str, Any]]"] = {}
+        # coalesce key -> (first step id, its execute task)
+        self._memo: Dict[str, Tuple[str, "asyncio.Task[Dict[str, Any]]"]] = {}
+        self.started = 0.0
+
+    def _resolve_inputs(self, step: PipelineStep) -> Dict[str, Any]:
+        inputs = dict(step.inputs)
+        for field, refs in step.input_map.items():
+            values = []
+            for ref in [refs] if isinstance(refs, str) else refs:
+                root, path = _parse_ref(ref)
+                if root == STEPS_REF:
+                    values.append(_lookup(self.results[path[0]], path[1:], ref))
+                else:
+                    values.append(_lookup(self.inputs, path, ref))
+            inputs[field] = values[0] if isinstance(refs, str) else values
+        return inputs
+
+    async def _execute(self, step: PipelineStep, inputs: Dict[str, Any], settings: LLMSettings) -> Tuple[Dict[str, Any], Optional[str]]:
+        key = coalesce_key(step.agent_id, inputs, settings, **self.execute_kwargs)
+        if key in self._memo:
+            first_id, task = self._memo[key]
+            return dict(await asyncio.shield(task)), first_id
+        task = asyncio.ensure_future(self.resolve_agent(step.agent_id).execute(inputs, settings, **self.execute_kwargs))
+        self._memo[key] = (step.id, task)
+        return dict(await task), None
+
+    async def _run_step(self, step: PipelineStep) -> Dict[str, Any]:
+        upstream = [self.tasks[step_id] for step_id in sorted(dependencies(step))]
+        if upstream:
+            # asyncio.wait, unlike gather, does not cancel upstream steps if this one is cancelled
+            await asyncio.wait(upstream)
+        ready = time.perf_counter()
+        result: Dict[str, Any] = {"id": step.id, "agent_id": step.agent_id}
+        # Offsets from the start of the pipeline run
+        timing = {"started_ms": _ms(ready - self.started)}
+
+        failed = [step_id for step_id in sorted(dependencies(step)) if self.results[step_id]["status"] != "success"]
+        if failed:
+            result.update(status="skipped", error=f"Upstream step failed: {', '.join(failed)}")
+        else:
+            try:
+                inputs = self._resolve_inputs(step)
+                errors = self.validator(step.agent_id).errors(inputs, ("steps", step.id, "inputs"))
+                if errors:
+                    result.update(status="invalid", error="Input validation failed", errors=errors)
+                else:
+                    output, reused_from = await self._execute(step, inputs, step.llm_settings or self.llm_settings)
+                    result.update(
+                        status="success",
+                        output=output["output"],
+                        usage=output["usage"],
+                        cache=output.get("cache"),
+                        served_by=output.get("served_by"),
+                    )
+                    if reused_from:
+                        result["reused_from"] = reused_from
+            except PipelineError as e:
+                result.update(status="invalid", error=str(e))
+            except Exception as e:
+                logger.warning(f"Pipeline step {step.id} ({step.agent_id}) failed: {e}")
+                result.update(status=error_status(e)[1], error=str(e), error_type=type(e).__name__)
+
+        finished = time.perf_counter()
+        timing.update(finished_ms=_ms(finished - self.started), duration_ms=_ms(finished - ready))
+        result.update(timing)
+        self.results[step.id] = result
+        return result
+
+    def start(self, order: List[str]) -> List["asyncio.Task[Dict[str, Any]]"]:
+        self.started = time.perf_counter()
+        # Topological order, so every step's upstream tasks exist before it is created
+        for step_id in order:
+            self.tasks[step_id] = asyncio.create_task(self._run_step(self.steps[step_id]))
+        return list(self.tasks.values())
+
+    async def cancel(self) -> None:
+        pending = [task for task in self.tasks.values() if not task.done()]
+        pending += [task for _, task in self._memo.values() if not task.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    def critical_path(self) -> List[str]:
+        """
+        The chain of steps that determined the pipeline's duration: from the last step
+        to finish, back through whichever upstream step finished last.
+        """
+        if not self.results:
+            return []
+        step_id = max(self.results, key=lambda name: self.results[name]["finished_ms"])
+        path = [step_id]
+        while True:
+            upstream = [name for name in dependencies(self.steps[step_id]) if name in self.results]
+            if not upstream:
+                break
+            step_id = max(upstream, key=lambda name: self.results[name]["finished_ms"])
+            path.append(step_id)
+        return path[::-1]
+
+    def summary(self) -> Dict[str, Any]:
+        results = list(self.results.values())
+        succeeded = sum(1 for result in results if result["status"] == "success")
+        path = self.critical_path()
+        return {
+            "total": len(self.steps),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "usage": aggregate_usage(results),
+            "duration_ms": _ms(time.perf_counter() - self.started),
+            "critical_path": path,
+            "critical_path_ms": sum(self.results[step_id]["duration_ms"] for step_id in path),
+        }
+
+async def run_pipeline(
+    steps: List[PipelineStep],
+    order: List[str],
+    resolve_agent: Callable[[str], Any],
+    validator: Callable[[str], Any],
+    inputs: Dict[str, Any],
+    llm_settings: LLMSettings,
+    **execute_kwargs: Any,
+) -> Dict[str, Any]:
+    """
+    Runs a pipeline planned by `plan_pipeline` to completion. Step results are returned
+    in declaration order.
+    """
+    pipeline = PipelineRun(steps, resolve_agent, validator, inputs, llm_settings, **execute_kwargs)
+    tasks = pipeline.start(order)
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await pipeline.cancel()
+    return {"steps": [pipeline.results[step.id] for step in steps], **pipeline.summary()}
+
+async def stream_pipeline(
+    steps: List[PipelineStep],
+    order: List[str],
+    resolve_agent: Callable[[str], Any],
+    validator: Callable[[str], Any],
+    inputs: Dict[str, Any],
+    llm_settings: LLMSettings,
+    **execute_kwargs: Any,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Same as run_pipeline but yields each step's result as soon as it completes,
+    followed by a final summary event.
+    """
+    pipeline = PipelineRun(steps, resolve_agent, validator, inputs, llm_settings, **execute_kwargs)
+    tasks = pipeline.start(order)
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield {"type": "step", **await next_done}
+    finally:
+        # Client went away mid-stream: don't leave orphaned LLM calls running
+        await pipeline.cancel()
+
+    yield {"type": "summary", **pipeline.summary()}
@@ -0,0 +1,427 @@
+import asyncio
+import collections
+import contextlib
+import math
+import os
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+from app.core.logger import logger
+from app.core.metrics import QUEUE_WAIT
+from app.core.storage import connect_sqlite, data_path
+
+T = TypeVar("T")
+
+# Default per-provider budgets; override with e.g. RATE_LIMIT_OPENAI_RPM=500,
+# RATE_LIMIT_OPENAI_TPM=200000, RATE_LIMIT_OPENAI_CONCURRENCY=16, or per model with
+# RATE_LIMIT_OPENAI_GPT_4O_RPM=...
+DEFAULT_BUDGETS = {
+    "openai": {"rpm": 500, "tpm": 200_000, "concurrency": 16},
+    "gemini": {"rpm": 300, "tpm": 1_000_000, "concurrency": 16},
+    "perplexity": {"rpm": 50, "tpm": 100_000, "concurrency": 4},
+    # Effectively unlimited, so load tests measure this service rather than the limiter
+    "stub": {"rpm": 1_000_000, "tpm": 1_000_000_000, "concurrency": 1024},
+}
+FALLBACK_BUDGET = {"rpm": 60, "tpm": 100_000, "concurrency": 4}
+
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "3"))
+RATE_LIMIT_BASE_BACKOFF = float(os.getenv("RATE_LIMIT_BASE_BACKOFF", "1.0"))
+RATE_LIMIT_MAX_BACKOFF = float(os.getenv("RATE_LIMIT_MAX_BACKOFF", "30.0"))
+# Callers give up after waiting this long for a slot
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "120.0"))
+# With several server processes, rpm/tpm budgets are kept in SQLite so all of them draw
+# from the same buckets, and each process gets an equal share of the concurrency limit
+SHARED_RATE_LIMITS = os.getenv("SHARED_RATE_LIMITS", "0").lower() in ("1", "true", "yes")
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB") or data_path("rate_limits.db")
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+class RateLimitTimeout(Exception):
+    pass
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """
+    Cheap token estimate (~4 characters per token) used for budgeting before the call.
+    """
+    if not text:
+        return 256
+    return max(1, len(text) // 4)
+
+def _env_key(*parts: str) -> str:
+    return "_".join(part.upper().replace("-", "_").replace(".", "_") for part in parts)
+
+def _budget_for(provider: str, model_name: str) -> Dict[str, float]:
+    budget = dict(DEFAULT_BUDGETS.get(provider, FALLBACK_BUDGET))
+    for field in budget:
+        for env_name in (_env_key("RATE_LIMIT", provider, model_name, field), _env_key("RATE_LIMIT", provider, field)):
+            value = os.getenv(env_name)
+            if value:
+                budget[field] = float(value)
+                break
+    return budget
+
+def _status_code(error: BaseException) -> Optional[int]:
+    for candidate in (error, getattr(error, "response", None)):
+        code = getattr(candidate, "status_code", None) or getattr(candidate, "code", None)
+        if isinstance(code, int):
+            return code
+    if type(error).__name__ in ("RateLimitError", "ResourceExhausted", "TooManyRequests"):
+        return 429
+    if type(error).__name__ in ("InternalServerError", "ServiceUnavailable", "APIConnectionError", "APITimeoutError"):
+        return 503
+    return None
+
+def _retry_after(error: BaseException) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+class TokenBucket:
+    """
+    Token bucket with FIFO-fair waiting: callers queue on a lock so a large
+    request is never starved by a stream of small ones.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = max(1.0, per_minute)
+        self.base_rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.rate_factor = 1.0
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.base_rate * self.rate_factor)
+        self._updated = now
+
+    async def acquire(self, amount: float, blocked_until: Callable[[], float]) -> None:
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                pause = blocked_until() - now
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                    continue
+                self._refill(now)
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / (self.base_rate * self.rate_factor))
+
+    def adjust(self, delta: float) -> None:
+        """
+        Debit (or credit) the difference between estimated and actual usage.
+        The balance may go negative, which delays the next callers.
+        """
+        self._refill(time.monotonic())
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+class SharedBucketStore:
+    """
+    Token bucket balances in a SQLite (WAL) table, updated in short IMMEDIATE
+    transactions so concurrent processes never both spend the same tokens.
+    Methods block; call them through asyncio.to_thread.
+    """
+
+    def __init__(self, db_path: str = RATE_LIMIT_DB):
+        self.db_path = db_path
+        self._conn = None
+        self._lock = threading.Lock()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self) -> None:
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = connect_sqlite(self.db_path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+        return self._conn
+
+    def _update(self, name: str, capacity: float, rate: float, change: Callable[[float], Tuple[float, Any]]) -> Any:
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                row = db.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+                tokens = capacity if row is None else min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+                tokens, result = change(tokens)
+                db.execute("INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)", (name, tokens, now))
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        return result
+
+    def take(self, name: str, amount: float, capacity: float, rate: float) -> Tuple[float, float]:
+        """
+        Spend `amount` if available. Returns (seconds to wait before retrying, or 0 if spent; balance).
+        """
+        def change(tokens: float):
+            if tokens >= amount:
+                return tokens - amount, (0.0, tokens - amount)
+            return tokens, ((amount - tokens) / rate, tokens)
+        return self._update(name, capacity, rate, change)
+
+    def adjust(self, name: str, delta: float, capacity: float, rate: float) -> None:
+        self._update(name, capacity, rate, lambda tokens: (min(capacity, tokens - delta), None))
+
+class SharedTokenBucket(TokenBucket):
+    """
+    TokenBucket whose balance lives in a SharedBucketStore. Waiters in this process
+    still queue FIFO on the local lock; `tokens` is the last balance seen.
+    """
+
+    def __init__(self, per_minute: float, name: str, store: SharedBucketStore):
+        super().__init__(per_minute)
+        self.name = name
+        self.store = store
+
+    async def acquire(self, amount: float, blocked_until: Callable[[], float]) -> None:
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                pause = blocked_until() - time.monotonic()
+                if pause > 0:
+                    await asyncio.sleep(pause)
+                    continue
+                rate = self.base_rate * self.rate_factor
+                wait, self.tokens = await asyncio.to_thread(self.store.take, self.name, amount, self.capacity, rate)
+                if wait <= 0:
+                    return
+                await asyncio.sleep(wait)
+
+    def _settle(self, delta: float, rate: float) -> None:
+        try:
+            self.store.adjust(self.name, delta, self.capacity, rate)
+        except Exception as e:
+            logger.warning(f"Could not settle shared budget {self.name}: {e}")
+
+    def adjust(self, delta: float) -> None:
+        # Settled in the background; the caller has already finished its request
+        asyncio.get_running_loop().run_in_executor(None, self._settle, delta, self.base_rate * self.rate_factor)
+
+class AdaptiveSemaphore:
+    """
+    Concurrency limiter whose limit can shrink and grow at runtime. Waiters are served in FIFO order.
+    """
+
+    def __init__(self, limit: int):
+        self.max_limit = max(1, int(limit))
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = collections.deque()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> None:
+        if not self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # We were granted a slot while being cancelled; hand it on
+                self.release()
+            else:
+                self._waiters.remove(future)
+            raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            future = self._waiters.popleft()
+            if not future.done():
+                self.in_flight += 1
+                future.set_result(None)
+
+    def set_limit(self, limit: float) -> None:
+        self.limit = max(1.0, min(float(self.max_limit), limit))
+        self._wake()
+
+class ProviderLimiter:
+    """
+    Request/token budgets and an AIMD-adjusted concurrency limit for one provider/model.
+    """
+
+    def __init__(self, provider: str, model_name: str, store: Optional[SharedBucketStore] = None):
+        budget = _budget_for(provider, model_name)
+        self.provider = provider
+        self.model_name = model_name
+        if store is not None:
+            self.requests = SharedTokenBucket(budget["rpm"], f"{provider}/{model_name}/rpm", store)
+            self.tokens = SharedTokenBucket(budget["tpm"], f"{provider}/{model_name}/tpm", store)
+        else:
+            self.requests = TokenBucket(budget["rpm"])
+            self.tokens = TokenBucket(budget["tpm"])
+        self.concurrency = AdaptiveSemaphore(math.ceil(budget["concurrency"] / WEB_CONCURRENCY))
+        self.blocked_until = 0.0
+        self.throttled = 0
+        self.retries = 0
+        self.completed = 0
+        self.total_wait = 0.0
+
+    def on_success(self) -> None:
+        # Additive increase
+        self.completed += 1
+        self.concurrency.set_limit(self.concurrency.limit + 1.0 / max(self.concurrency.limit, 1.0))
+        for bucket in (self.requests, self.tokens):
+            bucket.rate_factor = min(1.0, bucket.rate_factor + 0.05)
+
+    def on_throttled(self, retry_after: Optional[float]) -> None:
+        # Multiplicative decrease
+        self.throttled += 1
+        self.concurrency.set_limit(self.concurrency.limit / 2)
+        for bucket in (self.requests, self.tokens):
+            bucket.rate_factor = max(0.1, bucket.rate_factor / 2)
+        if retry_after:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "provider": self.provider,
+            "model": self.model_name,
+            "concurrency_limit": round(self.concurrency.limit, 2),
+            "concurrency_max": self.concurrency.max_limit,
+            "in_flight": self.concurrency.in_flight,
+            "waiting": self.concurrency.waiting,
+            "request_rate_factor": round(self.requests.rate_factor, 3),
+            "token_rate_factor": round(self.tokens.rate_factor, 3),
+            "requests_available": round(self.requests.tokens, 1),
+            "tokens_available": round(self.tokens.tokens, 1),
+            "blocked_for_s": round(max(0.0, self.blocked_until - time.monotonic()), 2),
+            "completed": self.completed,
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "avg_wait_ms": round(self.total_wait / self.completed * 1000, 2) if self.completed else 0.0,
+        }
+
+class ProviderScheduler:
+    """
+    Gate for every provider call: waits fairly for budget and a concurrency slot,
+    then runs the call with bounded, jittered retries on 429/5xx responses.
+    """
+
+    def __init__(self, shared: bool = SHARED_RATE_LIMITS):
+        self._limiters: Dict[Tuple[str, str], ProviderLimiter] = {}
+        self._store = SharedBucketStore() if shared else None
+
+    def limiter(self, provider: str, model_name: str) -> ProviderLimiter:
+        key = (provider, model_name)
+        limiter = self._limiters.get(key)
+        if limiter is None:
+            limiter = self._limiters[key] = ProviderLimiter(provider, model_name, self._store)
+        return limiter
+
+    async def _acquire(self, limiter: ProviderLimiter, estimated_tokens: int) -> float:
+        started = time.monotonic()
+        blocked_until = lambda: limiter.blocked_until
+        try:
+            await asyncio.wait_for(self._acquire_all(limiter, estimated_tokens, blocked_until), RATE_LIMIT_MAX_WAIT)
+        except asyncio.TimeoutError:
+            raise RateLimitTimeout(f"Timed out waiting for {limiter.provider}/{limiter.model_name} capacity")
+        return time.monotonic() - started
+
+    @staticmethod
+    async def _acquire_all(limiter: ProviderLimiter, estimated_tokens: int, blocked_until) -> None:
+        await limiter.concurrency.acquire()
+        try:
+            await limiter.requests.acquire(1, blocked_until)
+            await limiter.tokens.acquire(estimated_tokens, blocked_until)
+        except BaseException:
+            limiter.concurrency.release()
+            raise
+
+    @contextlib.asynccontextmanager
+    async def slot(self, provider: str, model_name: str, estimated_tokens: int = 256):
+        """
+        Holds one budgeted slot for a single attempt (no retries). Yields a dict that
+        receives `waited` (seconds spent queueing); set `actual_tokens` on it before
+        leaving to settle the token budget. Used directly for streaming calls, which
+        cannot be transparently retried once tokens have been sent.
+        """
+        limiter = self.limiter(provider, model_name)
+        state = {"waited": await self._acquire(limiter, estimated_tokens), "actual_tokens": None}
+        QUEUE_WAIT.observe(state["waited"], provider, model_name)
+        try:
+            yield state
+        except Exception as e:
+            if _status_code(e) == 429:
+                limiter.on_throttled(_retry_after(e))
+            raise
+        finally:
+            limiter.concurrency.release()
+        limiter.on_success()
+        limiter.total_wait += state["waited"]
+        if state["actual_tokens"] is not None:
+            limiter.tokens.adjust(state["actual_tokens"] - estimated_tokens)
+
+    async def run(
+        self,
+        provider: str,
+        model_name: str,
+        call: Callable[[], Awaitable[T]],
+        estimated_tokens: int = 256,
+        actual_tokens: Callable[[], int] = None,
+    ) -> Tuple[T, float]:
+        """
+        Runs `call` under the provider budget with bounded, jittered retries on 429/5xx.
+        Returns (result, total seconds spent waiting). `actual_tokens`, if given, is read
+        after a successful call to settle the token budget.
+        """
+        limiter = self.limiter(provider, model_name)
+        waited = 0.0
+        attempt = 0
+        while True:
+            try:
+                async with self.slot(provider, model_name, estimated_tokens) as state:
+                    result = await call()
+                    if actual_tokens is not None:
+                        state["actual_tokens"] = actual_tokens()
+                return result, waited + state["waited"]
+            except Exception as e:
+                status = _status_code(e)
+                retryable = status == 429 or (status is not None and status >= 500)
+                if not retryable or attempt >= RATE_LIMIT_MAX_RETRIES:
+                    raise
+                attempt += 1
+                limiter.retries += 1
+                # Exponential backoff with full jitter, never shorter than retry-after
+                delay = random.uniform(0, min(RATE_LIMIT_MAX_BACKOFF, RATE_LIMIT_BASE_BACKOFF * 2 ** attempt))
+                delay = max(delay, _retry_after(e) or 0.0)
+                logger.warning(f"{provider}/{model_name} returned {status}; retry {attempt}/{RATE_LIMIT_MAX_RETRIES} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                waited += delay
+
+    def stats(self) -> Dict[str, Any]:
+        return {f"{p}/{m}": limiter.stats() for (p, m), limiter in self._limiters.items()}
+
+provider_scheduler = ProviderScheduler()
@@ -0,0 +1,466 @@
+import asyncio
+import contextlib
+import os
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+
+from app.core.callbacks import UsageTrackingHandler
+from app.core.deadlines import AgentTimeout
+from app.core.llm import LLMSettings
+from app.core.logger import logger
+from app.core.metrics import track_request
+from app.core.rate_limit import estimate_tokens, provider_scheduler
+from app.core.storage import connect_sqlite, data_path
+from app.core.usage import usage_ledger
+
+SESSION_DB = os.getenv("SESSION_DB") or data_path("sessions.db")
+SESSION_RETENTION = float(os.getenv("SESSION_RETENTION", str(7 * 24 * 3600)))
+# How often expired sessions are deleted while the server runs
+SESSION_PRUNE_INTERVAL = float(os.getenv("SESSION_PRUNE_INTERVAL", "3600"))
+# Prompt budget for one follow-up turn, in (estimated) tokens. Override per model with
+# SESSION_PROMPT_TOKENS_<MODEL>; it is also capped at half the model's context window.
+SESSION_PROMPT_TOKENS = int(os.getenv("SESSION_PROMPT_TOKENS", "6000"))
+# The rolling summary of compacted turns is kept under this many tokens
+SESSION_SUMMARY_TOKENS = int(os.getenv("SESSION_SUMMARY_TOKENS", "800"))
+# Share of the budget available to artifacts attached to a turn
+SESSION_ARTIFACT_SHARE = float(os.getenv("SESSION_ARTIFACT_SHARE", "0.4"))
+# Inputs larger than this become artifacts: stored once, referenced as @name afterwards
+SESSION_INLINE_TOKENS = int(os.getenv("SESSION_INLINE_TOKENS", "200"))
+SESSION_MAX_MESSAGE_CHARS = int(os.getenv("SESSION_MAX_MESSAGE_CHARS", "8000"))
+
+MODEL_CONTEXT_TOKENS = {
+    "gpt-4o": 128000,
+    "gpt-4-turbo": 128000,
+    "gpt-3.5-turbo": 16385,
+    "gemini-2.5-flash": 1048576,
+    "gemini-2.5-pro": 1048576,
+    "gemini-flash-latest": 1048576,
+    "gemini-2.5-flash-lite": 1048576,
+    "gemma-3-12b": 32768,
+    "sonar-deep-research": 128000,
+    "sonar-reasoning-pro": 128000,
+    "sonar-pro": 200000,
+    "sonar": 128000,
+}
+
+SESSION_INSTRUCTIONS = """
+You are continuing a conversation about an earlier analysis. Earlier turns may have been
+condensed into a summary. Large material (inputs, tables) is stored as artifacts named
+@name; an artifact's content is only included when the user attaches it, otherwise work
+from the summary and the conversation, and ask the user to attach the artifact if you
+need its details.
+"""
+
+SUMMARY_PROMPT = """
+You maintain the running summary of a conversation between a user and an AI agent.
+Merge the new turns into the existing summary. Keep facts, figures, decisions and open
+questions; drop pleasantries and repetition. Refer to artifacts by their @name.
+Write at most {words} words.
+"""
+
+def prompt_budget(model_name: str) -> int:
+    value = os.getenv("SESSION_PROMPT_TOKENS_" + model_name.upper().replace("-", "_").replace(".", "_"))
+    if value:
+        return int(value)
+    return min(SESSION_PROMPT_TOKENS, MODEL_CONTEXT_TOKENS.get(model_name, 2 * SESSION_PROMPT_TOKENS) // 2)
+
+def _truncate(text: str, tokens: int) -> str:
+    # ~4 characters per token, as in estimate_tokens
+    limit = max(0, tokens) * 4
+    return text if len(text) <= limit else text[:limit] + "\n[...truncated]"
+
+class SessionStore:
+    """
+    SQLite-backed conversation state: sessions with their rolling summary, the
+    not-yet-compacted messages, and artifacts. Shared by all server processes.
+    """
+
+    def __init__(self, db_path: str = SESSION_DB):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self) -> None:
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _db(self):
+        if self._conn is not None:
+            return self._conn
+        self._conn = connect_sqlite(self.db_path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id TEXT PRIMARY KEY,"
+            " agent_id TEXT NOT NULL,"
+            " summary TEXT NOT NULL DEFAULT '',"
+            " turns INTEGER NOT NULL DEFAULT 0,"
+            " compacted_messages INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " session_id TEXT NOT NULL,"
+            " seq INTEGER NOT NULL,"
+            " role TEXT NOT NULL,"
+            " content TEXT NOT NULL,"
+            " tokens INTEGER NOT NULL,"
+            " compacted INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL,"
+            " PRIMARY KEY (session_id, seq))"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS artifacts ("
+            " session_id TEXT NOT NULL,"
+            " name TEXT NOT NULL,"
+            " content TEXT NOT NULL,"
+            " tokens INTEGER NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " PRIMARY KEY (session_id, name))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions(updated_at)")
+        return self._conn
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self._lock:
+            return self._db().execute(sql, params).fetchall()
+
+    def create(self, session_id: str, agent_id: str, artifacts: Dict[str, str], messages: List[Tuple[str, str]]) -> None:
+        now = time.time()
+        with self._lock:
+            conn = self._db()
+            conn.execute("BEGIN")
+            try:
+                conn.execute(
+                    "INSERT INTO sessions (id, agent_id, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                    (session_id, agent_id, now, now),
+                )
+                conn.executemany(
+                    "INSERT INTO artifacts (session_id, name, content, tokens, created_at) VALUES (?, ?, ?, ?, ?)",
+                    [(session_id, name, content, estimate_tokens(content), now) for name, content in artifacts.items()],
+                )
+                self._insert_messages(conn, session_id, 0, messages, now)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _insert_messages(conn, session_id: str, first_seq: int, messages: List[Tuple[str, str]], now: float) -> None:
+        conn.executemany(
+            "INSERT INTO messages (session_id, seq, role, content, tokens, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (session_id, first_seq + i, role, content, estimate_tokens(content), now)
+                for i, (role, content) in enumerate(messages)
+            ],
+        )
+        conn.execute(
+            "UPDATE sessions SET turns = turns + ?, updated_at = ? WHERE id = ?",
+            (sum(1 for role, _ in messages if role == "user"), now, session_id),
+        )
+
+    def append(self, session_id: str, messages: List[Tuple[str, str]]) -> None:
+        with self._lock:
+            conn = self._db()
+            conn.execute("BEGIN")
+            try:
+                if conn.execute("SELECT 1 FROM sessions WHERE id = ?", (session_id,)).fetchone() is None:
+                    # Deleted while the turn was running
+                    conn.execute("ROLLBACK")
+                    return
+                row = conn.execute("SELECT COALESCE(MAX(seq), -1) FROM messages WHERE session_id = ?", (session_id,)).fetchone()
+                self._insert_messages(conn, session_id, row[0] + 1, messages, time.time())
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        rows = self._execute(
+            "SELECT id, agent_id, summary, turns, compacted_messages, created_at, updated_at FROM sessions WHERE id = ?",
+            (session_id,),
+        )
+        if not rows:
+            return None
+        session_id, agent_id, summary, turns, compacted, created_at, updated_at = rows[0]
+        return {
+            "id": session_id,
+            "agent_id": agent_id,
+            "summary": summary,
+            "turns": turns,
+            "compacted_messages": compacted,
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+
+    def history(self, session_id: str) -> List[Dict[str, Any]]:
+        """
+        Messages not yet folded into the summary, oldest first.
+        """
+        rows = self._execute(
+            "SELECT seq, role, content, tokens FROM messages WHERE session_id = ? AND compacted = 0 ORDER BY seq",
+            (session_id,),
+        )
+        return [{"seq": seq, "role": role, "content": content, "tokens": tokens} for seq, role, content, tokens in rows]
+
+    def compact(self, session_id: str, summary: str, through_seq: int) -> None:
+        with self._lock:
+            conn = self._db()
+            conn.execute("BEGIN")
+            try:
+                cursor = conn.execute(
+                    "UPDATE messages SET compacted = 1 WHERE session_id = ? AND seq <= ? AND compacted = 0",
+                    (session_id, through_seq),
+                )
+                conn.execute(
+                    "UPDATE sessions SET summary = ?, compacted_messages = compacted_messages + ? WHERE id = ?",
+                    (summary, cursor.rowcount, session_id),
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def artifacts(self, session_id: str) -> List[Dict[str, Any]]:
+        rows = self._execute(
+            "SELECT name, tokens, substr(content, 1, 200) FROM artifacts WHERE session_id = ? ORDER BY name", (session_id,),
+        )
+        return [{"name": name, "tokens": tokens, "preview": preview} for name, tokens, preview in rows]
+
+    def artifact(self, session_id: str, name: str) -> Optional[str]:
+        rows = self._execute("SELECT content FROM artifacts WHERE session_id = ? AND name = ?", (session_id, name))
+        return rows[0][0] if rows else None
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            conn = self._db()
+            conn.execute("BEGIN")
+            deleted = conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM artifacts WHERE session_id = ?", (session_id,))
+            conn.execute("COMMIT")
+        return bool(deleted)
+
+    def prune(self) -> int:
+        """
+        Delete sessions idle for longer than SESSION_RETENTION.
+        """
+        cutoff = time.time() - SESSION_RETENTION
+        expired = [row[0] for row in self._execute("SELECT id FROM sessions WHERE updated_at < ?", (cutoff,))]
+        for session_id in expired:
+            self.delete(session_id)
+        return len(expired)
+
+class SessionNotFound(KeyError):
+    pass
+
+class SessionManager:
+    """
+    Multi-turn conversations on top of an agent. The first turn is a normal agent run;
+    its large inputs and outputs (per `BaseAgent.session_artifacts`) are stored once as
+    artifacts. Each follow-up sends the agent's static system prompt, the rolling
+    summary, an artifact index (plus any attached artifacts) and as many recent
+    messages as fit the model's prompt budget. When the uncompacted history outgrows
+    its share of the budget, the oldest messages are folded into the summary, so
+    per-turn prompt size stays bounded however long the session runs.
+    """
+
+    def __init__(self, store: SessionStore, resolve_agent: Callable[[str], Any]):
+        self.store = store
+        self.resolve_agent = resolve_agent
+        # Turns of one session are serialized within a process. Each entry is
+        # [lock, turns holding or waiting for it] and is dropped when that reaches 0.
+        self._locks: Dict[str, list] = {}
+
+    @contextlib.asynccontextmanager
+    async def _turn(self, session_id: str) -> AsyncIterator[None]:
+        entry = self._locks.get(session_id)
+        if entry is None:
+            entry = self._locks[session_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and self._locks.get(session_id) is entry:
+                del self._locks[session_id]
+
+    async def delete(self, session_id: str) -> bool:
+        """
+        Delete a session. A turn still in flight finishes, but its reply is not stored.
+        """
+        deleted = await asyncio.to_thread(self.store.delete, session_id)
+        entry = self._locks.get(session_id)
+        if entry is not None and entry[1] == 0:
+            del self._locks[session_id]
+        return deleted
+
+    async def start(self, agent_id: str, inputs: Dict[str, Any], llm_settings: LLMSettings, **execute_kwargs: Any) -> Dict[str, Any]:
+        """
+        Run the agent once and open a session on the result.
+        """
+        agent = self.resolve_agent(agent_id)
+        result = await agent.execute(inputs, llm_settings, **execute_kwargs)
+        artifacts, answer = agent.session_artifacts(inputs, result["output"])
+
+        stored: Dict[str, str] = {}
+        described = []
+        for name, text in artifacts.items():
+            if estimate_tokens(text) > SESSION_INLINE_TOKENS:
+                stored[name] = text
+                described.append(f"- {name}: @{name} (~{estimate_tokens(text)} tokens, stored as an artifact)")
+            else:
+                described.append(f"- {name}: {text}")
+        request = f"Initial request to {agent.metadata.name} with these inputs:\n" + "\n".join(described)
+
+        session_id = uuid.uuid4().hex
+        await asyncio.to_thread(self.store.create, session_id, agent_id, stored, [("user", request), ("assistant", answer)])
+        logger.info(f"Started session {session_id} for agent {agent_id} ({len(stored)} artifacts)")
+        return {"session_id": session_id, "turn": 1, "artifacts": sorted(stored), **result}
+
+    def _system_prompt(self, agent, session: Dict[str, Any], index: List[Dict[str, Any]], attached: Dict[str, str]) -> str:
+        # Static part first so providers can reuse the cached prefix across turns
+        parts = [(agent.system_prompt or "").strip(), SESSION_INSTRUCTIONS.strip()]
+        if session["summary"]:
+            parts.append(f"Summary of the conversation so far:\n{session['summary']}")
+        if index:
+            parts.append("Artifacts:\n" + "\n".join(f"- @{item['name']} (~{item['tokens']} tokens)" for item in index))
+        for name, content in attached.items():
+            parts.append(f"Attached artifact @{name}:\n{content}")
+        return "\n\n".join(part for part in parts if part)
+
+    async def _call(self, agent, llm_settings: LLMSettings, messages: List[BaseMessage], mode: str) -> Tuple[str, Dict[str, Any]]:
+        started = time.perf_counter()
+        usage_handler = UsageTrackingHandler(llm_settings.provider, llm_settings.model_name)
+        llm = agent.get_llm(llm_settings, callbacks=[usage_handler])
+        with track_request(agent.agent_id, llm_settings.provider, llm_settings.model_name, mode) as tracked:
+            response, queue_wait = await provider_scheduler.run(
+                llm_settings.provider,
+                llm_settings.model_name,
+                lambda: llm.ainvoke(messages),
+                estimated_tokens=estimate_tokens("".join(message.content for message in messages)),
+                actual_tokens=lambda: usage_handler.total_tokens,
+            )
+            tracked["cache"] = "miss"
+        usage = agent._usage_stats(usage_handler)
+        usage["queue_wait_ms"] = round(queue_wait * 1000, 2)
+        usage_ledger.record(
+            agent.agent_id, llm_settings.provider, llm_settings.model_name, usage, mode, "miss",
+            (time.perf_counter() - started) * 1000,
+        )
+        return response.content, usage
+
+    async def _compact(self, agent, session: Dict[str, Any], history: List[Dict[str, Any]], llm_settings: LLMSettings, budget: int) -> int:
+        """
+        Fold the oldest messages into the summary until the rest fit half of `budget`.
+        Returns how many messages were compacted (0 if the summary call failed).
+        """
+        keep_tokens, keep_from = 0, len(history)
+        # Keep the newest messages that fit, always in user/assistant pairs
+        while keep_from >= 2 and keep_tokens + history[keep_from - 1]["tokens"] + history[keep_from - 2]["tokens"] <= budget // 2:
+            keep_tokens += history[keep_from - 1]["tokens"] + history[keep_from - 2]["tokens"]
+            keep_from -= 2
+        folded = history[:keep_from]
+        if not folded:
+            return 0
+
+        transcript = "\n\n".join(f"{message['role'].upper()}: {message['content']}" for message in folded)
+        messages = [
+            SystemMessage(content=SUMMARY_PROMPT.format(words=int(SESSION_SUMMARY_TOKENS * 0.75))),
+            HumanMessage(content=f"Existing summary:\n{session['summary'] or '(none)'}\n\nNew turns:\n{_truncate(transcript, 4 * budget)}"),
+        ]
+        try:
+            summary, _ = await self._call(agent, llm_settings, messages, "compaction")
+        except Exception as e:
+            # The prompt still fits: the oldest messages are left out until a later compaction succeeds
+            logger.warning(f"Session {session['id']}: compaction failed: {e}")
+            return 0
+        summary = _truncate(summary.strip(), SESSION_SUMMARY_TOKENS)
+        await asyncio.to_thread(self.store.compact, session["id"], summary, folded[-1]["seq"])
+        session["summary"] = summary
+        del history[:keep_from]
+        logger.info(f"Session {session['id']}: compacted {len(folded)} messages into the summary")
+        return len(folded)
+
+    async def send(
+        self,
+        session_id: str,
+        message: str,
+        llm_settings: LLMSettings,
+        attach: Optional[List[str]] = None,
+        timeout: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        """
+        One follow-up turn. Artifacts named in `attach` (or mentioned as @name in the
+        message) are included in this turn's prompt, truncated to their share of the budget.
+        """
+        async with self._turn(session_id):
+            session = await asyncio.to_thread(self.store.get, session_id)
+            if session is None:
+                raise SessionNotFound(session_id)
+            agent = self.resolve_agent(session["agent_id"])
+            deadline = agent.deadline(llm_settings, timeout)
+            try:
+                return await asyncio.wait_for(self._send(agent, session, message, llm_settings, attach or []), deadline)
+            except asyncio.TimeoutError:
+                raise AgentTimeout(agent.agent_id, deadline) from None
+
+    async def _send(self, agent, session: Dict[str, Any], message: str, llm_settings: LLMSettings, attach: List[str]) -> Dict[str, Any]:
+        budget = prompt_budget(llm_settings.model_name)
+        index, history = await asyncio.gather(
+            asyncio.to_thread(self.store.artifacts, session["id"]),
+            asyncio.to_thread(self.store.history, session["id"]),
+        )
+
+        names = {item["name"] for item in index}
+        wanted = [name for name in names if name in attach or f"@{name}" in message]
+        attached: Dict[str, str] = {}
+        if wanted:
+            share = int(budget * SESSION_ARTIFACT_SHARE) // len(wanted)
+            for name in sorted(wanted):
+                attached[name] = _truncate(await asyncio.to_thread(self.store.artifact, session["id"], name), share)
+
+        # Reserve room for the summary at its maximum size, since compaction may grow it
+        fixed = estimate_tokens(self._system_prompt(agent, {**session, "summary": ""}, index, attached)) + estimate_tokens(message)
+        history_budget = max(0, budget - fixed - SESSION_SUMMARY_TOKENS)
+        compacted = 0
+        if sum(item["tokens"] for item in history) > history_budget:
+            compacted = await self._compact(agent, session, history, llm_settings, history_budget)
+
+        # Newest messages that fit, in user/assistant pairs, oldest first
+        included, used = [], 0
+        for i in range(len(history) - 2, -1, -2):
+            pair = history[i:i + 2]
+            cost = sum(item["tokens"] for item in pair)
+            if used + cost > history_budget:
+                break
+            included[:0] = pair
+            used += cost
+
+        messages: List[BaseMessage] = [SystemMessage(content=self._system_prompt(agent, session, index, attached))]
+        for item in included:
+            messages.append(HumanMessage(content=item["content"]) if item["role"] == "user" else AIMessage(content=item["content"]))
+        messages.append(HumanMessage(content=message))
+
+        output, usage = await self._call(agent, llm_settings, messages, "session")
+        await asyncio.to_thread(self.store.append, session["id"], [("user", message), ("assistant", output)])
+        return {
+            "session_id": session["id"],
+            "turn": session["turns"] + 1,
+            "output": output,
+            "usage": usage,
+            "status": "success",
+            "prompt": {
+                "budget_tokens": budget,
+                "estimated_tokens": sum(estimate_tokens(item.content) for item in messages),
+                "history_messages": len(included),
+                "attached": sorted(attached),
+                "compacted_messages": compacted,
+            },
+        }
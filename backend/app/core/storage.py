@@ -0,0 +1,20 @@
+import os
+import sqlite3
+
+# Directory for local, persistent state (caches, job store, usage ledger, ...)
+DATA_DIR = os.getenv("AGENT_DATA_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "data"))
+
+def data_path(filename: str) -> str:
+    os.makedirs(DATA_DIR, exist_ok=True)
+    return os.path.join(DATA_DIR, filename)
+
+def connect_sqlite(path: str) -> sqlite3.Connection:
+    """
+    Open a SQLite connection tuned for many readers / one writer (WAL journal).
+    The connection may be used from worker threads; callers serialize access.
+    """
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
@@ -0,0 +1,318 @@
+import datetime
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.outputs import LLMResult
+
+from app.core.logger import logger
+from app.core.storage import connect_sqlite, data_path
+
+USAGE_LEDGER_ENABLED = os.getenv("USAGE_LEDGER_ENABLED", "1").lower() in ("1", "true", "yes")
+USAGE_DB = os.getenv("USAGE_DB") or data_path("usage.db")
+# The writer flushes when this many records are pending or after this many seconds
+USAGE_BATCH_SIZE = int(os.getenv("USAGE_BATCH_SIZE", "200"))
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "2.0"))
+# Records beyond this backlog are dropped (and counted) rather than blocking requests
+USAGE_MAX_PENDING = int(os.getenv("USAGE_MAX_PENDING", "100000"))
+
+# (prompt, completion, total, cached); cached prompt tokens are included in prompt
+TokenCounts = Tuple[int, int, int, int]
+
+def _cached_tokens(usage: Dict[str, Any]) -> int:
+    """
+    Prompt tokens the provider served from its prefix cache: OpenAI's
+    `prompt_tokens_details.cached_tokens`, langchain's `input_token_details.cache_read`
+    or Gemini's `cached_content_token_count`.
+    """
+    for details_key, cached_key in (("prompt_tokens_details", "cached_tokens"), ("input_token_details", "cache_read")):
+        details = usage.get(details_key)
+        if isinstance(details, dict) and details.get(cached_key):
+            return int(details[cached_key])
+    return int(usage.get("cached_content_token_count") or 0)
+
+def _from_mapping(usage: Any) -> Optional[TokenCounts]:
+    """
+    Read token counts from any of the shapes providers use:
+    OpenAI/Perplexity `token_usage`, langchain `usage_metadata` and Gemini's native counts.
+    """
+    if not isinstance(usage, dict) or not usage:
+        return None
+    for prompt_key, completion_key, total_key in (
+        ("prompt_tokens", "completion_tokens", "total_tokens"),
+        ("input_tokens", "output_tokens", "total_tokens"),
+        ("prompt_token_count", "candidates_token_count", "total_token_count"),
+    ):
+        if prompt_key in usage or completion_key in usage:
+            prompt = int(usage.get(prompt_key) or 0)
+            completion = int(usage.get(completion_key) or 0)
+            return prompt, completion, int(usage.get(total_key) or prompt + completion), _cached_tokens(usage)
+    return None
+
+def extract_token_usage(response: LLMResult) -> Optional[TokenCounts]:
+    """
+    Provider-reported token counts for one LLM call, or None if the provider sent none.
+    """
+    if response.llm_output:
+        counts = _from_mapping(response.llm_output.get("token_usage"))
+        if counts:
+            return counts
+    prompt = completion = total = cached = 0
+    found = False
+    for generations in response.generations:
+        for generation in generations:
+            message = getattr(generation, "message", None)
+            metadata = getattr(message, "response_metadata", None) or {}
+            for usage in (
+                getattr(message, "usage_metadata", None),
+                metadata.get("usage_metadata"),
+                metadata.get("token_usage"),
+                (generation.generation_info or {}).get("usage_metadata"),
+            ):
+                counts = _from_mapping(usage)
+                if counts:
+                    prompt, completion, total = prompt + counts[0], completion + counts[1], total + counts[2]
+                    cached += counts[3]
+                    found = True
+                    break
+    return (prompt, completion, total, cached) if found else None
+
+class UsageLedger:
+    """
+    Append-only SQLite ledger of per-run token usage.
+
+    `record()` only enqueues; a background thread writes records in batches, so
+    request latency never waits on disk.
+    """
+
+    COLUMNS = (
+        "ts", "day", "agent_id", "provider", "model", "mode", "cache", "prompt_tokens",
+        "completion_tokens", "total_tokens", "requests", "estimated", "duration_ms", "cached_tokens",
+    )
+    GROUPS = {"agent": "agent_id", "provider": "provider", "model": "model", "day": "day", "mode": "mode", "cache": "cache"}
+
+    def __init__(self, db_path: str = USAGE_DB):
+        self.db_path = db_path
+        self.dropped = 0
+        self.written = 0
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue(maxsize=USAGE_MAX_PENDING)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._thread: Optional[threading.Thread] = None
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self) -> None:
+        # The writer thread and connection belong to the parent process
+        self._conn = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=USAGE_MAX_PENDING)
+
+    def _db(self):
+        if self._conn is None:
+            self._conn = connect_sqlite(self.db_path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS usage ("
+                " ts REAL NOT NULL,"
+                " day TEXT NOT NULL,"
+                " agent_id TEXT NOT NULL,"
+                " provider TEXT NOT NULL,"
+                " model TEXT NOT NULL,"
+                " mode TEXT NOT NULL,"
+                " cache TEXT NOT NULL,"
+                " prompt_tokens INTEGER NOT NULL,"
+                " completion_tokens INTEGER NOT NULL,"
+                " total_tokens INTEGER NOT NULL,"
+                " requests INTEGER NOT NULL,"
+                " estimated INTEGER NOT NULL,"
+                " duration_ms REAL NOT NULL,"
+                " cached_tokens INTEGER NOT NULL DEFAULT 0)"
+            )
+            # Ledgers created before cached prompt tokens were recorded
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(usage)")}
+            if "cached_tokens" not in columns:
+                self._conn.execute("ALTER TABLE usage ADD COLUMN cached_tokens INTEGER NOT NULL DEFAULT 0")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_usage_day ON usage(day, agent_id, model)")
+        return self._conn
+
+    def _ensure_writer(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._writer, name="usage-ledger", daemon=True)
+                    self._thread.start()
+
+    def record(
+        self,
+        agent_id: str,
+        provider: str,
+        model: str,
+        usage: Dict[str, Any],
+        mode: str,
+        cache: str,
+        duration_ms: float,
+    ) -> None:
+        """
+        Queue one completed run. Cache hits and coalesced runs are recorded with zero tokens.
+        """
+        if not USAGE_LEDGER_ENABLED:
+            return
+        now = time.time()
+        spent = cache not in ("hit", "coalesced")
+        row = (
+            now,
+            datetime.datetime.fromtimestamp(now, datetime.timezone.utc).strftime("%Y-%m-%d"),
+            agent_id,
+            provider,
+            model,
+            mode,
+            cache,
+            usage.get("prompt_tokens", 0) if spent else 0,
+            usage.get("completion_tokens", 0) if spent else 0,
+            usage.get("total_tokens", 0) if spent else 0,
+            usage.get("successful_requests", 0) if spent else 0,
+            1 if spent and usage.get("estimated") else 0,
+            round(duration_ms, 2),
+            usage.get("cached_tokens", 0) if spent else 0,
+        )
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+            return
+        self._ensure_writer()
+
+    def _write(self, rows: List[tuple]) -> None:
+        placeholders = ", ".join("?" for _ in self.COLUMNS)
+        with self._lock:
+            conn = self._db()
+            conn.execute("BEGIN")
+            conn.executemany(f"INSERT INTO usage ({', '.join(self.COLUMNS)}) VALUES ({placeholders})", rows)
+            conn.execute("COMMIT")
+        self.written += len(rows)
+
+    def _write_batch(self, rows: List[tuple]) -> None:
+        if not rows:
+            return
+        try:
+            self._write(rows)
+        except Exception as e:
+            self.dropped += len(rows)
+            logger.error(f"Failed to write {len(rows)} usage records: {e}")
+
+    def _drain_nowait(self) -> None:
+        rows = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(item, threading.Event):
+                self._write_batch(rows)
+                rows = []
+                item.set()
+            elif item is not None:
+                rows.append(item)
+        self._write_batch(rows)
+
+    def _writer(self) -> None:
+        # Queue items: a record tuple, a flush marker (threading.Event) or None to stop
+        while True:
+            item = self._queue.get()
+            deadline = time.monotonic() + USAGE_FLUSH_INTERVAL
+            rows: List[tuple] = []
+            while isinstance(item, tuple):
+                rows.append(item)
+                if len(rows) >= USAGE_BATCH_SIZE:
+                    item = False
+                    break
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    item = False
+            self._write_batch(rows)
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is None:
+                self._drain_nowait()
+                return
+
+    def flush(self, timeout: float = 10.0) -> None:
+        """
+        Block until everything recorded so far is on disk (used before queries and at shutdown).
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._drain_nowait()
+            return
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return
+        done.wait(timeout)
+
+    def close(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout=10)
+        self._drain_nowait()
+
+    def aggregate(
+        self,
+        group_by: List[str],
+        since: Optional[str] = None,
+        until: Optional[str] = None,
+        agent_id: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Totals grouped by any of GROUPS, optionally limited to a day range (inclusive, YYYY-MM-DD) or agent.
+        """
+        columns = [self.GROUPS[name] for name in group_by]
+        where, params = [], []
+        if since:
+            where.append("day >= ?")
+            params.append(since)
+        if until:
+            where.append("day <= ?")
+            params.append(until)
+        if agent_id:
+            where.append("agent_id = ?")
+            params.append(agent_id)
+        sql = (
+            "SELECT " + "".join(f"{column}, " for column in columns) +
+            "COUNT(*), SUM(cache = 'hit'), SUM(cache = 'coalesced'), SUM(prompt_tokens), SUM(completion_tokens), SUM(total_tokens),"
+            " SUM(cached_tokens), SUM(requests), SUM(estimated), AVG(duration_ms) FROM usage" +
+            (" WHERE " + " AND ".join(where) if where else "") +
+            (" GROUP BY " + ", ".join(columns) + " ORDER BY " + ", ".join(columns) if columns else "")
+        )
+        with self._lock:
+            rows = self._db().execute(sql, params).fetchall()
+
+        results = []
+        for row in rows:
+            keys, values = row[:len(columns)], row[len(columns):]
+            runs, hits, coalesced, prompt, completion, total, cached, requests, estimated, avg_ms = values
+            item = dict(zip(group_by, keys))
+            item.update({
+                "runs": runs,
+                "cache_hits": hits or 0,
+                "coalesced_runs": coalesced or 0,
+                "prompt_tokens": prompt or 0,
+                "completion_tokens": completion or 0,
+                "total_tokens": total or 0,
+                "cached_tokens": cached or 0,
+                "cached_prompt_ratio": round((cached or 0) / prompt, 4) if prompt else 0.0,
+                "llm_requests": requests or 0,
+                "estimated_runs": estimated or 0,
+                "tokens_per_run": round((total or 0) / runs, 2) if runs else 0.0,
+                "avg_duration_ms": round(avg_ms or 0.0, 2),
+            })
+            results.append(item)
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {"pending": self._queue.qsize(), "written": self.written, "dropped": self.dropped}
+
+usage_ledger = UsageLedger()
@@ -0,0 +1,208 @@
+import re
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from app.core.metrics import VALIDATION_DURATION, VALIDATION_FAILURES
+
+# (value, path, errors) -> None; appends {"loc", "msg", "type"} dicts to errors
+Check = Callable[[Any, Sequence[Any], List[Dict[str, Any]]], None]
+
+# Stop collecting errors past this many (a 10k-row ledger with one bad column would otherwise produce 10k)
+MAX_ERRORS = 50
+
+TYPE_CHECKS: Dict[str, Callable[[Any], bool]] = {
+    "string": lambda value: isinstance(value, str),
+    # bool is an int subclass, but JSON booleans are not numbers
+    "number": lambda value: isinstance(value, (int, float)) and not isinstance(value, bool),
+    "integer": lambda value: (
+        isinstance(value, int) and not isinstance(value, bool)
+        or isinstance(value, float) and value.is_integer()
+    ),
+    "boolean": lambda value: isinstance(value, bool),
+    "object": lambda value: isinstance(value, dict),
+    "array": lambda value: isinstance(value, list),
+    "null": lambda value: value is None,
+}
+
+class SchemaError(ValueError):
+    """
+    An agent's inputs_schema uses something the compiler does not support.
+    """
+
+class InputValidationError(ValueError):
+    def __init__(self, errors: List[Dict[str, Any]]):
+        super().__init__(f"{len(errors)} input validation error(s)")
+        self.errors = errors
+
+class _Stop(Exception):
+    # Raised by a check to skip the rest of the checks on the same value
+    pass
+
+def _error(errors: List[Dict[str, Any]], path: Sequence[Any], error_type: str, msg: str) -> None:
+    if len(errors) < MAX_ERRORS:
+        errors.append({"loc": list(path), "msg": msg, "type": error_type})
+
+def _compile(schema: Dict[str, Any], where: str) -> Check:
+    """
+    Turn one (sub)schema into a closure that only performs the checks the schema declares.
+    Supports the JSON Schema keywords agents use: type, enum, string/number/array/object
+    bounds, pattern, items, properties, required and additionalProperties.
+    """
+    if not isinstance(schema, dict):
+        raise SchemaError(f"{where}: schema must be an object")
+    checks: List[Check] = []
+
+    types = schema.get("type")
+    if types is not None:
+        types = [types] if isinstance(types, str) else list(types)
+        unknown = [name for name in types if name not in TYPE_CHECKS]
+        if unknown:
+            raise SchemaError(f"{where}: unsupported type {unknown[0]!r}")
+        type_checks = [TYPE_CHECKS[name] for name in types]
+        expected = " or ".join(types)
+
+        def check_type(value, path, errors):
+            if not any(matches(value) for matches in type_checks):
+                _error(errors, path, "type", f"Expected {expected}, got {type(value).__name__}")
+                # The remaining checks assume the right type
+                raise _Stop
+        checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = list(schema["enum"])
+
+        def check_enum(value, path, errors):
+            if value not in allowed:
+                _error(errors, path, "enum", f"Must be one of: {', '.join(map(str, allowed))}")
+        checks.append(check_enum)
+
+    min_length, max_length = schema.get("minLength"), schema.get("maxLength")
+    if min_length is not None or max_length is not None:
+        def check_length(value, path, errors):
+            if not isinstance(value, str):
+                return
+            if max_length is not None and len(value) > max_length:
+                _error(errors, path, "max_length", f"At most {max_length} characters allowed, got {len(value)}")
+            elif min_length is not None and len(value) < min_length:
+                _error(errors, path, "min_length", "Must not be empty" if min_length == 1 else f"At least {min_length} characters required")
+        checks.append(check_length)
+
+    if "pattern" in schema:
+        pattern = re.compile(schema["pattern"])
+
+        def check_pattern(value, path, errors):
+            if isinstance(value, str) and not pattern.search(value):
+                _error(errors, path, "pattern", f"Does not match {pattern.pattern!r}")
+        checks.append(check_pattern)
+
+    minimum, maximum = schema.get("minimum"), schema.get("maximum")
+    if minimum is not None or maximum is not None:
+        def check_range(value, path, errors):
+            if not TYPE_CHECKS["number"](value):
+                return
+            if minimum is not None and value < minimum:
+                _error(errors, path, "minimum", f"Must be at least {minimum}")
+            elif maximum is not None and value > maximum:
+                _error(errors, path, "maximum", f"Must be at most {maximum}")
+        checks.append(check_range)
+
+    min_items, max_items = schema.get("minItems"), schema.get("maxItems")
+    if min_items is not None or max_items is not None:
+        def check_items_count(value, path, errors):
+            if not isinstance(value, list):
+                return
+            if max_items is not None and len(value) > max_items:
+                _error(errors, path, "max_items", f"At most {max_items} items allowed, got {len(value)}")
+                raise _Stop
+            if min_items is not None and len(value) < min_items:
+                _error(errors, path, "min_items", f"At least {min_items} items required")
+        checks.append(check_items_count)
+
+    if "items" in schema:
+        check_item = _compile(schema["items"], f"{where}.items")
+
+        def check_items(value, path, errors):
+            if not isinstance(value, list):
+                return
+            for index, item in enumerate(value):
+                if len(errors) >= MAX_ERRORS:
+                    return
+                _run(check_item, item, (*path, index), errors)
+        checks.append(check_items)
+
+    max_properties = schema.get("maxProperties")
+    if max_properties is not None:
+        def check_properties_count(value, path, errors):
+            if isinstance(value, dict) and len(value) > max_properties:
+                _error(errors, path, "max_properties", f"At most {max_properties} entries allowed, got {len(value)}")
+                raise _Stop
+        checks.append(check_properties_count)
+
+    required = list(schema.get("required", ()))
+    if required:
+        def check_required(value, path, errors):
+            if not isinstance(value, dict):
+                return
+            for name in required:
+                if value.get(name) is None:
+                    _error(errors, (*path, name), "missing", "Field required")
+        checks.append(check_required)
+
+    properties = {
+        name: _compile(subschema, f"{where}.properties.{name}")
+        for name, subschema in (schema.get("properties") or {}).items()
+    }
+    additional = schema.get("additionalProperties", True)
+    check_additional = _compile(additional, f"{where}.additionalProperties") if isinstance(additional, dict) else None
+    if properties or additional is not True:
+        def check_properties(value, path, errors):
+            if not isinstance(value, dict):
+                return
+            for name, item in value.items():
+                check = properties.get(name)
+                if check is None and additional is False:
+                    _error(errors, (*path, name), "extra_forbidden", "Unknown field")
+                    continue
+                check = check or check_additional
+                # Optional fields may be sent as null
+                if check is not None and item is not None:
+                    _run(check, item, (*path, name), errors)
+        checks.append(check_properties)
+
+    def check_all(value, path, errors):
+        for check in checks:
+            check(value, path, errors)
+    return check_all
+
+def _run(check: Check, value: Any, path: Sequence[Any], errors: List[Dict[str, Any]]) -> None:
+    try:
+        check(value, path, errors)
+    except _Stop:
+        pass
+
+class InputValidator:
+    """
+    An agent's inputs_schema compiled once into nested closures, so validating a
+    request is a walk over the inputs with no schema interpretation.
+    """
+
+    def __init__(self, agent_id: str, schema: Optional[Dict[str, Any]]):
+        self.agent_id = agent_id
+        self._check = _compile(schema or {}, agent_id)
+
+    def errors(self, inputs: Any, loc: Sequence[Any] = ("body", "inputs")) -> List[Dict[str, Any]]:
+        """
+        Validation errors for `inputs` in FastAPI's 422 format (empty when valid).
+        """
+        started = time.perf_counter()
+        errors: List[Dict[str, Any]] = []
+        _run(self._check, inputs, tuple(loc), errors)
+        VALIDATION_DURATION.observe(time.perf_counter() - started, self.agent_id)
+        if errors:
+            VALIDATION_FAILURES.inc(self.agent_id)
+        return errors
+
+    def validate(self, inputs: Any, loc: Sequence[Any] = ("body", "inputs")) -> None:
+        errors = self.errors(inputs, loc)
+        if errors:
+            raise InputValidationError(errors)
@@ -0,0 +1,224 @@
+"""
+Load generator for POST /agents/{agent_id}/run against the stub LLM provider.
+
+Drives the backend at fixed concurrency levels and reports throughput,
+p50/p95/p99 latency and framework overhead: end-to-end latency minus the
+time the stub LLM spent serving the same requests (read from its /stats).
+With --spawn, the stub and a backend instance are started on free local
+ports, so the whole run is offline and spends no tokens.
+
+Usage (from backend/):
+    python benchmarks/load_test.py --spawn [--agent seo-agent] [--concurrency 1,8,32]
+        [--requests 200] [--latency-ms 200] [--tokens-per-second 100] [--json]
+    python benchmarks/load_test.py --url http://127.0.0.1:8000 --stub-url http://127.0.0.1:9100
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_INPUTS = {
+    "seo-agent": {"content": "Budget planning for small businesses. " * 20, "target_keyword": "budget planning"},
+    "code-review-agent": {"code_snippet": "def add(a, b):\n    return a + b\n" * 10, "language": "python"},
+    "financial-advisor": {
+        "income": 85000,
+        "expenses": {"rent": 1800, "food": 600},
+        "financial_goals": ["emergency fund", "retirement"],
+        "risk_tolerance": "moderate",
+    },
+}
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def _unique(inputs: Dict[str, Any], n: int) -> Dict[str, Any]:
+    """
+    Make each request distinct so neither the response cache nor request coalescing
+    short-circuits it: the first string input gets a request number appended.
+    """
+    inputs = dict(inputs)
+    for key, value in inputs.items():
+        if isinstance(value, str):
+            inputs[key] = f"{value} [{n}]"
+            break
+    return inputs
+
+async def _wait_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+                await asyncio.sleep(0.2)
+
+@contextlib.contextmanager
+def _spawned(args):
+    """
+    Start the stub and a backend wired to it. Yields (backend url, stub url).
+    """
+    stub_port, backend_port = _free_port(), _free_port()
+    stub_url = f"http://127.0.0.1:{stub_port}"
+    data_dir = tempfile.mkdtemp(prefix="agent-bench-")
+    env = dict(
+        os.environ,
+        STUB_BASE_URL=f"{stub_url}/v1",
+        AGENT_DATA_DIR=data_dir,
+        LOG_LEVEL=os.getenv("LOG_LEVEL", "WARNING"),
+    )
+    processes = [
+        subprocess.Popen(
+            [
+                sys.executable, "benchmarks/stub_llm_server.py", "--port", str(stub_port),
+                "--latency-ms", str(args.latency_ms), "--tokens-per-second", str(args.tokens_per_second),
+                "--completion-tokens", str(args.completion_tokens), "--error-rate", str(args.error_rate),
+            ],
+            cwd=BACKEND_DIR,
+        ),
+        subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(backend_port), "--log-level", "warning"],
+            cwd=BACKEND_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+        ),
+    ]
+    try:
+        yield f"http://127.0.0.1:{backend_port}", stub_url
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait(timeout=10)
+
+async def run_level(client: httpx.AsyncClient, args, concurrency: int, offset: int) -> Dict[str, Any]:
+    url = f"{args.url}/agents/{args.agent}/run"
+    inputs = json.loads(args.inputs) if args.inputs else DEFAULT_INPUTS[args.agent]
+    settings = {"provider": "stub", "model_name": args.model, "temperature": 0}
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(offset, offset + args.requests))
+
+    async def worker():
+        nonlocal errors
+        for n in counter:
+            payload = {"inputs": _unique(inputs, n), "llm_settings": settings, "bypass_cache": True}
+            started = time.perf_counter()
+            try:
+                response = await client.post(url, json=payload)
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    stub_before = (await client.get(f"{args.stub_url}/stats")).json()
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stub_after = (await client.get(f"{args.stub_url}/stats")).json()
+
+    stub_requests = stub_after["requests"] - stub_before["requests"]
+    stub_seconds = stub_after["busy_seconds"] - stub_before["busy_seconds"]
+    ordered = sorted(latencies)
+    mean = statistics.fmean(ordered) if ordered else 0.0
+    # LLM time per agent run (an agent run may make several calls)
+    llm_per_run = stub_seconds / len(ordered) if ordered else 0.0
+    return {
+        "concurrency": concurrency,
+        "requests": args.requests,
+        "errors": errors,
+        "throughput_rps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(_percentile(ordered, 0.50) * 1000, 1),
+        "p95_ms": round(_percentile(ordered, 0.95) * 1000, 1),
+        "p99_ms": round(_percentile(ordered, 0.99) * 1000, 1),
+        "mean_ms": round(mean * 1000, 1),
+        "llm_calls_per_run": round(stub_requests / len(ordered), 2) if ordered else 0.0,
+        "llm_ms_per_run": round(llm_per_run * 1000, 1),
+        "overhead_ms": round((mean - llm_per_run) * 1000, 1),
+    }
+
+async def run(args) -> List[Dict[str, Any]]:
+    levels = [int(level) for level in args.concurrency.split(",")]
+    await _wait_ready(f"{args.stub_url}/stats")
+    await _wait_ready(f"{args.url}/config/models")
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    async with httpx.AsyncClient(timeout=300.0, limits=limits) as client:
+        if args.warmup:
+            warmup = argparse.Namespace(**{**vars(args), "requests": args.warmup})
+            await run_level(client, warmup, min(levels), 0)
+        results = []
+        offset = args.warmup
+        for concurrency in levels:
+            results.append(await run_level(client, args, concurrency, offset))
+            offset += args.requests
+        return results
+
+def report(results: List[Dict[str, Any]]) -> None:
+    columns = (
+        ("concurrency", "conc"), ("throughput_rps", "req/s"), ("errors", "errors"), ("p50_ms", "p50 ms"),
+        ("p95_ms", "p95 ms"), ("p99_ms", "p99 ms"), ("llm_ms_per_run", "llm ms"), ("overhead_ms", "overhead ms"),
+    )
+    print("".join(f"{title:>13}" for _, title in columns))
+    for row in results:
+        print("".join(f"{row[key]:>13}" for key, _ in columns))
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", help="Backend base URL (ignored with --spawn)")
+    parser.add_argument("--stub-url", default="http://127.0.0.1:9100", help="Stub server base URL (ignored with --spawn)")
+    parser.add_argument("--spawn", action="store_true", help="Start the stub and a backend locally")
+    parser.add_argument("--agent", default="seo-agent")
+    parser.add_argument("--inputs", help="Agent inputs as JSON (defaults exist for some agents)")
+    parser.add_argument("--model", default="stub-model")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    # Stub behaviour, used with --spawn
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--tokens-per-second", type=float, default=100)
+    parser.add_argument("--completion-tokens", type=int, default=50)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+    if not args.inputs and args.agent not in DEFAULT_INPUTS:
+        parser.error(f"--inputs is required for agent {args.agent}")
+    if not args.spawn and not args.url:
+        parser.error("either --url or --spawn is required")
+
+    if args.spawn:
+        with _spawned(args) as (args.url, args.stub_url):
+            results = asyncio.run(run(args))
+    else:
+        results = asyncio.run(run(args))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        report(results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Startup time / memory benchmark for the agent registry.
+
+Compares a worker's startup -- importing the app and running its startup hooks
+(SDK preload, job queue, catalog index, ...) -- with the old eager behaviour
+(every agent instantiated and every provider SDK imported), the lazy default,
+and the lazy registry with every SDK preloaded. Each measurement runs in a
+fresh interpreter with its own AGENT_DATA_DIR.
+
+Usage (from backend/):
+    python benchmarks/startup_benchmark.py [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ALL_SDKS = "openai,gemini,perplexity"
+
+# Environment of each mode; provider keys are cleared so the defaults do not depend on the shell
+MODES = {
+    "eager": {"AGENT_REGISTRY_EAGER": "1", "LLM_PRELOAD_SDKS": ALL_SDKS},
+    "lazy": {"AGENT_REGISTRY_EAGER": "0", "LLM_PRELOAD_SDKS": ""},
+    "preload": {"AGENT_REGISTRY_EAGER": "0", "LLM_PRELOAD_SDKS": ALL_SDKS},
+}
+
+CHILD = """
+import asyncio, json, resource, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter() - started
+
+async def start_and_stop():
+    await main.app.router.startup()
+    elapsed = time.perf_counter() - started
+    await main.app.router.shutdown()
+    return elapsed
+
+elapsed = asyncio.run(start_and_stop())
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == "darwin":
+    rss_kb //= 1024
+print(json.dumps({"seconds": elapsed, "import_seconds": imported, "rss_mb": rss_kb / 1024, "modules": len(sys.modules)}))
+"""
+
+def measure(mode: str) -> dict:
+    env = {k: v for k, v in os.environ.items() if not k.endswith("_API_KEY")}
+    env.update(MODES[mode], LLM_WARMUP="0")
+    with tempfile.TemporaryDirectory() as data_dir:
+        env["AGENT_DATA_DIR"] = data_dir
+        output = subprocess.run(
+            [sys.executable, "-c", CHILD],
+            cwd=BACKEND_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def summarize(samples: list) -> dict:
+    return {
+        "import_ms": round(statistics.median(s["import_seconds"] for s in samples) * 1000, 1),
+        "startup_ms": round(statistics.median(s["seconds"] for s in samples) * 1000, 1),
+        "rss_mb": round(statistics.median(s["rss_mb"] for s in samples), 1),
+        "modules": samples[0]["modules"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    results = {mode: summarize([measure(mode) for _ in range(args.runs)]) for mode in MODES}
+
+    print(f"{'mode':<9}{'import (ms)':>13}{'startup (ms)':>14}{'max RSS (MB)':>14}{'modules':>10}")
+    for label, row in results.items():
+        print(
+            f"{label:<9}{row['import_ms']:>13}{row['startup_ms']:>14}"
+            f"{row['rss_mb']:>14}{row['modules']:>10}"
+        )
+
+    eager, lazy = results["eager"], results["lazy"]
+    print(
+        f"\nlazy registry: {eager['startup_ms'] - lazy['startup_ms']:.1f} ms faster startup, "
+        f"{eager['rss_mb'] - lazy['rss_mb']:.1f} MB less RSS per worker"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Local OpenAI-compatible chat completions server for offline load tests.
+
+Answers POST /v1/chat/completions (plain and streamed) with filler text after a
+configurable latency, at a configurable token rate, failing a configurable
+fraction of requests. Like OpenAI's prompt caching, a leading system message seen
+before is reported as cached prompt tokens. GET /stats reports how many requests it served and the
+time it spent on them, so the load generator can subtract it from end-to-end
+latency. Point the backend at it with provider "stub" (STUB_BASE_URL).
+
+Usage (from backend/):
+    python benchmarks/stub_llm_server.py [--port 9100] [--latency-ms 200]
+        [--tokens-per-second 100] [--completion-tokens 50] [--error-rate 0.0]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Stub LLM")
+
+CONFIG = {
+    # Time to first token
+    "latency_ms": float(os.getenv("STUB_LATENCY_MS", "200")),
+    # Uniform jitter applied to latency_ms, as a fraction (0.2 = +/-20%)
+    "jitter": float(os.getenv("STUB_JITTER", "0.1")),
+    "tokens_per_second": float(os.getenv("STUB_TOKENS_PER_SECOND", "100")),
+    "completion_tokens": int(os.getenv("STUB_COMPLETION_TOKENS", "50")),
+    "error_rate": float(os.getenv("STUB_ERROR_RATE", "0")),
+    "error_status": int(os.getenv("STUB_ERROR_STATUS", "500")),
+}
+STATS = {"requests": 0, "errors": 0, "busy_seconds": 0.0, "cached_tokens": 0}
+# System prompts already seen, i.e. prefixes the "provider" has cached
+PREFIXES = set()
+
+WORDS = "the ledger balance shows steady growth across every quarter and the plan stays on track".split()
+
+def _latency() -> float:
+    jitter = CONFIG["jitter"]
+    return CONFIG["latency_ms"] / 1000 * random.uniform(1 - jitter, 1 + jitter)
+
+def _tokens():
+    for i in range(CONFIG["completion_tokens"]):
+        yield WORDS[i % len(WORDS)] + " "
+
+def _cached_tokens(messages) -> int:
+    if not messages or messages[0].get("role") != "system":
+        return 0
+    prefix = str(messages[0].get("content", ""))
+    if prefix not in PREFIXES:
+        PREFIXES.add(prefix)
+        return 0
+    return len(prefix) // 4
+
+def _usage(messages) -> dict:
+    prompt_tokens = sum(len(str(message.get("content", ""))) for message in messages) // 4
+    cached_tokens = _cached_tokens(messages)
+    STATS["cached_tokens"] += cached_tokens
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": CONFIG["completion_tokens"],
+        "total_tokens": prompt_tokens + CONFIG["completion_tokens"],
+        "prompt_tokens_details": {"cached_tokens": cached_tokens},
+    }
+
+def _chunk(completion_id: str, model: str, delta: dict, finish_reason=None, usage=None) -> str:
+    payload = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    if usage is not None:
+        payload["usage"] = usage
+    return f"data: {json.dumps(payload)}\n\n"
+
+@app.get("/v1/models")
+async def list_models():
+    return {"object": "list", "data": [{"id": "stub-model", "object": "model", "owned_by": "stub"}]}
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    started = time.perf_counter()
+    body = await request.json()
+    model = body.get("model", "stub-model")
+    STATS["requests"] += 1
+
+    await asyncio.sleep(_latency())
+    if random.random() < CONFIG["error_rate"]:
+        STATS["errors"] += 1
+        STATS["busy_seconds"] += time.perf_counter() - started
+        return JSONResponse(
+            {"error": {"message": "stub failure", "type": "server_error"}},
+            status_code=CONFIG["error_status"],
+        )
+
+    interval = 1 / CONFIG["tokens_per_second"] if CONFIG["tokens_per_second"] > 0 else 0.0
+    usage = _usage(body.get("messages", []))
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+    if body.get("stream"):
+        async def events():
+            try:
+                for i, token in enumerate(_tokens()):
+                    if i and interval:
+                        await asyncio.sleep(interval)
+                    yield _chunk(completion_id, model, {"role": "assistant", "content": token} if i == 0 else {"content": token})
+                yield _chunk(completion_id, model, {}, "stop", usage)
+                yield "data: [DONE]\n\n"
+            finally:
+                STATS["busy_seconds"] += time.perf_counter() - started
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    # Non-streamed answers still take as long as generating the tokens would
+    await asyncio.sleep(interval * max(0, CONFIG["completion_tokens"] - 1))
+    STATS["busy_seconds"] += time.perf_counter() - started
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(_tokens())}, "finish_reason": "stop"}],
+        "usage": usage,
+    }
+
+@app.get("/stats")
+async def stats():
+    return {**STATS, "config": CONFIG}
+
+@app.post("/stats/reset")
+async def reset_stats():
+    STATS.update(requests=0, errors=0, busy_seconds=0.0, cached_tokens=0)
+    PREFIXES.clear()
+    return STATS
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=CONFIG["latency_ms"])
+    parser.add_argument("--jitter", type=float, default=CONFIG["jitter"])
+    parser.add_argument("--tokens-per-second", type=float, default=CONFIG["tokens_per_second"])
+    parser.add_argument("--completion-tokens", type=int, default=CONFIG["completion_tokens"])
+    parser.add_argument("--error-rate", type=float, default=CONFIG["error_rate"])
+    parser.add_argument("--error-status", type=int, default=CONFIG["error_status"])
+    args = parser.parse_args()
+    for key in CONFIG:
+        CONFIG[key] = getattr(args, key)
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
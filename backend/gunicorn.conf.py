@@ -0,0 +1,35 @@
+"""
+Production server: several pre-forked uvicorn workers under gunicorn.
+
+    gunicorn -c gunicorn.conf.py main:app
+    SERVER_MODE=production python main.py      # same thing
+
+The app is imported once in the master and forked into WEB_CONCURRENCY workers
+(default: one per CPU). `kill -HUP <master>` replaces workers gracefully, letting
+in-flight requests finish within GRACEFUL_TIMEOUT; with preloading, code changes
+need `kill -USR2` (new master) or a restart. Rate-limit budgets, the response
+cache's disk tier, jobs and usage live in SQLite under AGENT_DATA_DIR, so all
+workers share them.
+"""
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("GUNICORN_PRELOAD", "1").lower() in ("1", "true", "yes")
+
+# LLM calls and streams are long; give them time to finish on reload/shutdown
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "120"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "300"))
+keepalive = int(os.getenv("KEEPALIVE", "5"))
+# Recycle workers periodically (0 disables)
+max_requests = int(os.getenv("MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", "100"))
+
+accesslog = os.getenv("ACCESS_LOG") or None
+errorlog = "-"
+
+# Read by the app at import time, which happens after this file is loaded
+os.environ["WEB_CONCURRENCY"] = str(workers)
+os.environ.setdefault("SHARED_RATE_LIMITS", "1" if workers > 1 else "0")
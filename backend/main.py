@@ -1,19 +1,35 @@
 import os
+import sys
+import json
+import asyncio
+import tempfile
 # Fix for gRPC DNS resolution on macOS
 os.environ["GRPC_DNS_RESOLVER"] = "native"
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, File, Form, HTTPException, Query, Request, UploadFile, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Dict, Any, List
+from pydantic import BaseModel, Field, ValidationError
+from typing import Dict, Any, List, Optional
 
-from app.core.llm import LLMProvider, LLMSettings
+from app.core.llm import LLM_PRELOAD_SDKS, SUPPORTED_MODELS, LLMProvider, LLMSettings
 from app.core.logger import logger
-from app.agents.financial_advisor import FinancialAdvisorAgent
-from app.agents.ledger_agent import LedgerAgent
-from app.agents.code_review_agent import CodeReviewAgent
-from app.agents.seo_optimization_agent import SeoOptimizationAgent
-from app.agents.business_strategy_advisor import BusinessStrategyAdvisor
+from app.core.cache import response_cache
+from app.core.coalesce import single_flight
+from app.core.deadlines import cancel_on_disconnect, error_status
+from app.core.fallback import FALLBACK_CHAINS, latency_tracker
+from app.core.executor import cpu_executor, loop_lag_monitor
+from app.core.catalog import AgentCatalog
+from app.core.batch import BATCH_MAX_ITEMS, run_batch, stream_batch
+from app.core.pipeline import PipelineError, PipelineStep, plan_pipeline, run_pipeline, stream_pipeline
+from app.core.jobs import JobQueue
+from app.core.sessions import SESSION_MAX_MESSAGE_CHARS, SESSION_PRUNE_INTERVAL, SessionManager, SessionNotFound, SessionStore
+from app.core.rate_limit import provider_scheduler
+from app.core.http_cache import PrecomputedJSON
+from app.core.metrics import registry as metrics_registry
+from app.core.usage import usage_ledger
+from app.core.storage import data_path
+from app.agents.registry import AGENT_SPECS, AgentRegistry
 
 app = FastAPI(title="100 AI Agents API")
 
@@ -24,28 +40,126 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
-# Registry of available agents
-AGENTS = {
-    "financial-advisor": FinancialAdvisorAgent(),
-    "ledger-agent": LedgerAgent(),
-    "code-review-agent": CodeReviewAgent(),
-    "seo-agent": SeoOptimizationAgent(),
-    "business-strategy-advisor": BusinessStrategyAdvisor()
-}
-
-# Supported Models Configuration
-# Updated to use correct model names for Gemini and others
-SUPPORTED_MODELS = {
-    "openai": ["gpt-4o", "gpt-4-turbo", "gpt-3.5-turbo"],
-    "gemini": [ "gemini-2.5-flash", "gemini-2.5-pro", "gemini-flash-latest", "gemini-2.5-flash-lite", "gemma-3-12b"],
-    "perplexity": ["sonar-deep-research", "sonar-reasoning-pro", "sonar-pro", "sonar"],
-}
+# Registry of available agents; modules are imported and agents built on first use
+AGENTS = AgentRegistry(AGENT_SPECS)
+if os.getenv("AGENT_REGISTRY_EAGER", "0").lower() in ("1", "true", "yes"):
+    AGENTS.load_all()
+
+# Background job queue for long-running executions
+job_queue = JobQueue(resolve_agent=AGENTS.get)
+
+# Multi-turn conversations with server-side history
+session_store = SessionStore()
+sessions = SessionManager(session_store, resolve_agent=AGENTS.get)
+# Background task deleting expired sessions every SESSION_PRUNE_INTERVAL
+session_pruner: Optional[asyncio.Task] = None
+
+# Searchable index of the agents/*.md documentation
+agent_catalog = AgentCatalog()
+# In-flight background refresh of the catalog index, if any
+catalog_refresh: Optional[asyncio.Future] = None
+
+# Optional connection warm-up for the configured models (LLM_WARMUP=1)
+LLM_WARMUP = os.getenv("LLM_WARMUP", "0").lower() in ("1", "true", "yes")
+
+@app.on_event("startup")
+async def warm_up_llm_clients():
+    # Off the event loop: the first request would otherwise block it while the SDKs import
+    await asyncio.to_thread(LLMProvider.preload_sdks, LLM_PRELOAD_SDKS)
+    if LLM_WARMUP:
+        await LLMProvider.warm_up(SUPPORTED_MODELS)
+
+@app.on_event("startup")
+async def start_job_queue():
+    await job_queue.start()
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    await job_queue.stop()
+
+@app.on_event("startup")
+async def build_agent_catalog_index():
+    await asyncio.to_thread(agent_catalog.refresh)
+
+async def prune_sessions_periodically():
+    while True:
+        try:
+            pruned = await asyncio.to_thread(session_store.prune)
+            if pruned:
+                logger.info(f"Pruned {pruned} expired sessions")
+        except Exception as e:
+            logger.warning(f"Could not prune sessions: {e}")
+        await asyncio.sleep(SESSION_PRUNE_INTERVAL)
+
+@app.on_event("startup")
+async def start_session_pruning():
+    global session_pruner
+    session_pruner = asyncio.create_task(prune_sessions_periodically())
+
+@app.on_event("shutdown")
+async def stop_session_pruning():
+    if session_pruner is not None:
+        session_pruner.cancel()
+        await asyncio.gather(session_pruner, return_exceptions=True)
+
+@app.on_event("shutdown")
+async def close_llm_clients():
+    await LLMProvider.close()
+
+@app.on_event("startup")
+async def start_loop_lag_monitor():
+    loop_lag_monitor.start()
+
+@app.on_event("shutdown")
+async def stop_cpu_executor():
+    await loop_lag_monitor.stop()
+    cpu_executor.shutdown()
+
+@app.on_event("shutdown")
+async def flush_usage_ledger():
+    await asyncio.to_thread(usage_ledger.close)
 
 class AgentRunRequest(BaseModel):
     inputs: Dict[str, Any]
     llm_settings: LLMSettings
+    bypass_cache: bool = False
+    refresh_cache: bool = False
+    # Seconds before the run is abandoned; defaults to the agent's/model's deadline
+    timeout: Optional[float] = Field(None, gt=0)
+
+class AgentBatchRequest(BaseModel):
+    items: List[Dict[str, Any]]
+    llm_settings: LLMSettings
+    concurrency: Optional[int] = None
+    stream: bool = False
+    bypass_cache: bool = False
+    refresh_cache: bool = False
+    # Deadline per item
+    timeout: Optional[float] = Field(None, gt=0)
+
+class PipelineRequest(BaseModel):
+    steps: List[PipelineStep]
+    # Shared inputs steps can reference as "inputs.<name>"
+    inputs: Dict[str, Any] = {}
+    llm_settings: LLMSettings
+    stream: bool = False
+    bypass_cache: bool = False
+    refresh_cache: bool = False
+    # Deadline per step
+    timeout: Optional[float] = Field(None, gt=0)
+
+class SessionMessageRequest(BaseModel):
+    message: str = Field(..., min_length=1, max_length=SESSION_MAX_MESSAGE_CHARS)
+    llm_settings: LLMSettings
+    # Artifacts (e.g. "ledger") to include in full for this turn; "@name" in the message works too
+    attach: List[str] = []
+    timeout: Optional[float] = Field(None, gt=0)
+
+class JobSubmitRequest(AgentRunRequest):
+    agent_id: str
 
 class AgentInfo(BaseModel):
     id: str
@@ -58,38 +172,111 @@ class AgentInfo(BaseModel):
 async def root():
     return {"message": "Welcome to 100 AI Agents API"}
 
-@app.get("/config/models")
-async def list_models():
-    """
-    Returns the list of supported models grouped by provider.
-    """
-    return SUPPORTED_MODELS
-
-@app.get("/agents", response_model=List[AgentInfo])
-async def list_agents():
+def build_agent_catalog() -> List[Dict[str, Any]]:
     results = []
-    for agent_id, agent in AGENTS.items():
-        meta = agent.metadata
+    for agent_id in AGENTS:
+        meta = AGENTS.metadata(agent_id)
         results.append(AgentInfo(
             id=agent_id,
             name=meta.name,
             description=meta.description,
             category=meta.category,
             inputs_schema=meta.inputs_schema
-        ))
+        ).model_dump())
     return results
 
+# The catalog only changes on deploy, so both responses are serialized once.
+# The agent catalog is built on first request so startup does not import agent modules.
+AGENT_CATALOG: Optional[PrecomputedJSON] = None
+MODEL_CATALOG = PrecomputedJSON(SUPPORTED_MODELS)
+
+def get_agent_catalog() -> PrecomputedJSON:
+    global AGENT_CATALOG
+    if AGENT_CATALOG is None:
+        AGENT_CATALOG = PrecomputedJSON(build_agent_catalog())
+    return AGENT_CATALOG
+
+@app.get("/config/models")
+async def list_models(request: Request):
+    """
+    Returns the list of supported models grouped by provider.
+    """
+    return MODEL_CATALOG.response(request)
+
+@app.get("/agents", response_model=List[AgentInfo])
+async def list_agents(request: Request):
+    return get_agent_catalog().response(request)
+
+def _catalog_agents() -> Dict[str, Dict[str, str]]:
+    """
+    Doc file -> registered agent implementing it, for the catalog index.
+    """
+    linked = {}
+    for agent_id in AGENTS:
+        meta = AGENTS.metadata(agent_id)
+        if meta.doc:
+            linked[meta.doc] = {"agent_id": agent_id, "category": meta.category}
+    return linked
+
+@app.get("/agents/search")
+async def search_agents(
+    q: str = "",
+    category: Optional[str] = None,
+    runnable: bool = False,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """
+    Ranked, paginated search over the whole agent catalog (agents/*.md). `runnable`
+    limits results to agents this API can run (they carry an agent_id).
+    """
+    global catalog_refresh
+    if not agent_catalog.agents_linked:
+        # Reading every agent's metadata imports its module; done on first use, not at startup
+        await asyncio.to_thread(agent_catalog.link_agents, _catalog_agents())
+    if agent_catalog.due() and (catalog_refresh is None or catalog_refresh.done()):
+        # Pick up edited docs in the background; this request uses the current index
+        catalog_refresh = asyncio.ensure_future(asyncio.to_thread(agent_catalog.refresh))
+    result = agent_catalog.search(q, category, runnable, offset, limit)
+    return {"query": q, "category": category, **result}
+
+def _run_error(agent_id: str, e: Exception) -> HTTPException:
+    """
+    Maps a failed run to its response: 499 when the client went away (nobody reads it,
+    but it shows up in access logs), 504 when the deadline passed, 500 otherwise.
+    """
+    status_code, status = error_status(e)
+    if status != "error":
+        logger.info(f"Agent run {status}: {agent_id}: {e}")
+    return HTTPException(status_code=status_code, detail=str(e))
+
+def _validate_inputs(agent_id: str, inputs: Any, loc=("body", "inputs")) -> None:
+    """
+    Checks inputs against the agent's compiled inputs_schema before anything is spent on them.
+    Raises a 422 whose detail lists every problem in FastAPI's validation error format.
+    """
+    errors = AGENTS.validator(agent_id).errors(inputs, loc)
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+
 @app.post("/agents/{agent_id}/run")
-async def run_agent(agent_id: str, request: AgentRunRequest):
+async def run_agent(agent_id: str, request: AgentRunRequest, http_request: Request):
     if agent_id not in AGENTS:
         raise HTTPException(status_code=404, detail="Agent not found")
     
+    _validate_inputs(agent_id, request.inputs)
     agent = AGENTS[agent_id]
     
     try:
-        # Run the agent
+        # Run the agent; a client disconnect cancels the LLM call instead of paying for it
         logger.info(f"Received request to run agent: {agent_id}")
-        result = await agent.execute(request.inputs, request.llm_settings)
+        result = await cancel_on_disconnect(http_request, agent.execute(
+            request.inputs,
+            request.llm_settings,
+            bypass_cache=request.bypass_cache,
+            refresh_cache=request.refresh_cache,
+            timeout=request.timeout,
+        ))
         
         # If result is a dict (from BaseAgent.execute), return it directly with content_type added
         if isinstance(result, dict):
@@ -102,8 +289,433 @@ async def run_agent(agent_id: str, request: AgentRunRequest):
             "content_type": "text/markdown"
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        raise _run_error(agent_id, e)
+
+# Ledger uploads are spooled to disk and reconciled in chunks
+LEDGER_UPLOAD_MAX_BYTES = int(os.getenv("LEDGER_UPLOAD_MAX_BYTES", str(2 * 1024 ** 3)))
+UPLOAD_READ_SIZE = 1024 * 1024
+LEDGER_UPLOAD_FORMATS = {".csv": "csv", ".txt": "csv", ".parquet": "parquet", ".pq": "parquet"}
+
+def _ledger_format(upload: UploadFile) -> str:
+    extension = os.path.splitext(upload.filename or "")[1].lower()
+    if extension in LEDGER_UPLOAD_FORMATS:
+        return LEDGER_UPLOAD_FORMATS[extension]
+    content_type = (upload.content_type or "").lower()
+    if "parquet" in content_type:
+        return "parquet"
+    if "csv" in content_type:
+        return "csv"
+    raise HTTPException(status_code=415, detail="Upload a .csv or .parquet ledger file")
+
+async def _spool_upload(upload: UploadFile, max_bytes: int) -> str:
+    """
+    Copy an upload to a temporary file under the data directory, one block at a time.
+    Returns the path; the caller removes it.
+    """
+    upload_dir = data_path("uploads")
+    os.makedirs(upload_dir, exist_ok=True)
+    spool = tempfile.NamedTemporaryFile(dir=upload_dir, suffix=".upload", delete=False)
+    size = 0
+    try:
+        with spool:
+            while block := await upload.read(UPLOAD_READ_SIZE):
+                size += len(block)
+                if size > max_bytes:
+                    raise HTTPException(status_code=413, detail=f"Ledger file exceeds {max_bytes} bytes")
+                await asyncio.to_thread(spool.write, block)
+    except BaseException:
+        os.unlink(spool.name)
+        raise
+    return spool.name
+
+@app.post("/agents/ledger-agent/upload")
+async def upload_ledger(
+    http_request: Request,
+    file: UploadFile = File(...),
+    llm_settings: str = Form(...),
+    bypass_cache: bool = Form(False),
+    refresh_cache: bool = Form(False),
+    timeout: Optional[float] = Form(None, gt=0),
+):
+    """
+    Reconciles an uploaded CSV/Parquet ledger in bounded memory and runs the ledger
+    agent on the resulting summary. `llm_settings` is a JSON-encoded LLMSettings object.
+    """
+    from app.agents.ledger_reconciliation import reconcile_file
+
+    try:
+        settings = LLMSettings.model_validate_json(llm_settings)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+    file_format = _ledger_format(file)
+
+    path = await _spool_upload(file, LEDGER_UPLOAD_MAX_BYTES)
+    try:
+        report = await cpu_executor.run(
+            AGENTS["ledger-agent"].cpu_stage_executor, reconcile_file, path, file_format,
+            agent="ledger-agent", stage="reconcile_file",
+        )
+    except Exception as e:
+        logger.warning(f"Could not reconcile uploaded ledger {file.filename}: {e}")
+        raise HTTPException(status_code=422, detail=f"Could not read ledger file: {e}")
+    finally:
+        os.unlink(path)
+
+    logger.info(f"Reconciled uploaded ledger {file.filename}: {report['rows']} rows")
+    try:
+        result = await cancel_on_disconnect(http_request, AGENTS["ledger-agent"].execute(
+            {"reconciliation_report": report},
+            settings,
+            bypass_cache=bypass_cache,
+            refresh_cache=refresh_cache,
+            timeout=timeout,
+        ))
+    except Exception as e:
+        raise _run_error("ledger-agent", e)
+    result["reconciliation"] = report
+    result["content_type"] = "text/markdown"
+    return result
+
+@app.post("/agents/{agent_id}/batch")
+async def batch_agent(agent_id: str, request: AgentBatchRequest, http_request: Request):
+    """
+    Runs an agent over many input dicts with bounded concurrency.
+    Returns results in input order, or NDJSON lines as items complete when `stream` is set.
+    A failing item is reported in its own result and does not fail the batch.
+    """
+    if agent_id not in AGENTS:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    if not request.items:
+        raise HTTPException(status_code=422, detail="Batch must contain at least one item")
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=422, detail=f"Batch exceeds the maximum of {BATCH_MAX_ITEMS} items")
+    # Every item is checked up front, so a bad item fails the batch before any item runs
+    validator = AGENTS.validator(agent_id)
+    errors = [error for index, inputs in enumerate(request.items) for error in validator.errors(inputs, ("body", "items", index))]
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+
+    agent = AGENTS[agent_id]
+    logger.info(f"Received batch request for agent: {agent_id} ({len(request.items)} items)")
+    execute_kwargs = {
+        "concurrency": request.concurrency,
+        "bypass_cache": request.bypass_cache,
+        "refresh_cache": request.refresh_cache,
+        "timeout": request.timeout,
+    }
+
+    if request.stream:
+        async def ndjson_stream():
+            async for event in stream_batch(agent, request.items, request.llm_settings, **execute_kwargs):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+
+        return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
+    try:
+        result = await cancel_on_disconnect(http_request, run_batch(agent, request.items, request.llm_settings, **execute_kwargs))
+    except Exception as e:
+        raise _run_error(agent_id, e)
+    result["content_type"] = "text/markdown"
+    return result
+
+@app.post("/pipelines/run")
+async def run_agent_pipeline(request: PipelineRequest, http_request: Request):
+    """
+    Runs a DAG of agent steps in one request. Steps take literal inputs plus `input_map`
+    references to upstream results, and independent branches run concurrently.
+    Returns per-step results with timing and usage plus the critical path, or NDJSON
+    lines as steps complete when `stream` is set.
+    """
+    try:
+        order = plan_pipeline(request.steps, AGENTS.__contains__)
+    except PipelineError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    # Steps with only literal inputs can be checked before anything runs
+    errors = [
+        error
+        for index, step in enumerate(request.steps) if not step.input_map
+        for error in AGENTS.validator(step.agent_id).errors(step.inputs, ("body", "steps", index, "inputs"))
+    ]
+    if errors:
+        raise HTTPException(status_code=422, detail=errors)
+
+    logger.info(f"Received pipeline request: {len(request.steps)} steps ({', '.join(order)})")
+    args = (request.steps, order, AGENTS.get, AGENTS.validator, request.inputs, request.llm_settings)
+    execute_kwargs = {
+        "bypass_cache": request.bypass_cache,
+        "refresh_cache": request.refresh_cache,
+        "timeout": request.timeout,
+    }
+
+    if request.stream:
+        async def ndjson_stream():
+            async for event in stream_pipeline(*args, **execute_kwargs):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+
+        return StreamingResponse(ndjson_stream(), media_type="application/x-ndjson")
+
+    try:
+        result = await cancel_on_disconnect(http_request, run_pipeline(*args, **execute_kwargs))
+    except Exception as e:
+        raise _run_error("pipeline", e)
+    result["content_type"] = "text/markdown"
+    return result
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: JobSubmitRequest):
+    """
+    Queues an agent run for background execution and returns its job id.
+    """
+    if request.agent_id not in AGENTS:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    _validate_inputs(request.agent_id, request.inputs)
+
+    job_id = await job_queue.submit(
+        request.agent_id,
+        request.inputs,
+        request.llm_settings,
+        options={"bypass_cache": request.bypass_cache, "refresh_cache": request.refresh_cache, "timeout": request.timeout},
+    )
+    logger.info(f"Queued job {job_id} for agent: {request.agent_id}")
+    return {"job_id": job_id, "status": "queued"}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = await job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.get("cancel_requested"):
+        return JSONResponse(status_code=202, content=job)
+    if job["status"] != "cancelled":
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+    return job
+
+@app.post("/agents/{agent_id}/sessions")
+async def start_session(agent_id: str, request: AgentRunRequest, http_request: Request):
+    """
+    Runs the agent once and opens a conversation on the result; continue it with
+    POST /sessions/{session_id}/messages.
+    """
+    if agent_id not in AGENTS:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    _validate_inputs(agent_id, request.inputs)
+
+    try:
+        result = await cancel_on_disconnect(http_request, sessions.start(
+            agent_id,
+            request.inputs,
+            request.llm_settings,
+            bypass_cache=request.bypass_cache,
+            refresh_cache=request.refresh_cache,
+            timeout=request.timeout,
+        ))
+    except Exception as e:
+        raise _run_error(agent_id, e)
+    result["content_type"] = "text/markdown"
+    return result
+
+@app.post("/sessions/{session_id}/messages")
+async def send_session_message(session_id: str, request: SessionMessageRequest, http_request: Request):
+    """
+    One follow-up turn. The prompt carries the rolling summary and recent turns within
+    the model's budget, not the whole conversation.
+    """
+    try:
+        result = await cancel_on_disconnect(http_request, sessions.send(
+            session_id,
+            request.message,
+            request.llm_settings,
+            attach=request.attach,
+            timeout=request.timeout,
+        ))
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Session not found")
+    except Exception as e:
+        raise _run_error("session", e)
+    result["content_type"] = "text/markdown"
+    return result
+
+@app.get("/sessions/{session_id}")
+async def get_session(session_id: str):
+    session = await asyncio.to_thread(session_store.get, session_id)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    session["messages"] = await asyncio.to_thread(session_store.history, session_id)
+    session["artifacts"] = await asyncio.to_thread(session_store.artifacts, session_id)
+    return session
+
+@app.delete("/sessions/{session_id}")
+async def delete_session(session_id: str):
+    if not await sessions.delete(session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"session_id": session_id, "status": "deleted"}
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/agents/{agent_id}/stream")
+async def stream_agent(agent_id: str, request: AgentRunRequest):
+    """
+    Runs an agent and streams its output as Server-Sent Events.
+    Emits `token` events, then a final `done` event carrying usage stats (or an `error`
+    event whose `status` is "timeout" or "error"). Disconnecting cancels the run.
+    """
+    if agent_id not in AGENTS:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    _validate_inputs(agent_id, request.inputs)
+
+    agent = AGENTS[agent_id]
+    logger.info(f"Received request to stream agent: {agent_id}")
+
+    async def event_stream():
+        try:
+            async for event in agent.stream(
+                request.inputs,
+                request.llm_settings,
+                bypass_cache=request.bypass_cache,
+                refresh_cache=request.refresh_cache,
+                timeout=request.timeout,
+            ):
+                if event["type"] == "token":
+                    yield _sse("token", {"content": event["content"]})
+                else:
+                    yield _sse("done", {
+                        "usage": event["usage"],
+                        "status": event["status"],
+                        "cache": event["cache"],
+                        "served_by": event["served_by"],
+                        "attempts": event["attempts"],
+                        "content_type": "text/markdown",
+                    })
+        except Exception as e:
+            yield _sse("error", {"status": error_status(e)[1], "detail": str(e)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.websocket("/agents/{agent_id}/ws")
+async def stream_agent_ws(websocket: WebSocket, agent_id: str):
+    """
+    WebSocket variant of the streaming endpoint. The client sends one AgentRunRequest
+    JSON message per run and receives `token` messages followed by `done` (or `error`).
+    """
+    await websocket.accept()
+    if agent_id not in AGENTS:
+        await websocket.send_json({"type": "error", "detail": "Agent not found"})
+        await websocket.close(code=1008)
+        return
+
+    agent = AGENTS[agent_id]
+    try:
+        while True:
+            payload = await websocket.receive_json()
+            try:
+                request = AgentRunRequest(**payload)
+            except Exception as e:
+                await websocket.send_json({"type": "error", "detail": str(e)})
+                continue
+            errors = AGENTS.validator(agent_id).errors(request.inputs, ("inputs",))
+            if errors:
+                await websocket.send_json({"type": "error", "status": "invalid", "detail": errors})
+                continue
+
+            logger.info(f"Received websocket request to stream agent: {agent_id}")
+            try:
+                async for event in agent.stream(
+                    request.inputs,
+                    request.llm_settings,
+                    bypass_cache=request.bypass_cache,
+                    refresh_cache=request.refresh_cache,
+                    timeout=request.timeout,
+                ):
+                    if event["type"] == "done":
+                        event = {**event, "content_type": "text/markdown"}
+                    await websocket.send_json(event)
+            except WebSocketDisconnect:
+                raise
+            except Exception as e:
+                await websocket.send_json({"type": "error", "status": error_status(e)[1], "detail": str(e)})
+    except WebSocketDisconnect:
+        logger.info(f"Websocket client disconnected: {agent_id}")
+
+@app.get("/limits")
+async def limiter_stats():
+    """
+    Current per-provider/model rate limiter state (budgets, AIMD factors, queue depth).
+    """
+    return provider_scheduler.stats()
+
+@app.get("/runtime")
+async def runtime_stats():
+    """
+    CPU stage executor pools and event loop lag.
+    """
+    return {"executor": cpu_executor.stats(), "event_loop": loop_lag_monitor.stats()}
+
+@app.get("/fallback")
+async def fallback_stats():
+    """
+    Configured fallback chains and the recent latency that sets each model's hedge deadline.
+    """
+    return {"chains": FALLBACK_CHAINS, "latency": latency_tracker.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus scrape endpoint.
+    """
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/usage")
+async def usage_report(
+    group_by: str = "agent,model,day",
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    agent_id: Optional[str] = None,
+):
+    """
+    Aggregated token usage from the usage ledger. `group_by` is a comma-separated
+    subset of agent, provider, model, day, mode, cache; `since`/`until` are
+    inclusive UTC days (YYYY-MM-DD).
+    """
+    groups = [name.strip() for name in group_by.split(",") if name.strip()]
+    unknown = [name for name in groups if name not in usage_ledger.GROUPS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown group_by fields: {', '.join(unknown)}")
+    # Include records still waiting for the background writer
+    await asyncio.to_thread(usage_ledger.flush)
+    rows = await asyncio.to_thread(usage_ledger.aggregate, groups, since, until, agent_id)
+    return {"group_by": groups, "rows": rows, "ledger": usage_ledger.stats()}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Hit/miss counters for the agent response cache, plus in-flight request coalescing.
+    """
+    return {**response_cache.stats(), "coalescing": single_flight.stats()}
+
+@app.delete("/cache")
+async def clear_cache():
+    await response_cache.clear()
+    return {"status": "cleared"}
 
 if __name__ == "__main__":
+    if os.getenv("SERVER_MODE", "development").lower() == "production":
+        # Multi-process server; see gunicorn.conf.py
+        backend_dir = os.path.dirname(os.path.abspath(__file__))
+        os.execvp(sys.executable, [
+            sys.executable, "-m", "gunicorn", "--chdir", backend_dir,
+            "-c", os.path.join(backend_dir, "gunicorn.conf.py"), "main:app",
+        ])
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# Modules resolve their SQLite files under AGENT_DATA_DIR at import time, so point it
+# at a scratch directory before anything from app/ is imported
+os.environ.setdefault("AGENT_DATA_DIR", tempfile.mkdtemp(prefix="agent-tests-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,129 @@
+import os
+
+import pytest
+
+from app.core.catalog import AGENT_DOCS_DIR, PREFIX_WEIGHT, AgentCatalog, parse_agent_doc, tokenize
+
+def agent_doc(number, name, overview, objectives=(), tech=(), category=None):
+    lines = [f"## 🧮 **Agent #{number}: {name}**", ""]
+    if category:
+        lines += [f"**Category:** {category}", ""]
+    lines += ["### 📝 **Overview**", "", overview, "", "---", "", "### 🧪 Lab Objectives", ""]
+    lines += [f"* {item}" for item in objectives]
+    lines += ["", "### 🧰 Tech Stack", ""]
+    lines += [f"* **{item}**" for item in tech]
+    return "\n".join(lines) + "\n"
+
+DOCS = {
+    "1.md": agent_doc(1, "Financial Advisor", "Personal budgeting and savings plans.", ["Forecast spending"], ["Pandas"]),
+    "2.md": agent_doc(2, "Ledger Agent", "Reconciles ledger entries and detects anomalies.", ["Reconcile ledgers"], ["Pandas", "GPT"]),
+    "3.md": agent_doc(3, "Invoice Matcher", "Matches invoices against the ledger for finance teams.", ["Explain mismatches"]),
+    "12.md": agent_doc(12, "Recruiting Screener", "Screens resumes for recruiters.", ["Rank candidates"]),
+    "55.md": agent_doc(55, "Campaign Planner", "Plans marketing campaigns and budgets.", ["Draft campaigns"], category="Growth"),
+}
+
+@pytest.fixture
+def docs_dir(tmp_path):
+    directory = tmp_path / "agents"
+    directory.mkdir()
+    for name, content in DOCS.items():
+        (directory / name).write_text(content, encoding="utf-8")
+    return directory
+
+@pytest.fixture
+def catalog(docs_dir, tmp_path):
+    catalog = AgentCatalog(str(docs_dir), str(tmp_path / "index.json"))
+    catalog.refresh()
+    return catalog
+
+def ids(result):
+    return [doc["doc"] for doc in result["results"]]
+
+def test_parse_agent_doc_reads_sections():
+    doc = parse_agent_doc("2.md", DOCS["2.md"])
+    assert doc["number"] == 2
+    assert doc["title"] == "Agent #2: Ledger Agent"
+    assert doc["category"] == "Finance"
+    assert doc["capabilities"] == ["Reconcile ledgers"]
+    assert doc["tech_stack"] == ["Pandas", "GPT"]
+    assert parse_agent_doc("12.md", DOCS["12.md"])["category"] == "HR"
+    assert parse_agent_doc("55.md", DOCS["55.md"])["category"] == "Growth"
+
+def test_tokenize_drops_stopwords_and_folds_plurals():
+    assert tokenize("The Ledgers of an agent, using GPT-4") == ["ledger", "agent", "gpt", "4"]
+    assert tokenize("business analysis") == ["business", "analysis"]
+
+def test_title_match_outranks_description_match(catalog):
+    result = catalog.search("ledger")
+    assert ids(result) == ["2.md", "3.md"]
+    assert result["results"][0]["score"] > result["results"][1]["score"]
+
+def test_prefix_matches_score_less_than_words(catalog):
+    exact = {doc["doc"]: doc["score"] for doc in catalog.search("ledger")["results"]}
+    prefix = {doc["doc"]: doc["score"] for doc in catalog.search("ledg")["results"]}
+    assert prefix.keys() == exact.keys()
+    for name, score in exact.items():
+        assert prefix[name] == pytest.approx(score * PREFIX_WEIGHT, abs=1e-3)
+    # "recruit" is a prefix of "recruiting" and "recruiters"
+    assert ids(catalog.search("recruit")) == ["12.md"]
+
+def test_all_query_terms_must_match(catalog):
+    assert ids(catalog.search("ledger invoice")) == ["3.md"]
+    assert catalog.search("ledger recruiting")["total"] == 0
+
+def test_category_terms_facets_and_filter(catalog):
+    # The category matches all three; 3.md also mentions "finance" in its overview
+    assert ids(catalog.search("finance")) == ["3.md", "1.md", "2.md"]
+    all_docs = catalog.search("")
+    assert all_docs["categories"] == {"Finance": 3, "HR": 1, "Growth": 1}
+    filtered = catalog.search("", category="finance")
+    assert filtered["total"] == 3
+    # Facets are counted before the category filter
+    assert filtered["categories"] == all_docs["categories"]
+
+def test_empty_query_lists_in_number_order_with_pagination(catalog):
+    assert ids(catalog.search("")) == ["1.md", "2.md", "3.md", "12.md", "55.md"]
+    page = catalog.search("", offset=2, limit=2)
+    assert ids(page) == ["3.md", "12.md"]
+    assert page["total"] == 5
+
+def test_linked_agents_set_runnable_and_category(catalog):
+    catalog.link_agents({"12.md": {"agent_id": "recruiter", "category": "Talent"}, "55.md": {"agent_id": "campaigns", "category": "Sales"}})
+    result = catalog.search("", runnable=True)
+    assert ids(result) == ["12.md", "55.md"]
+    by_doc = {doc["doc"]: doc for doc in result["results"]}
+    assert by_doc["12.md"]["agent_id"] == "recruiter"
+    assert by_doc["12.md"]["category"] == "Talent"
+    # A declared "Category:" line wins over the registered agent's category
+    assert by_doc["55.md"]["category"] == "Growth"
+    assert ids(catalog.search("talent")) == ["12.md"]
+
+def test_refresh_is_incremental(docs_dir, catalog, tmp_path):
+    assert catalog.parsed_files == len(DOCS)
+    assert catalog.refresh() == 0
+
+    path = docs_dir / "3.md"
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10_000_000))
+    # Touched but unchanged: re-hashed, not re-parsed
+    assert catalog.refresh() == 0
+    assert catalog.parsed_files == len(DOCS)
+
+    path.write_text(DOCS["3.md"].replace("Invoice Matcher", "Receipt Matcher"), encoding="utf-8")
+    (docs_dir / "12.md").unlink()
+    assert catalog.refresh() == 2
+    assert [doc["title"] for doc in catalog.search("invoice")["results"]] == ["Agent #3: Receipt Matcher"]
+    assert ids(catalog.search("receipt")) == ["3.md"]
+    assert catalog.search("recruiting")["total"] == 0
+
+    # A new process with the persisted index parses nothing
+    restarted = AgentCatalog(str(docs_dir), str(tmp_path / "index.json"))
+    assert restarted.refresh() == 0
+    assert restarted.parsed_files == 0
+    assert ids(restarted.search("receipt")) == ["3.md"]
+
+@pytest.mark.skipif(not os.path.isdir(AGENT_DOCS_DIR), reason="agent docs not checked out")
+def test_repository_docs_rank_implemented_agents_first(tmp_path):
+    catalog = AgentCatalog(index_path=str(tmp_path / "index.json"))
+    assert catalog.search("ledger reconciliation")["results"][0]["doc"] == "2.md"
+    assert catalog.search("code review")["results"][0]["doc"] == "57.md"
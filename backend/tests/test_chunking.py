@@ -0,0 +1,101 @@
+import random
+
+import pytest
+
+from app.core.chunking import split_code, split_markdown
+from app.core.rate_limit import estimate_tokens
+
+def python_source(functions: int, seed: int = 1) -> str:
+    rng = random.Random(seed)
+    parts = ['"""Module docstring."""\n', "import os\n", "\n"]
+    for i in range(functions):
+        if i % 3 == 0:
+            parts.append("@decorator\n")
+        parts.append(f"def function_{i}(value):\n")
+        for j in range(rng.randint(1, 12)):
+            parts.append(f"    value = value + {j}  # step {j}\n")
+        parts.append("    return value\n\n")
+    parts.append("class Thing:\n    def method(self):\n        return 1\n")
+    return "".join(parts)
+
+def markdown_document(sections: int, seed: int = 2) -> str:
+    rng = random.Random(seed)
+    parts = ["# Title\n", "\n"]
+    for i in range(sections):
+        parts.append(f"## Section {i}\n\n")
+        for j in range(rng.randint(1, 4)):
+            parts.append(" ".join(f"word{k}" for k in range(rng.randint(5, 60))) + "\n\n")
+        if i % 4 == 0:
+            parts.append(f"### Detail {i}\n\nMore text here.\n")
+    return "".join(parts)
+
+def assert_lossless(text, chunks, max_tokens):
+    assert "".join(part for _, part in chunks) == text
+    for label, part in chunks:
+        if label.startswith("lines "):
+            first, last = map(int, label[len("lines "):].split("-"))
+            assert last >= first
+        lines = part.splitlines(keepends=True)
+        if len(lines) > 1:
+            # Packing sums per-piece estimates, each rounded, so allow a token per line
+            assert estimate_tokens(part) <= max_tokens + len(lines)
+        elif label.startswith("line "):
+            # A single over-long line is split into pieces of max_tokens * 4 characters
+            assert len(part) <= max_tokens * 4
+
+@pytest.mark.parametrize("max_tokens", [1, 5, 20, 64, 300, 10_000])
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_split_code_is_lossless(max_tokens, seed):
+    source = python_source(25, seed)
+    assert_lossless(source, split_code(source, max_tokens), max_tokens)
+
+@pytest.mark.parametrize("max_tokens", [1, 5, 20, 64, 300, 10_000])
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_split_markdown_is_lossless(max_tokens, seed):
+    content = markdown_document(20, seed)
+    assert_lossless(content, split_markdown(content, max_tokens), max_tokens)
+
+def test_line_ranges_are_consecutive():
+    source = python_source(40)
+    chunks = split_code(source, 50)
+    expected_first = 1
+    for label, part in chunks:
+        first, last = map(int, label[len("lines "):].split("-"))
+        assert first == expected_first
+        assert last - first + 1 == len(part.splitlines())
+        expected_first = last + 1
+    assert expected_first - 1 == len(source.splitlines())
+
+def test_small_input_is_one_chunk():
+    source = python_source(2)
+    assert split_code(source, 10_000) == [(f"lines 1-{len(source.splitlines())}", source)]
+
+def test_code_is_cut_before_definitions_and_their_decorators():
+    source = python_source(12)
+    # Every function fits the budget, the whole module does not
+    chunks = split_code(source, 120)
+    assert len(chunks) > 1
+    for _, part in chunks[1:]:
+        assert part.startswith(("def ", "@decorator", "class "))
+
+def test_markdown_is_cut_before_top_level_sections():
+    content = markdown_document(10)
+    chunks = split_markdown(content, 600)
+    assert len(chunks) > 1
+    for _, part in chunks[1:]:
+        assert part.startswith("## ")
+
+def test_text_without_structure_or_trailing_newline():
+    content = "\n".join(f"plain line {i}" for i in range(200))
+    chunks = split_markdown(content, 30)
+    assert len(chunks) > 1
+    assert_lossless(content, chunks, 30)
+
+def test_single_long_line_is_split_by_characters():
+    content = "short\n" + "x" * 1000 + "\nend\n"
+    chunks = split_code(content, 10)
+    assert_lossless(content, chunks, 10)
+    assert [label for label, _ in chunks].count("line 2") == 26
+
+def test_empty_input_has_no_chunks():
+    assert split_code("", 100) == []
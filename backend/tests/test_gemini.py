@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_google_genai")
+from google.api_core.exceptions import ResourceExhausted, ServiceUnavailable
+
+from app.core.llm import LLMProvider, LLMSettings
+from app.core.rate_limit import _status_code
+
+class FailingClient:
+    def __init__(self, error):
+        self.error = error
+        self.requests = []
+
+    async def generate_content(self, **kwargs):
+        self.requests.append(kwargs["request"])
+        raise self.error
+
+    async def stream_generate_content(self, **kwargs):
+        self.requests.append(kwargs["request"])
+        raise self.error
+
+def gemini(client, temperature=0.7):
+    settings = LLMSettings(provider="gemini", model_name="gemini-2.5-flash", api_key="test-key", temperature=temperature)
+    object.__setattr__(LLMProvider._pooled(settings).llm, "async_client", client)
+    return LLMProvider.get_llm(settings)
+
+@pytest.mark.parametrize("error, status", [(ResourceExhausted("quota"), 429), (ServiceUnavailable("busy"), 503)])
+def test_gemini_errors_reach_the_scheduler_after_one_attempt(error, status):
+    client = FailingClient(error)
+    llm = gemini(client)
+
+    async def scenario():
+        with pytest.raises(type(error)) as info:
+            await llm.ainvoke("hello")
+        with pytest.raises(type(error)):
+            async for _ in llm.astream("hello"):
+                pass
+        return info.value
+
+    raised = asyncio.run(scenario())
+    assert _status_code(raised) == status
+    assert len(client.requests) == 2
+
+def test_bound_temperature_reaches_the_request():
+    client = FailingClient(ResourceExhausted("quota"))
+    llm = gemini(client, temperature=0.1)
+    with pytest.raises(ResourceExhausted):
+        asyncio.run(llm.ainvoke("hello"))
+    assert client.requests[0].generation_config.temperature == pytest.approx(0.1)
@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from app.agents.ledger_agent import LedgerAgent
+from app.core.llm import LLMSettings
+
+SETTINGS = LLMSettings(provider="stub", model_name="fake-ledger-model", temperature=0, fallback_models=[])
+
+class FakeLedgerAgent(LedgerAgent):
+    cpu_stage_executor = "inline"
+
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def get_llm(self, settings, callbacks=None):
+        self.calls += 1
+        return FakeListChatModel(responses=["The ledger is balanced."])
+
+def ledger(description, amount):
+    # Same aggregates for every description, so the prompt (and the cache key) is identical
+    return [
+        {"Date": "2025-07-01", "Description": description, "Account": "Cash", "Debit": amount, "Credit": 0},
+        {"Date": "2025-07-01", "Description": f"{description} offset", "Account": "Revenue", "Debit": 0, "Credit": amount},
+    ]
+
+async def streamed(agent, inputs):
+    parts, done = [], None
+    async for event in agent.stream(inputs, SETTINGS):
+        if event["type"] == "token":
+            parts.append(event["content"])
+        else:
+            done = event
+    return "".join(parts), done
+
+@pytest.mark.parametrize("first_via_stream", [False, True])
+def test_cache_hits_do_not_return_another_ledgers_rows(first_via_stream):
+    agent = FakeLedgerAgent()
+    tag = "stream" if first_via_stream else "run"
+    amount = 200 if first_via_stream else 100
+
+    async def scenario():
+        if first_via_stream:
+            first, _ = await streamed(agent, {"ledger_data": ledger(f"alpha-{tag}", amount)})
+        else:
+            first = (await agent.execute({"ledger_data": ledger(f"alpha-{tag}", amount)}, SETTINGS))["output"]
+        second = await agent.execute({"ledger_data": ledger(f"beta-{tag}", amount)}, SETTINGS)
+        third, done = await streamed(agent, {"ledger_data": ledger(f"gamma-{tag}", amount)})
+        return first, second, third, done
+
+    first, second, third, done = asyncio.run(scenario())
+    assert agent.calls == 1
+    assert second["cache"] == "hit" and done["cache"] == "hit"
+    assert f"alpha-{tag}" in first
+    assert f"beta-{tag}" in second["output"] and f"alpha-{tag}" not in second["output"]
+    assert f"gamma-{tag}" in third and f"alpha-{tag}" not in third
+    # Everything before the echoed ledger is the shared, cached analysis
+    analysis = first.partition("### Reconciliation Summary")[0]
+    assert second["output"].startswith(analysis) and third.startswith(analysis)
@@ -0,0 +1,94 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.agents.ledger_reconciliation import (
+    LedgerAccumulator,
+    infer_date_format,
+    iter_ledger_chunks,
+    reconcile,
+    reconcile_file,
+)
+
+def make_ledger(rows: int = 1000, seed: int = 7) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    # Day-first dates; the first one is unambiguous, later chunks start with ambiguous ones
+    days = pd.date_range("2024-01-13", periods=60, freq="D")
+    dates = [days[0].strftime("%d/%m/%Y")] + [days[i].strftime("%d/%m/%Y") for i in rng.integers(0, 60, rows - 1)]
+    amounts = rng.integers(10, 500, rows).astype(float)
+    is_debit = rng.random(rows) < 0.5
+    df = pd.DataFrame({
+        "Date": dates,
+        "Description": [f"Payment {i % 40}" for i in range(rows)],
+        "Account": [f"Account {i}" for i in rng.integers(0, 12, rows)],
+        "Debit": np.where(is_debit, amounts, 0.0),
+        "Credit": np.where(is_debit, 0.0, amounts),
+    })
+    # Outliers, invalid rows (both sides, negative, bad date) and exact duplicates
+    df.loc[[100, 700], ["Debit", "Credit"]] = [[250_000.0, 0.0], [410_000.0, 0.0]]
+    df.loc[200, ["Debit", "Credit"]] = [50.0, 50.0]
+    df.loc[300, "Credit"] = -20.0
+    df.loc[400, "Date"] = "not a date"
+    duplicates = df.iloc[[5, 6, 900]].copy()
+    return pd.concat([df, duplicates, duplicates.iloc[[0]]], ignore_index=True)
+
+@pytest.fixture
+def ledger_csv(tmp_path):
+    path = tmp_path / "ledger.csv"
+    make_ledger().to_csv(path, index=False)
+    return str(path)
+
+def in_memory_report(path: str):
+    return reconcile(pd.read_csv(path, dtype={"Date": str, "Description": str, "Account": str}))
+
+@pytest.mark.parametrize("chunk_rows", [37, 256, 100_000])
+def test_chunked_csv_report_matches_in_memory(ledger_csv, chunk_rows):
+    expected = in_memory_report(ledger_csv)
+    assert expected["duplicate_rows"] == 7
+    assert expected["invalid_rows"] == 3
+    assert expected["outlier_rows"] >= 2
+    assert reconcile_file(ledger_csv, "csv", chunk_rows=chunk_rows) == expected
+
+def test_chunked_parquet_report_matches_in_memory(ledger_csv, tmp_path):
+    pytest.importorskip("pyarrow")
+    path = str(tmp_path / "ledger.parquet")
+    pd.read_csv(ledger_csv, dtype={"Date": str, "Description": str, "Account": str}).to_parquet(path, index=False)
+    assert reconcile_file(path, "parquet", chunk_rows=101) == in_memory_report(ledger_csv)
+
+def test_chunks_parse_dates_with_one_format(ledger_csv):
+    dates = pd.concat([chunk["Date"] for chunk in iter_ledger_chunks(ledger_csv, "csv", chunk_rows=50)])
+    # Only the deliberately bad row fails to parse, and day-first dates stay day-first
+    assert dates.isna().sum() == 1
+    assert dates.min() == pd.Timestamp("2024-01-13")
+    assert dates.max() <= pd.Timestamp("2024-03-12")
+
+@pytest.mark.parametrize("values, expected", [
+    (["01/02/2024", "03/04/2024"], "%m/%d/%Y"),
+    (["01/02/2024", "13/02/2024"], "%d/%m/%Y"),
+    (["01/13/2024", "02/14/2024"], "%m/%d/%Y"),
+    (["01/02/2024", "13/13/2024"], "mixed"),
+])
+def test_date_format_fits_the_whole_sample(values, expected):
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert infer_date_format(pd.Series(values)) == expected
+
+def test_duplicate_cap_is_reported(ledger_csv):
+    accumulator = LedgerAccumulator()
+    try:
+        for chunk in iter_ledger_chunks(ledger_csv, "csv", chunk_rows=100):
+            accumulator.add(chunk)
+        hashes, duplicate_rows, truncated = accumulator.duplicate_hashes(max_keys=1)
+    finally:
+        accumulator.close()
+    assert len(hashes) == 1
+    assert duplicate_rows == 7
+    assert truncated
+
+def test_empty_ledger_file_is_rejected(tmp_path):
+    path = tmp_path / "empty.csv"
+    path.write_text("Date,Description,Account,Debit,Credit\n")
+    with pytest.raises(ValueError):
+        reconcile_file(str(path), "csv")
@@ -0,0 +1,121 @@
+import asyncio
+
+import pytest
+
+from app.core.llm import LLMSettings
+from app.core.pipeline import PIPELINE_MAX_STEPS, PipelineError, PipelineRun, PipelineStep, plan_pipeline, run_pipeline
+
+SETTINGS = LLMSettings(provider="stub", model_name="stub-model")
+
+def step(step_id, agent_id="echo", **fields):
+    return PipelineStep(id=step_id, agent_id=agent_id, **fields)
+
+def known(agent_id):
+    return agent_id in ("echo", "fail")
+
+class EchoAgent:
+    """
+    Sleeps for inputs["delay"] seconds and echoes inputs["text"]; the "fail" agent raises.
+    """
+
+    def __init__(self, agent_id):
+        self.agent_id = agent_id
+        self.calls = 0
+
+    async def execute(self, inputs, llm_settings, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(inputs.get("delay", 0))
+        if self.agent_id == "fail":
+            raise RuntimeError("boom")
+        return {"output": str(inputs.get("text", "")), "usage": {"total_tokens": 10}}
+
+class NoErrors:
+    def errors(self, inputs, loc):
+        return []
+
+def test_plan_orders_dependencies_first_and_keeps_declaration_order():
+    steps = [
+        step("report", input_map={"text": ["steps.left", "steps.right"]}),
+        step("left", input_map={"text": "steps.source.usage.total_tokens"}),
+        step("source", input_map={"text": "inputs.topic"}),
+        step("right", input_map={"text": "steps.source"}),
+        step("independent"),
+    ]
+    assert plan_pipeline(steps, known) == ["source", "independent", "left", "right", "report"]
+
+@pytest.mark.parametrize(
+    "steps, message",
+    [
+        ([], "at least one step"),
+        ([step("a"), step("a")], "Duplicate step id"),
+        ([step("a", agent_id="missing")], "unknown agent"),
+        ([step("a", input_map={"text": "steps.nowhere"})], "unknown step 'nowhere'"),
+        ([step("a", input_map={"text": "outputs.a"})], "Invalid reference"),
+        ([step("a", input_map={"text": "steps."})], "Invalid reference"),
+        (
+            [step("a", input_map={"text": "steps.c"}), step("b", input_map={"text": "steps.a"}), step("c", input_map={"text": "steps.b"}), step("d")],
+            "cycle through steps: a, b, c",
+        ),
+        ([step("a", input_map={"text": "steps.a"})], "cycle"),
+        ([step(str(i)) for i in range(PIPELINE_MAX_STEPS + 1)], "maximum"),
+    ],
+)
+def test_plan_rejects_invalid_pipelines(steps, message):
+    with pytest.raises(PipelineError, match=message):
+        plan_pipeline(steps, known)
+
+def finished(step_id, started, ended):
+    return {"id": step_id, "status": "success", "started_ms": started, "finished_ms": ended, "duration_ms": ended - started}
+
+def test_critical_path_follows_the_latest_upstream():
+    steps = [
+        step("a"),
+        step("slow", input_map={"text": "steps.a"}),
+        step("fast", input_map={"text": "steps.a"}),
+        step("join", input_map={"text": ["steps.fast", "steps.slow"]}),
+        step("side"),
+    ]
+    run = PipelineRun(steps, EchoAgent, lambda _: NoErrors(), {}, SETTINGS)
+    run.results = {
+        "a": finished("a", 0, 10),
+        "slow": finished("slow", 10, 90),
+        "fast": finished("fast", 10, 20),
+        "join": finished("join", 90, 100),
+        "side": finished("side", 0, 50),
+    }
+    assert run.critical_path() == ["a", "slow", "join"]
+    assert run.summary()["critical_path_ms"] == 100
+
+def test_critical_path_is_empty_before_any_step_finishes():
+    run = PipelineRun([step("a")], EchoAgent, lambda _: NoErrors(), {}, SETTINGS)
+    assert run.critical_path() == []
+
+def test_run_pipeline_runs_branches_concurrently_and_skips_after_failures():
+    steps = [
+        step("source", inputs={"text": "hello"}),
+        step("slow", inputs={"delay": 0.2}, input_map={"text": "steps.source"}),
+        step("fast", inputs={"delay": 0.01}, input_map={"text": "inputs.topic"}),
+        step("join", input_map={"text": ["steps.slow", "steps.fast"]}),
+        step("broken", agent_id="fail"),
+        step("after_broken", input_map={"text": "steps.broken"}),
+        # Same agent, inputs and settings as "source": runs once
+        step("again", inputs={"text": "hello"}),
+    ]
+    agents = {"echo": EchoAgent("echo"), "fail": EchoAgent("fail")}
+
+    result = asyncio.run(run_pipeline(
+        steps, plan_pipeline(steps, known), agents.get, lambda _: NoErrors(), {"topic": "ledgers"}, SETTINGS,
+    ))
+    by_id = {item["id"]: item for item in result["steps"]}
+    assert [item["id"] for item in result["steps"]] == [s.id for s in steps]
+    assert by_id["join"]["output"] == "['hello', 'ledgers']"
+    assert by_id["broken"]["status"] == "error"
+    assert by_id["after_broken"]["status"] == "skipped"
+    assert by_id["again"]["reused_from"] == "source"
+    assert result["critical_path"] == ["source", "slow", "join"]
+    # The fast branch overlapped the slow one
+    assert by_id["fast"]["finished_ms"] < by_id["slow"]["finished_ms"]
+    assert result["duration_ms"] < 400
+    assert result["usage"]["total_tokens"] == 40
+    assert result["usage"]["reused_runs"] == 1
+    assert agents["echo"].calls == 4
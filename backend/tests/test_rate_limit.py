@@ -0,0 +1,147 @@
+import asyncio
+import time
+
+import pytest
+
+from app.core.rate_limit import AdaptiveSemaphore, TokenBucket
+
+def never_blocked() -> float:
+    return 0.0
+
+def test_token_bucket_serves_burst_up_to_capacity():
+    async def scenario():
+        bucket = TokenBucket(per_minute=600)
+        started = time.monotonic()
+        for _ in range(10):
+            await bucket.acquire(60, never_blocked)
+        return time.monotonic() - started, bucket.tokens
+
+    elapsed, tokens = asyncio.run(scenario())
+    assert elapsed < 0.05
+    assert tokens == pytest.approx(0, abs=1)
+
+def test_token_bucket_waits_for_refill():
+    async def scenario():
+        # 6000/minute refills 100 tokens per second
+        bucket = TokenBucket(per_minute=6000)
+        await bucket.acquire(6000, never_blocked)
+        started = time.monotonic()
+        await bucket.acquire(20, never_blocked)
+        return time.monotonic() - started
+
+    assert 0.15 <= asyncio.run(scenario()) < 0.5
+
+def test_token_bucket_clamps_oversized_requests_to_capacity():
+    async def scenario():
+        bucket = TokenBucket(per_minute=60)
+        await asyncio.wait_for(bucket.acquire(10_000, never_blocked), 0.5)
+        return bucket.tokens
+
+    assert asyncio.run(scenario()) == pytest.approx(0, abs=0.1)
+
+def test_token_bucket_adjust_debits_actual_usage():
+    bucket = TokenBucket(per_minute=600)
+    bucket.adjust(700)
+    assert bucket.tokens < 0
+    bucket.adjust(-10_000)
+    # Credits never exceed capacity
+    assert bucket.tokens == bucket.capacity
+
+def test_token_bucket_honours_blocked_until():
+    async def scenario():
+        bucket = TokenBucket(per_minute=600)
+        until = time.monotonic() + 0.2
+        started = time.monotonic()
+        await bucket.acquire(1, lambda: until)
+        return time.monotonic() - started
+
+    assert asyncio.run(scenario()) >= 0.19
+
+def test_token_bucket_serves_waiters_in_order():
+    async def scenario():
+        bucket = TokenBucket(per_minute=6000)
+        await bucket.acquire(6000, never_blocked)
+        order = []
+
+        async def take(name, amount):
+            await bucket.acquire(amount, never_blocked)
+            order.append(name)
+
+        first = asyncio.create_task(take("large", 30))
+        await asyncio.sleep(0)
+        await asyncio.gather(first, *(take(f"small{i}", 1) for i in range(3)))
+        return order
+
+    assert asyncio.run(scenario())[0] == "large"
+
+def test_adaptive_semaphore_limits_concurrency_in_fifo_order():
+    async def scenario():
+        semaphore = AdaptiveSemaphore(2)
+        active, peak, order = 0, 0, []
+
+        async def worker(i):
+            nonlocal active, peak
+            await semaphore.acquire()
+            order.append(i)
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            semaphore.release()
+
+        await asyncio.gather(*(worker(i) for i in range(6)))
+        return peak, order, semaphore.in_flight
+
+    peak, order, in_flight = asyncio.run(scenario())
+    assert peak == 2
+    assert order == list(range(6))
+    assert in_flight == 0
+
+def test_adaptive_semaphore_shrinks_and_grows():
+    async def scenario():
+        semaphore = AdaptiveSemaphore(4)
+        for _ in range(4):
+            await semaphore.acquire()
+        semaphore.set_limit(2)
+        waiter = asyncio.create_task(semaphore.acquire())
+        semaphore.release()
+        await asyncio.sleep(0)
+        # 3 in flight is still above the lowered limit
+        assert not waiter.done()
+        semaphore.release()
+        semaphore.release()
+        await asyncio.sleep(0)
+        assert waiter.done() and semaphore.in_flight == 2
+
+        more = [asyncio.create_task(semaphore.acquire()) for _ in range(3)]
+        await asyncio.sleep(0)
+        assert semaphore.waiting == 3
+        semaphore.set_limit(100)
+        await asyncio.sleep(0)
+        # Growth is capped at the initial limit
+        assert semaphore.limit == 4
+        assert sum(task.done() for task in more) == 2
+        assert semaphore.waiting == 1
+        semaphore.set_limit(0)
+        assert semaphore.limit == 1
+        for task in more:
+            task.cancel()
+        await asyncio.gather(*more, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+def test_adaptive_semaphore_cancelled_waiter_gives_up_its_place():
+    async def scenario():
+        semaphore = AdaptiveSemaphore(1)
+        await semaphore.acquire()
+        cancelled = asyncio.create_task(semaphore.acquire())
+        queued = asyncio.create_task(semaphore.acquire())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        assert semaphore.waiting == 1
+        semaphore.release()
+        await asyncio.wait_for(queued, 0.5)
+        return semaphore.in_flight
+
+    assert asyncio.run(scenario()) == 1
@@ -0,0 +1,101 @@
+import pytest
+
+from app.core.validation import MAX_ERRORS, InputValidationError, InputValidator, SchemaError
+
+FINANCIAL_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "income": {"type": "number", "minimum": 0},
+        "expenses": {
+            "type": "object",
+            "additionalProperties": {"type": "number", "minimum": 0},
+            "maxProperties": 3,
+        },
+        "financial_goals": {"type": "array", "items": {"type": "string", "maxLength": 10}, "maxItems": 2},
+        "risk_tolerance": {"type": "string", "enum": ["low", "moderate", "high"]},
+        "note": {"type": ["string", "null"], "minLength": 1, "pattern": "^[a-z ]+$"},
+        "years": {"type": "integer", "maximum": 50},
+    },
+    "required": ["income", "expenses", "financial_goals", "risk_tolerance"],
+    "additionalProperties": False,
+}
+
+VALID = {
+    "income": 50000,
+    "expenses": {"housing": 1200, "food": 300.5},
+    "financial_goals": ["retire", "house"],
+    "risk_tolerance": "low",
+}
+
+@pytest.fixture
+def validator():
+    return InputValidator("financial-advisor", FINANCIAL_SCHEMA)
+
+def error_types(errors):
+    return {(tuple(error["loc"][2:]), error["type"]) for error in errors}
+
+def test_valid_inputs_have_no_errors(validator):
+    assert validator.errors(VALID) == []
+    assert validator.errors({**VALID, "note": None, "years": 30.0}) == []
+
+def test_missing_and_unknown_fields(validator):
+    inputs = {key: value for key, value in VALID.items() if key != "income"}
+    inputs["extra"] = 1
+    assert error_types(validator.errors(inputs)) == {(("income",), "missing"), (("extra",), "extra_forbidden")}
+
+def test_type_errors_stop_further_checks_on_the_value(validator):
+    errors = validator.errors({**VALID, "expenses": "1200", "financial_goals": "retire", "income": True})
+    assert error_types(errors) == {
+        (("expenses",), "type"),
+        (("financial_goals",), "type"),
+        (("income",), "type"),
+    }
+    assert errors[0]["loc"][:2] == ["body", "inputs"]
+
+def test_nested_constraints_report_full_paths(validator):
+    inputs = {
+        **VALID,
+        "income": -1,
+        "expenses": {"housing": -5, "food": "lots"},
+        "financial_goals": ["retire", "a very long goal"],
+        "risk_tolerance": "reckless",
+        "note": "Not Lowercase",
+        "years": 2.5,
+    }
+    assert error_types(validator.errors(inputs)) == {
+        (("income",), "minimum"),
+        (("expenses", "housing"), "minimum"),
+        (("expenses", "food"), "type"),
+        (("financial_goals", 1), "max_length"),
+        (("risk_tolerance",), "enum"),
+        (("note",), "pattern"),
+        (("years",), "type"),
+    }
+
+def test_collection_size_limits(validator):
+    inputs = {**VALID, "expenses": {str(i): 1 for i in range(4)}, "financial_goals": ["a", "b", "c"]}
+    assert error_types(validator.errors(inputs)) == {(("expenses",), "max_properties"), (("financial_goals",), "max_items")}
+
+def test_errors_are_capped():
+    validator = InputValidator("bulk", {"type": "array", "items": {"type": "number"}})
+    assert len(validator.errors(["x"] * (MAX_ERRORS * 3))) == MAX_ERRORS
+
+def test_validate_raises_with_errors(validator):
+    with pytest.raises(InputValidationError) as info:
+        validator.validate({**VALID, "risk_tolerance": "reckless"}, loc=("inputs",))
+    assert info.value.errors[0]["loc"] == ["inputs", "risk_tolerance"]
+
+def test_empty_schema_accepts_anything():
+    assert InputValidator("free", None).errors({"anything": [1, 2, 3]}) == []
+
+@pytest.mark.parametrize("schema", [{"type": "decimal"}, {"properties": {"a": "string"}}, {"items": []}])
+def test_unsupported_schemas_are_rejected(schema):
+    with pytest.raises(SchemaError):
+        InputValidator("broken", schema)
+
+def test_registered_agent_schemas_compile():
+    from app.agents.registry import AGENT_SPECS, AgentRegistry
+
+    registry = AgentRegistry(AGENT_SPECS)
+    for agent_id in AGENT_SPECS:
+        assert isinstance(registry.validator(agent_id), InputValidator)
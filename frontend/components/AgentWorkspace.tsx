@@ -2,7 +2,7 @@
 
 import { useState } from "react";
 import { useAppStore } from "@/lib/store";
-import { runAgent } from "@/lib/api";
+import { streamAgent } from "@/lib/api";
 import { Loader2, Play, Sparkles, Settings } from "lucide-react";
 import { motion } from "framer-motion";
 import ReactMarkdown from "react-markdown";
@@ -45,9 +45,12 @@ export function AgentWorkspace({ onOpenSettings }: AgentWorkspaceProps) {
     setOutput("");
     setUsage(null);
     try {
-      const res = await runAgent(selectedAgent.id, inputs, llmSettings);
-      console.log("RunAgent Response:", res);
-      setOutput(res.output);
+      const res = await streamAgent(
+        selectedAgent.id,
+        inputs,
+        llmSettings,
+        (token) => setOutput((prev) => prev + token)
+      );
       if (res.usage) {
         setUsage(res.usage);
       }
@@ -109,6 +112,30 @@ export function AgentWorkspace({ onOpenSettings }: AgentWorkspaceProps) {
       );
     }
 
+    if (schema.type === "array") {
+      return (
+        <div key={key} className="space-y-2">
+          <label className="text-sm font-medium leading-none peer-disabled:cursor-not-allowed peer-disabled:opacity-70">
+            {label}
+          </label>
+          <Textarea
+            className="min-h-[120px]"
+            onChange={(e) =>
+              // One item per line; the API expects a JSON array
+              handleInputChange(
+                key,
+                e.target.value
+                  .split("\n")
+                  .map((item) => item.trim())
+                  .filter(Boolean)
+              )
+            }
+            placeholder={`Enter ${label.toLowerCase()}, one per line...`}
+          />
+        </div>
+      );
+    }
+
     // Default to text (Input or Textarea based on heuristic)
     return (
       <div key={key} className="space-y-2">
@@ -15,6 +15,21 @@ export interface LLMSettings {
   api_key?: string;
 }
 
+// FastAPI puts a string in `detail`, or for validation errors a list of {loc, msg, type}
+function errorMessage(detail: any, fallback: string): string {
+  if (Array.isArray(detail)) {
+    return detail
+      .map((err) => {
+        const field = (err.loc || [])
+          .filter((part: any) => part !== "body" && part !== "inputs")
+          .join(".");
+        return field ? `${field}: ${err.msg}` : err.msg;
+      })
+      .join("; ");
+  }
+  return typeof detail === "string" && detail ? detail : fallback;
+}
+
 export async function fetchAgents(): Promise<Agent[]> {
   const res = await fetch(`${API_BASE_URL}/agents`);
   if (!res.ok) throw new Error("Failed to fetch agents");
@@ -37,12 +52,75 @@ export async function runAgent(
 
   if (!res.ok) {
     const errorData = await res.json();
-    throw new Error(errorData.detail || "Failed to run agent");
+    throw new Error(errorMessage(errorData.detail, "Failed to run agent"));
   }
 
   return res.json();
 }
 
+export interface StreamDoneEvent {
+  usage: any;
+  status: string;
+  cache?: string;
+  content_type: string;
+}
+
+export async function streamAgent(
+  agentId: string,
+  inputs: any,
+  llmSettings: LLMSettings,
+  onToken: (token: string) => void
+): Promise<StreamDoneEvent> {
+  const res = await fetch(`${API_BASE_URL}/agents/${agentId}/stream`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({
+      inputs,
+      llm_settings: llmSettings,
+    }),
+  });
+
+  if (!res.ok || !res.body) {
+    const errorData = await res.json().catch(() => ({}));
+    throw new Error(errorMessage(errorData.detail, "Failed to stream agent"));
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let done: StreamDoneEvent | null = null;
+
+  while (true) {
+    const { value, done: finished } = await reader.read();
+    if (finished) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // SSE frames are separated by a blank line
+    let boundary = buffer.indexOf("\n\n");
+    while (boundary !== -1) {
+      const frame = buffer.slice(0, boundary);
+      buffer = buffer.slice(boundary + 2);
+      boundary = buffer.indexOf("\n\n");
+
+      let event = "message";
+      let data = "";
+      for (const line of frame.split("\n")) {
+        if (line.startsWith("event: ")) event = line.slice(7);
+        else if (line.startsWith("data: ")) data += line.slice(6);
+      }
+      if (!data) continue;
+      const payload = JSON.parse(data);
+
+      if (event === "token") onToken(payload.content);
+      else if (event === "done") done = payload;
+      else if (event === "error") throw new Error(errorMessage(payload.detail, "Agent stream failed"));
+    }
+  }
+
+  if (!done) throw new Error("Agent stream ended unexpectedly");
+  return done;
+}
+
 export async function fetchModels(): Promise<Record<string, string[]>> {
   const res = await fetch(`${API_BASE_URL}/config/models`);
   if (!res.ok) throw new Error("Failed to fetch models");
@@ -1,49 +1,16 @@
 import os
-import re
+import sys
 
-def extract_info(file_path):
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-            
-        # Extract Title
-        title_match = re.search(r'^##\s+(?:.*?)?\*\*Agent #(\d+):\s+(.*?)\*\*', content, re.MULTILINE)
-        if title_match:
-            agent_num = int(title_match.group(1))
-            agent_name = title_match.group(2).strip()
-            title = f"Agent #{agent_num}: {agent_name}"
-        else:
-            # Fallback for inconsistent formatting
-            lines = content.split('\n')
-            for line in lines:
-                if line.strip().startswith('##'):
-                    cleaned_line = line.replace('#', '').strip()
-                    # Remove markdown bold/italic if present roughly
-                    cleaned_line = cleaned_line.replace('*', '').strip()
-                    title = cleaned_line
-                    break
-            else:
-                title = os.path.basename(file_path)
+# The catalog indexer lives in the backend; its persisted index is shared with the API
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
 
-        return title
-    except Exception as e:
-        print(f"Error reading {file_path}: {e}")
-        return os.path.basename(file_path)
+from app.core.catalog import AgentCatalog
 
 def generate_readme():
-    base_dir = "."
-    agents = []
-    
-    # Iterate from 1 to 100 to maintain order
-    for i in range(1, 101):
-        filename = f"agents/{i}.md"
-        file_path = os.path.join(base_dir, filename)
-        
-        if os.path.exists(file_path):
-            title = extract_info(file_path)
-            agents.append((i, title, filename))
-        else:
-            print(f"Warning: {filename} not found.")
+    catalog = AgentCatalog()
+    # Only docs whose mtime/hash changed since the last run are parsed again
+    catalog.refresh()
+    agents = [(doc["number"], doc["title"], doc["doc"]) for doc in catalog.documents()]
 
     readme_content = """# 100 AI Agents Challenge 🤖
 
@@ -55,7 +22,7 @@ Welcome to the **100 AI Agents Challenge** repository! This project contains 100
 |---|------------|------|
 """
     
-    for _, title, filename in agents:
+    for number, title, filename in agents:
         # Title usually comes as "Agent #X: Name", we can split it or just put it in the Name column
         # Let's clean it up slightly for the table
         # If title is "Agent #1: Individualized Financial Advisory Agent"
@@ -67,8 +34,7 @@ Welcome to the **100 AI Agents Challenge** repository! This project contains 100
             if "Agent #" in parts[0]:
                 display_name = parts[1].strip()
         
-        # Helper to extract number from filename for the first column
-        num = filename.replace('.md', '')
+        num = number if number is not None else filename.replace('.md', '')
         
         readme_content += f"| {num} | {display_name} | [Documentation](./agents/{filename}) |\n"
 